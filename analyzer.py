@@ -1,14 +1,85 @@
 from google import genai
 from google.genai import types
+from google.genai import errors
 import config
 import os
+import time
+import asyncio
 import logging
+import json
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import ResultCache
+from document_registry import DocumentRegistry
+from context_cache import ContextCache
+from rate_limiter import RateLimiter
+from token_budget import TokenBudget, estimate_cost
+from text_extraction import TextExtractor
+from page_filter import PageFilter
+from retrieval_index import RetrievalIndex
+from prompt_sections import split_prompt_sections
+from generation_metrics import GenerationMetrics
+from hedging import HedgedCaller
+
+# Default Gemini model used for analysis
+DEFAULT_MODEL = "gemini-2.5-pro-preview-05-06"
+
+# Follow-up turn asking the model to resume a response cut off by the output token limit
+CONTINUATION_PROMPT = (
+    "Your previous response was cut off by the output length limit. Continue exactly where it stopped, "
+    "mid-sentence if necessary. Do not repeat any earlier text, do not restart the section and do not add a preamble."
+)
+
+# Longest repeated tail of a truncated response that is removed when stitching a continuation
+STITCH_OVERLAP_CHARS = 500
+
+# Extra time given to the HTTP timeout so the per-call deadline, not the transport, decides a slow call
+HTTP_TIMEOUT_GRACE_SECONDS = 10
+
+# Screening settings used when no triage tier is configured
+DEFAULT_TRIAGE_TIER = {'name': 'triage', 'model': "gemini-2.5-flash", 'thinking_budget': 0, 'temperature': 0}
 
 class EarningsAnalyzer:
-    def __init__(self):
+    def __init__(self, result_cache=None, ingestion_mode=None):
         # Initialize Gemini API client
         self.client = genai.Client(api_key=config.GEMINI_API_KEY)
-        
+
+        # Send original documents ('file'), locally extracted text ('text') or
+        # only the passages retrieved for each report section ('retrieval')
+        self.ingestion_mode = ingestion_mode or config.DOCUMENT_INGESTION_MODE
+        if self.ingestion_mode not in ('file', 'text', 'retrieval'):
+            raise ValueError(f"Unknown document ingestion mode: {self.ingestion_mode}")
+        self.text_extractor = TextExtractor()
+
+        # Relevance pre-pass that keeps only the most useful pages of earnings releases
+        self.page_filter = PageFilter(self.text_extractor)
+
+        # Local BM25 index over all downloaded filings
+        self.retrieval_index = RetrievalIndex(text_extractor=self.text_extractor)
+
+        # Persistent cache of previous analysis results
+        self.result_cache = result_cache or ResultCache()
+
+        # Remote handles for documents uploaded through the Files API
+        self.document_registry = DocumentRegistry(self.client)
+
+        # Request/token quota, retries and circuit breaker shared across processes
+        self.rate_limiter = RateLimiter()
+
+        # Cached-content objects for document sets shared across prompts
+        self.context_cache = ContextCache(self.client, rate_limiter=self.rate_limiter)
+
+        # Pre-flight token counting against the input budget
+        self.token_budget = TokenBudget(self.client, rate_limiter=self.rate_limiter)
+
+        # Truncation, continuation, latency and hedging counters
+        self.metrics = GenerationMetrics()
+
+        # Per-call deadlines and hedged duplicate requests for slow calls
+        self.hedger = HedgedCaller(self.metrics)
+
         # Temporary debug logging to check API key (masked for security)
         api_key = config.GEMINI_API_KEY
         if api_key:
@@ -16,11 +87,12 @@ class EarningsAnalyzer:
             logging.info(f"API key loaded: {masked_key}")
         else:
             logging.error("No API key found in configuration")
-    
-    def analyze_earnings_documents(self, documents, company_name, quarter, year, is_comparative=False, companies=None):
+
+    def analyze_earnings_documents(self, documents, company_name, quarter, year, is_comparative=False, companies=None,
+                                   use_cache=True, refresh_cache=False, prompt=None, tier=None, ingestion_mode=None):
         """
         Analyze earnings documents (release and/or transcript) in a single Gemini API call.
-        
+
         Args:
             documents (dict): Dictionary of document paths by type
                              {'earnings_release': {'path': path1, 'url': url1},
@@ -32,260 +104,1676 @@ class EarningsAnalyzer:
             year (str): Year
             is_comparative (bool): Whether this is a comparative analysis of multiple companies
             companies (list): For comparative analysis, list of company data dictionaries
-        
+            use_cache (bool): Read and write the result cache (False bypasses it entirely)
+            refresh_cache (bool): Skip the cache lookup but store the fresh result
+            prompt (str): Prompt to send instead of the configured analysis prompt
+            tier (dict): Latency tier from ConfigManager.get_latency_tier with 'model',
+                         'thinking_budget', 'max_output_tokens' and 'temperature'
+                         (default: DEFAULT_MODEL with the model's own generation defaults)
+            ingestion_mode (str): Override the analyzer's ingestion mode for this request
+
         Returns:
             dict: Analysis results formatted for email
         """
         try:
-            # Check if we have any documents
-            if not documents:
-                raise ValueError(f"No documents provided for {company_name}")
-            
-            # Initialize Gemini model
-            model = "gemini-2.5-pro-preview-05-06"
-            
-            # Read each document and add it to the input
-            parts = []
-            
-            # Add each document to the parts
-            if is_comparative:
-                # For comparative analysis, documents are in a different format
-                for doc_key, file_path in documents.items():
-                    # Extract ticker and document type from the key (e.g., "amzn_earnings_release")
-                    parts_key = doc_key.split('_', 1)
-                    if len(parts_key) != 2:
-                        logging.warning(f"Invalid document key: {doc_key}. Skipping.")
-                        continue
-                    
-                    ticker, doc_type = parts_key
-                    
-                    # Check if file exists
-                    if not os.path.exists(file_path):
-                        logging.warning(f"File not found: {file_path}. Skipping.")
-                        continue
-                    
-                    # Determine file MIME type
-                    mime_type = self._get_mime_type(file_path)
-                    
-                    # Find the company name for this ticker
-                    company_name_for_doc = ticker.upper()
-                    if companies:
-                        for company_data in companies:
-                            if company_data['ticker'].lower() == ticker.lower():
-                                company_name_for_doc = f"{company_data['name']} ({ticker.upper()})"
-                                break
-                    
-                    # Label what type of document this is
-                    doc_label = "earnings release" if "earnings_release" in doc_type else "earnings call transcript"
-                    parts.append(types.Part(text=f"\nDOCUMENT TYPE: {company_name_for_doc} {doc_label.upper()}\n"))
-                    
-                    # Read the file as binary
-                    try:
-                        with open(file_path, 'rb') as f:
-                            file_data = f.read()
-                            
-                        parts.append(
-                            types.Part(
-                                inline_data=types.Blob(
-                                    mime_type=mime_type,
-                                    data=file_data
-                                )
-                            )
-                        )
-                        logging.info(f"Successfully loaded {company_name_for_doc} {doc_label}: {os.path.basename(file_path)}")
-                    except Exception as e:
-                        logging.error(f"Error reading {file_path}: {str(e)}")
+            request = self._prepare_request(
+                documents, company_name, quarter, year, is_comparative, companies, use_cache, refresh_cache, prompt, tier,
+                ingestion_mode
+            )
+            if request['cached_result']:
+                return request['cached_result']
+
+            # Generate content with a single API call
+            logging.info(f"Sending analysis request to Gemini model: {request['model']}")
+            response = self._generate(
+                request['model'], request['resolved_documents'], request['prompt'], request['cached_content'],
+                estimated_tokens=request['estimated_tokens'], generation=request['generation']
+            )
+            analysis_text, usage, completion = self._continue_truncated(request, response)
+
+            logging.info(f"Successfully generated analysis for {company_name}")
+            return self._finish_result(request, analysis_text, usage, completion)
+
+        except Exception as e:
+            logging.error(f"Error creating analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+    def analyze_earnings_documents_stream(self, documents, company_name, quarter, year, is_comparative=False,
+                                          companies=None, use_cache=True, refresh_cache=False, on_stage=None, tier=None):
+        """
+        Streaming variant of analyze_earnings_documents.
+
+        Yields the analysis text in chunks as Gemini produces them. The
+        concatenated chunks equal the 'analysis' field of the final result,
+        which is returned as the generator's return value (StopIteration.value).
+        A cached result is yielded as a single chunk.
+
+        Args:
+            Same as analyze_earnings_documents, plus:
+            on_stage (callable): Optional callback invoked with 'uploading' before
+                                 documents are uploaded/cached and 'generating'
+                                 before the model request is sent
+
+        Yields:
+            str: Analysis text chunks
+
+        Returns:
+            dict: Analysis results formatted for email
+        """
+        on_stage = on_stage or (lambda stage: None)
+        try:
+            on_stage('uploading')
+            request = self._prepare_request(
+                documents, company_name, quarter, year, is_comparative, companies, use_cache, refresh_cache, tier=tier
+            )
+            if request['cached_result']:
+                yield request['cached_result']['analysis']
+                return request['cached_result']
+
+            on_stage('generating')
+            logging.info(f"Streaming analysis request to Gemini model: {request['model']}")
+            analysis_text = ''
+            usage = None
+            continuations = 0
+            estimate = request['estimated_tokens']
+            while True:
+                stream = self._generate(
+                    request['model'], request['resolved_documents'], request['prompt'], request['cached_content'],
+                    stream=True, estimated_tokens=estimate, generation=request['generation'],
+                    partial_text=analysis_text if continuations else None
+                )
+
+                usage_metadata_chunk = None
+                last_chunk = None
+                # Hold back the start of a continuation until any repeated overlap can be dropped
+                held_text = '' if continuations else None
+                for chunk in stream:
+                    last_chunk = chunk
+                    if chunk.usage_metadata:
+                        usage_metadata_chunk = chunk
+                    text = chunk.text
+                    if text and held_text is not None:
+                        held_text += text
+                        if len(held_text) < STITCH_OVERLAP_CHARS:
+                            continue
+                        text = self._stitch(analysis_text, held_text)[len(analysis_text):]
+                        held_text = None
+                    if text:
+                        analysis_text += text
+                        yield text
+                if held_text:
+                    text = self._stitch(analysis_text, held_text)[len(analysis_text):]
+                    analysis_text += text
+                    yield text
+
+                usage = self._add_usage(usage, self._usage_from_response(usage_metadata_chunk))
+                truncated = self._is_truncated(last_chunk)
+                if continuations == 0:
+                    initially_truncated = truncated
+                if not truncated or continuations >= config.MAX_CONTINUATIONS:
+                    break
+                continuations += 1
+                request['estimated_tokens'] += estimate
+                logging.warning(f"Streamed response truncated, continuing ({continuations}/{config.MAX_CONTINUATIONS})")
+
+            completion = self._record_completion(initially_truncated, continuations, truncated, usage)
+            logging.info(f"Successfully generated analysis for {company_name}")
+            return self._finish_result(request, analysis_text, usage, completion)
+
+        except Exception as e:
+            logging.error(f"Error creating analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+    async def analyze_earnings_documents_async(self, documents, company_name, quarter, year, is_comparative=False,
+                                               companies=None, use_cache=True, refresh_cache=False, prompt=None,
+                                               tier=None):
+        """
+        Async counterpart of analyze_earnings_documents built on the SDK's async client.
+
+        Args:
+            Same as analyze_earnings_documents
+
+        Returns:
+            dict: Analysis results formatted for email
+        """
+        try:
+            # Hashing, uploads and cache lookups are blocking I/O, so keep them off the event loop
+            request = await asyncio.to_thread(
+                self._prepare_request,
+                documents, company_name, quarter, year, is_comparative, companies, use_cache, refresh_cache, prompt, tier
+            )
+            if request['cached_result']:
+                return request['cached_result']
+
+            logging.info(f"Sending async analysis request to Gemini model: {request['model']}")
+            response = await self._generate_async(
+                request['model'], request['resolved_documents'], request['prompt'], request['cached_content'],
+                estimated_tokens=request['estimated_tokens'], generation=request['generation']
+            )
+            # Continuations are rare, so they use the blocking client off the event loop
+            analysis_text, usage, completion = await asyncio.to_thread(self._continue_truncated, request, response)
+
+            logging.info(f"Successfully generated analysis for {company_name}")
+            # Settling the shared rate limiter state and writing the result cache also block
+            return await asyncio.to_thread(self._finish_result, request, analysis_text, usage, completion)
+
+        except Exception as e:
+            logging.error(f"Error creating analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+    async def analyze_many_async(self, specs, concurrency=None):
+        """
+        Run many analyses concurrently from a single event loop.
+
+        Args:
+            specs (list): List of dicts of analyze_earnings_documents keyword arguments
+                          (documents, company_name, quarter, year, and optionally
+                          is_comparative, companies, use_cache, refresh_cache, prompt, tier)
+            concurrency (int): Maximum number of analyses in flight
+                               (default: config.ANALYSIS_CONCURRENCY)
+
+        Returns:
+            list: Result dictionaries in completion order, each with 'spec_index'
+                  (position in specs) and 'latency_seconds' added
+        """
+        semaphore = asyncio.Semaphore(concurrency or config.ANALYSIS_CONCURRENCY)
+
+        async def run(index, spec):
+            async with semaphore:
+                start_time = time.perf_counter()
+                result = await self.analyze_earnings_documents_async(**spec)
+                return dict(result, spec_index=index, latency_seconds=time.perf_counter() - start_time)
+
+        tasks = [asyncio.create_task(run(index, spec)) for index, spec in enumerate(specs)]
+        results = []
+        for completed in asyncio.as_completed(tasks):
+            result = await completed
+            logging.info(f"Analysis {result['spec_index'] + 1}/{len(specs)} for {result['company']} "
+                         f"finished in {result['latency_seconds']:.1f}s")
+            results.append(result)
+        return results
+
+    def analyze_many(self, specs, concurrency=None):
+        """
+        Synchronous wrapper around analyze_many_async.
+
+        asyncio.run cannot be nested, so when called from code already running an
+        event loop (e.g. a notebook or an async web handler) the analyses run on
+        their own loop in a worker thread and this call blocks until they finish.
+        Async callers should await analyze_many_async instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.analyze_many_async(specs, concurrency))
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='analyze-many') as executor:
+            return executor.submit(asyncio.run, self.analyze_many_async(specs, concurrency)).result()
+
+    def analyze_earnings_documents_by_section(self, documents, company_name, quarter, year, use_cache=True,
+                                              refresh_cache=False, regenerate_sections=None, concurrency=None,
+                                              tier=None):
+        """
+        Generate each '## ' section of the report as its own concurrent call.
+
+        Every section is a separate request over the same documents, so the
+        shared context cache is created once and wall time is roughly that of
+        the longest section instead of the whole report. Sections are assembled
+        in template order. Each section goes through the result cache on its
+        own, so a failed or unsatisfactory section can be regenerated without
+        regenerating the others.
+
+        Args:
+            documents (dict): Dictionary of document paths by type, as for analyze_earnings_documents
+            company_name (str): Name of the company
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+            use_cache (bool): Read and write the result cache
+            refresh_cache (bool): Skip cache lookups for all sections but store fresh results
+            regenerate_sections (list): Section titles to regenerate, ignoring their cached results
+            concurrency (int): Maximum sections generated at once (default: all of them)
+            tier (dict): Latency tier used for every section
+
+        Returns:
+            dict: Analysis results formatted for email, with a 'sections' list
+                  giving each section's title, cache status and latency
+        """
+        try:
+            sections = split_prompt_sections(self._build_prompt(company_name, quarter, year))
+            if len(sections['sections']) < 2:
+                logging.info("Prompt has fewer than two sections, generating the report in one call")
+                return self.analyze_earnings_documents(documents, company_name, quarter, year,
+                                                       use_cache=use_cache, refresh_cache=refresh_cache, tier=tier)
+
+            titles = [section['title'] for section in sections['sections']]
+            regenerate = {title.lower() for title in regenerate_sections or []}
+            unknown = regenerate - {title.lower() for title in titles}
+            if unknown:
+                raise ValueError(f"Unknown report sections: {', '.join(sorted(unknown))}. Sections: {', '.join(titles)}")
+
+            specs = [
+                {
+                    'documents': documents,
+                    'company_name': company_name,
+                    'quarter': quarter,
+                    'year': year,
+                    'prompt': self._build_section_prompt(sections, index),
+                    'use_cache': use_cache,
+                    'refresh_cache': refresh_cache or title.lower() in regenerate,
+                    'tier': tier
+                }
+                for index, title in enumerate(titles)
+            ]
+            results = self._generate_sections(specs, titles, concurrency or len(specs))
+        except Exception as e:
+            logging.error(f"Error creating sectioned analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+        analysis_parts = []
+        for title, result in zip(titles, results):
+            text = result['analysis'].strip()
+            # Keep the layout of a single-call report even if the model dropped the heading
+            if not text.startswith('## '):
+                text = f"## {title}\n\n{text}"
+            analysis_parts.append(text)
+
+        usage = {
+            key: sum(result['usage'][key] for result in results if result.get('usage'))
+            for key in ('input_tokens', 'cached_input_tokens', 'uncached_input_tokens', 'output_tokens')
+        }
+        logging.info(f"Assembled {len(titles)} sections for {company_name} "
+                     f"(slowest {max(result['latency_seconds'] for result in results):.1f}s)")
+        # Document fields are the same for every section; take them from the first
+        base = {key: value for key, value in results[0].items() if key not in ('spec_index', 'latency_seconds')}
+        return dict(
+            base,
+            analysis="\n\n".join(analysis_parts),
+            usage=usage,
+            token_count=None,
+            continuations=sum(result.get('continuations', 0) for result in results),
+            truncated=any(result.get('truncated') for result in results),
+            cached=all(result.get('cached') for result in results),
+            sections=[
+                {'title': title, 'cached': bool(result.get('cached')), 'latency_seconds': result['latency_seconds']}
+                for title, result in zip(titles, results)
+            ]
+        )
+
+    def _generate_sections(self, specs, titles, concurrency):
+        """
+        Run the per-section analyses, retrying failed or empty sections on their own.
+
+        Returns:
+            list: One result per spec, in spec order
+
+        Raises:
+            RuntimeError: If any section still fails after config.SECTION_RETRY_ATTEMPTS retries
+        """
+        results = [None] * len(specs)
+        pending = list(range(len(specs)))
+        for attempt in range(config.SECTION_RETRY_ATTEMPTS + 1):
+            if attempt:
+                logging.warning(f"Retrying sections: {', '.join(titles[index] for index in pending)}")
+            for result in self.analyze_many([specs[index] for index in pending], concurrency):
+                results[pending[result['spec_index']]] = result
+            pending = [index for index in pending if results[index].get('error') or not results[index].get('analysis')]
+            if not pending:
+                return results
+
+        raise RuntimeError("Sections failed: " + ", ".join(
+            f"{titles[index]} ({results[index].get('error', 'empty section')})" for index in pending
+        ))
+
+    def analyze_earnings_documents_triaged(self, documents, company_name, quarter, year, use_cache=True,
+                                           refresh_cache=False, tier=None, triage_tier=None, threshold=None,
+                                           section_parallel=False):
+        """
+        Screen documents with a cheap model and run the full analysis only if they are material.
+
+        The triage call reads the extracted text of the documents with the
+        triage tier and scores their materiality for GCP from 0 to 10. At or
+        above the threshold the full analysis runs as usual; below it a short
+        "no material GCP impact" report is returned instead. If triage fails
+        the full analysis runs, so screening never hides a release.
+
+        Args:
+            documents (dict): Dictionary of document paths by type, as for analyze_earnings_documents
+            company_name (str): Name of the company
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+            use_cache (bool): Read and write the result cache
+            refresh_cache (bool): Skip cache lookups but store fresh results
+            tier (dict): Latency tier of the full analysis
+            triage_tier (dict): Latency tier of the screening call (default: DEFAULT_TRIAGE_TIER)
+            threshold (float): Minimum score for a full analysis (default: config.TRIAGE_THRESHOLD)
+            section_parallel (bool): Run the full analysis with analyze_earnings_documents_by_section
+
+        Returns:
+            dict: Analysis results formatted for email, with a 'triage' entry
+                  holding the score, topics and whether the release was material
+        """
+        triage = self.triage_documents(documents, company_name, quarter, year, use_cache, refresh_cache,
+                                       triage_tier, threshold)
+
+        if triage and not triage['material']:
+            logging.info(f"Triage scored {company_name} {triage['score']}/10 (threshold {triage['threshold']}), "
+                         f"skipping the full analysis")
+            return dict(
+                triage['result'],
+                analysis=self._build_no_impact_report(company_name, quarter, year, triage),
+                triage={key: value for key, value in triage.items() if key != 'result'}
+            )
+
+        if section_parallel:
+            result = self.analyze_earnings_documents_by_section(documents, company_name, quarter, year,
+                                                                use_cache=use_cache, refresh_cache=refresh_cache,
+                                                                tier=tier)
+        else:
+            result = self.analyze_earnings_documents(documents, company_name, quarter, year,
+                                                     use_cache=use_cache, refresh_cache=refresh_cache, tier=tier)
+        if triage:
+            result['triage'] = {key: value for key, value in triage.items() if key != 'result'}
+        return result
+
+    def triage_documents(self, documents, company_name, quarter, year, use_cache=True, refresh_cache=False,
+                         triage_tier=None, threshold=None):
+        """
+        Score how material a company's earnings documents are for GCP with a cheap model.
+
+        Returns:
+            dict: 'score' (0-10), 'topics', 'rationale', 'threshold', 'material',
+                  'model' and 'result' (the screening call's result dictionary),
+                  or None if the screening call failed or returned no usable score
+        """
+        triage_tier = triage_tier or DEFAULT_TRIAGE_TIER
+        threshold = config.TRIAGE_THRESHOLD if threshold is None else threshold
+
+        result = self.analyze_earnings_documents(
+            documents, company_name, quarter, year, use_cache=use_cache, refresh_cache=refresh_cache,
+            prompt=self._build_triage_prompt(company_name, quarter, year), tier=triage_tier, ingestion_mode='text'
+        )
+        if 'error' in result:
+            logging.warning(f"Triage of {company_name} failed, running the full analysis: {result['error']}")
+            return None
+
+        try:
+            text = result['analysis']
+            screening = json.loads(text[text.index('{'):text.rindex('}') + 1])
+            score = min(max(float(screening['materiality_score']), 0.0), 10.0)
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Could not parse the triage response for {company_name}, running the full analysis: {e}")
+            return None
+
+        return {
+            'score': score,
+            'topics': [str(topic) for topic in screening.get('topics') or []][:5],
+            'rationale': str(screening.get('rationale') or ''),
+            'threshold': threshold,
+            'material': score >= threshold,
+            'model': result.get('model'),
+            'result': result
+        }
+
+    def analyze_comparative_map_reduce(self, companies, company_name, quarter, year, use_cache=True,
+                                       refresh_cache=False, concurrency=None, tier=None):
+        """
+        Comparative analysis built from per-company summaries.
+
+        The map step summarizes each company's documents concurrently. Summaries
+        go through the result cache like any analysis, so a company whose
+        documents have not changed costs nothing and adding a ticker costs one
+        summary call. The reduce step then compares the compact summaries in a
+        single small call.
+
+        Args:
+            companies (list): Company data dictionaries with 'ticker', 'name',
+                              'files' (documents as downloaded), 'quarter' and 'year'
+            company_name (str): Joined string of company names for the report
+            quarter (str): Reference quarter
+            year (str): Reference year
+            use_cache (bool): Read and write the result cache
+            refresh_cache (bool): Skip cache lookups but store fresh results
+            concurrency (int): Maximum summaries generated at once
+            tier (dict): Latency tier used for the summaries and the comparison
+
+        Returns:
+            dict: Analysis results formatted for email, with a 'map_reduce' entry
+                  listing summarized and failed companies
+        """
+        documents = {
+            f"{company['ticker']}_{doc_type}": doc_info
+            for company in companies for doc_type, doc_info in company['files'].items()
+        }
+        try:
+            summaries = self._summarize_companies(companies, use_cache, refresh_cache, concurrency, tier)
+            return self._reduce_summaries(summaries, documents, company_name, quarter, year, use_cache, refresh_cache,
+                                          tier)
+        except Exception as e:
+            logging.error(f"Error creating comparative analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+    def _summarize_companies(self, companies, use_cache=True, refresh_cache=False, concurrency=None, tier=None):
+        """
+        Map step of a map-reduce comparison: one structured summary per company.
+
+        Returns:
+            dict: 'summaries' (list of (company, summary result) tuples in input
+                  order) and 'failed' (list of '<ticker> (<reason>)' strings)
+        """
+        specs = [
+            {
+                'documents': company['files'],
+                'company_name': company['name'],
+                'quarter': company['quarter'],
+                'year': company['year'],
+                'prompt': self._build_summary_prompt(company['name'], company['quarter'], company['year']),
+                'use_cache': use_cache,
+                'refresh_cache': refresh_cache,
+                'tier': tier
+            }
+            for company in companies
+        ]
+        results = sorted(self.analyze_many(specs, concurrency), key=lambda result: result['spec_index'])
+
+        summaries = []
+        failed = []
+        for result in results:
+            company = companies[result['spec_index']]
+            if result.get('error') or not result.get('analysis'):
+                failed.append(f"{company['ticker']} ({result.get('error', 'empty summary')})")
             else:
-                # Standard single-company analysis
+                summaries.append((company, result))
+
+        if not summaries:
+            raise RuntimeError(f"No company summaries could be generated: {', '.join(failed)}")
+
+        cached = sum(1 for _, result in summaries if result.get('cached'))
+        logging.info(f"Summarized {len(summaries)} companies ({cached} from cache, {len(failed)} failed)")
+        return {'summaries': summaries, 'failed': failed}
+
+    def _reduce_summaries(self, summaries, documents, company_name, quarter, year, use_cache=True, refresh_cache=False,
+                          tier=None):
+        """Reduce step of a map-reduce comparison: compare the company summaries in one call."""
+        summaries_path = self._store_text_artifact('summaries', self._format_summaries(summaries['summaries']))
+
+        prompt = self._build_prompt(company_name, quarter, year, is_comparative=True)
+        prompt += "\n\nThe document above contains structured summaries of each company's earnings documents. "
+        prompt += "Base the comparison on these summaries and cite sources as they are given there.\n"
+
+        result = self.analyze_earnings_documents(
+            {'company_summaries': {'path': summaries_path, 'url': "company summaries", 'label': "company summaries"}},
+            company_name, quarter, year, use_cache=use_cache, refresh_cache=refresh_cache, prompt=prompt, tier=tier
+        )
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+
+        return dict(
+            result,
+            document_types=list(documents.keys()),
+            document_urls={doc_key: "multiple documents" for doc_key in documents},
+            map_reduce={
+                'companies': [company['ticker'] for company, _ in summaries['summaries']],
+                'cached_summaries': [company['ticker'] for company, summary in summaries['summaries']
+                                     if summary.get('cached')],
+                'failed_companies': summaries['failed']
+            }
+        )
+
+    def analyze_comparative_hierarchical(self, companies, clusters, company_name, quarter, year, use_cache=True,
+                                         refresh_cache=False, concurrency=None, tier=None):
+        """
+        Comparative analysis for large peer groups, compared cluster by cluster.
+
+        Each company is summarized as in analyze_comparative_map_reduce. The
+        summaries are then compared within each peer cluster concurrently, and a
+        final call synthesizes the cluster reports. Every call sees at most one
+        cluster of summaries or one report per cluster, so input size stays
+        bounded as tickers are added. Cluster comparisons go through the result
+        cache, so only clusters whose summaries changed are regenerated.
+
+        Args:
+            companies (list): Company data dictionaries with 'ticker', 'name',
+                              'files' (documents as downloaded), 'quarter' and 'year'
+            clusters (list): Dicts with 'name' and 'tickers', as returned by
+                             ConfigManager.get_peer_clusters
+            company_name (str): Joined string of company names for the report
+            quarter (str): Reference quarter
+            year (str): Reference year
+            use_cache (bool): Read and write the result cache
+            refresh_cache (bool): Skip cache lookups but store fresh results
+            concurrency (int): Maximum summaries or cluster comparisons generated at once
+            tier (dict): Latency tier used for every step
+
+        Returns:
+            dict: Analysis results formatted for email, with a 'map_reduce' entry
+                  listing summarized and failed companies and the clusters used
+        """
+        documents = {
+            f"{company['ticker']}_{doc_type}": doc_info
+            for company in companies for doc_type, doc_info in company['files'].items()
+        }
+        try:
+            summaries = self._summarize_companies(companies, use_cache, refresh_cache, concurrency, tier)
+            by_ticker = {company['ticker'].lower(): (company, result) for company, result in summaries['summaries']}
+            groups = [
+                (cluster['name'], [by_ticker[ticker] for ticker in cluster['tickers'] if ticker in by_ticker])
+                for cluster in clusters
+            ]
+            groups = [(name, members) for name, members in groups if members]
+
+            if len(groups) <= 1:
+                # Everything fits in one cluster, so a plain map-reduce comparison is already bounded
+                return self._reduce_summaries(summaries, documents, company_name, quarter, year,
+                                              use_cache, refresh_cache, tier)
+
+            cluster_reports = self._compare_clusters(groups, quarter, year, use_cache, refresh_cache, concurrency, tier)
+            result = self._synthesize_clusters(cluster_reports, company_name, quarter, year, use_cache, refresh_cache,
+                                               tier)
+        except Exception as e:
+            logging.error(f"Error creating hierarchical comparative analysis: {str(e)}")
+            return self._error_result(documents, company_name, quarter, year, e)
+
+        return dict(
+            result,
+            document_types=list(documents.keys()),
+            document_urls={doc_key: "multiple documents" for doc_key in documents},
+            map_reduce={
+                'companies': [company['ticker'] for company, _ in summaries['summaries']],
+                'cached_summaries': [company['ticker'] for company, summary in summaries['summaries']
+                                     if summary.get('cached')],
+                'failed_companies': summaries['failed'],
+                'clusters': [
+                    {'name': report['name'], 'tickers': report['tickers'], 'cached': report['cached']}
+                    for report in cluster_reports
+                ]
+            }
+        )
+
+    def _compare_clusters(self, groups, quarter, year, use_cache=True, refresh_cache=False, concurrency=None,
+                          tier=None):
+        """
+        Compare the company summaries within each peer cluster concurrently.
+
+        Single-company clusters have nothing to compare and pass their summary through.
+
+        Returns:
+            list: Dicts with 'name', 'tickers', 'report' and 'cached', in cluster order
+        """
+        reports = []
+        specs = []
+        for name, members in groups:
+            reports.append({
+                'name': name,
+                'tickers': [company['ticker'] for company, _ in members],
+                'report': self._format_summaries(members) if len(members) == 1 else None,
+                'cached': len(members) == 1 and bool(members[0][1].get('cached'))
+            })
+            if len(members) > 1:
+                summaries_path = self._store_text_artifact('summaries', self._format_summaries(members))
+                specs.append({
+                    'documents': {'company_summaries': {'path': summaries_path, 'url': "company summaries",
+                                                        'label': f"{name} company summaries"}},
+                    'company_name': " vs. ".join(company['name'] for company, _ in members),
+                    'quarter': quarter,
+                    'year': year,
+                    'prompt': self._build_cluster_prompt(name, [company['name'] for company, _ in members],
+                                                         quarter, year),
+                    'use_cache': use_cache,
+                    'refresh_cache': refresh_cache,
+                    'tier': tier
+                })
+
+        pending = [report for report in reports if report['report'] is None]
+        for result in self.analyze_many(specs, concurrency):
+            report = pending[result['spec_index']]
+            if result.get('error') or not result.get('analysis'):
+                raise RuntimeError(f"Comparison of {report['name']} failed: {result.get('error', 'empty report')}")
+            report['report'] = result['analysis'].strip()
+            report['cached'] = bool(result.get('cached'))
+
+        logging.info(f"Compared {len(reports)} peer clusters ({len(specs)} comparisons, "
+                     f"{sum(1 for report in reports if report['cached'])} from cache)")
+        return reports
+
+    def _synthesize_clusters(self, cluster_reports, company_name, quarter, year, use_cache=True, refresh_cache=False,
+                             tier=None):
+        """Final step of a hierarchical comparison: one comparative report across all clusters."""
+        report_text = "\n\n".join(
+            f"## Peer group: {report['name']} ({', '.join(ticker.upper() for ticker in report['tickers'])})\n"
+            f"{report['report']}"
+            for report in cluster_reports
+        )
+        reports_path = self._store_text_artifact('cluster_reports', report_text)
+
+        prompt = self._build_prompt(company_name, quarter, year, is_comparative=True)
+        prompt += "\n\nThe document above contains one comparison per peer group (e.g. hyperscalers, chips, "
+        prompt += "enterprise software), each built from structured summaries of the companies' earnings documents. "
+        prompt += "Compare across the peer groups as well as within them, and cite sources as they are given there.\n"
+
+        result = self.analyze_earnings_documents(
+            {'cluster_reports': {'path': reports_path, 'url': "peer group comparisons",
+                                 'label': "peer group comparisons"}},
+            company_name, quarter, year, use_cache=use_cache, refresh_cache=refresh_cache, prompt=prompt, tier=tier
+        )
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result
+
+    def _format_summaries(self, summaries):
+        """Join (company, summary result) pairs into one document with a heading per company."""
+        return "\n\n".join(
+            f"### {company['name']} ({company['ticker'].upper()}) - {company['quarter']} {company['year']}\n"
+            f"{result['analysis'].strip()}"
+            for company, result in summaries
+        )
+
+    def _store_text_artifact(self, kind, text):
+        """Write generated text to the cache directory by content hash and return its path."""
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        path = os.path.join(config.CACHE_DIR, kind, f"{digest}.txt")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        else:
+            # Reused artifacts count as recently used for storage eviction
+            os.utime(path, None)
+        return path
+
+    def estimate_request(self, documents, company_name, quarter, year, is_comparative=False, companies=None,
+                         tier=None):
+        """
+        Count the input tokens of an analysis and estimate its cost without generating.
+
+        Args:
+            Same as analyze_earnings_documents
+
+        Returns:
+            dict: Token count as returned by TokenBudget.count plus 'model',
+                  'budget', 'over_budget', 'estimated_output_tokens' and
+                  'estimated_cost_usd'
+        """
+        model, generation = self._tier_settings(tier)
+        prompt = self._build_prompt(company_name, quarter, year, is_comparative)
+        resolved_documents, _ = self._select_inputs(documents, prompt, is_comparative, companies)
+        if not resolved_documents:
+            raise ValueError(f"No documents found on disk for {company_name}")
+
+        estimate = self.token_budget.count(model, resolved_documents, prompt, self._build_document_parts, exact=True)
+        output_tokens = self._estimated_output_tokens(generation)
+        estimate.update({
+            'model': model,
+            'tier': tier['name'] if tier else None,
+            'budget': self.token_budget.max_input_tokens,
+            'over_budget': estimate['total_tokens'] > self.token_budget.max_input_tokens,
+            'estimated_output_tokens': output_tokens,
+            'estimated_cost_usd': estimate_cost(estimate['total_tokens'], output_tokens)
+        })
+        return estimate
+
+    def _prepare_request(self, documents, company_name, quarter, year, is_comparative=False, companies=None,
+                         use_cache=True, refresh_cache=False, prompt=None, tier=None, ingestion_mode=None):
+        """
+        Resolve documents, render the prompt and consult the caches for an analysis.
+
+        Returns:
+            dict: Request state with 'model', 'generation', 'tier', 'resolved_documents',
+                  'selected_pages', 'prompt', 'token_count', 'estimated_tokens', 'cache_key', 'cached_content'
+                  and 'cached_result' (set on a result cache hit, in which case
+                  nothing needs to be generated)
+        """
+        # Check if we have any documents
+        if not documents:
+            raise ValueError(f"No documents provided for {company_name}")
+
+        # Model and generation settings of the latency tier
+        model, generation = self._tier_settings(tier)
+
+        # Resolve which documents exist on disk and build the prompt
+        prompt = prompt or self._build_prompt(company_name, quarter, year, is_comparative)
+        resolved_documents, selected_pages = self._select_inputs(
+            documents, prompt, is_comparative, companies, ingestion_mode
+        )
+
+        request = {
+            'documents': documents,
+            'company_name': company_name,
+            'quarter': quarter,
+            'year': year,
+            'is_comparative': is_comparative,
+            'model': model,
+            'generation': generation,
+            'tier': tier['name'] if tier else None,
+            'resolved_documents': resolved_documents,
+            'selected_pages': selected_pages,
+            'prompt': prompt,
+            'token_count': None,
+            'estimated_tokens': config.RATE_LIMIT_ESTIMATED_TOKENS_PER_REQUEST,
+            'cache_key': None,
+            'cached_content': None,
+            'cached_result': None
+        }
+
+        # Return a cached result if the same files, prompt and model were analyzed before
+        if use_cache:
+            request['cache_key'] = ResultCache.make_key(
+                [(doc_key, file_path) for doc_key, file_path, _ in resolved_documents],
+                prompt, model, is_comparative, generation
+            )
+            if not refresh_cache:
+                cached_result = self.result_cache.get(request['cache_key'])
+                if cached_result:
+                    logging.info(f"Using cached analysis for {company_name}")
+                    request['cached_result'] = dict(cached_result, cached=True)
+                    return request
+
+        # Count input tokens and drop low-priority documents (or fail) when over budget
+        resolved_documents, token_count = self.token_budget.fit(
+            model, resolved_documents, prompt, self._build_document_parts
+        )
+        request['resolved_documents'] = resolved_documents
+        if token_count:
+            request['token_count'] = token_count
+            request['estimated_tokens'] = token_count['total_tokens'] + self._estimated_output_tokens(generation)
+
+        # Reuse a cached copy of the documents so only the prompt is new input
+        request['cached_content'] = self.context_cache.get_or_create(
+            model, resolved_documents, self._build_document_parts
+        )
+        return request
+
+    def _tier_settings(self, tier):
+        """
+        Resolve a latency tier into a model id and the generation settings to send.
+
+        Args:
+            tier (dict): Latency tier, or None for DEFAULT_MODEL with the model's defaults
+
+        Returns:
+            tuple: (model id, dict of the 'thinking_budget', 'max_output_tokens' and
+                   'temperature' settings the tier sets)
+        """
+        if not tier:
+            return DEFAULT_MODEL, {}
+        generation = {
+            key: tier[key] for key in ('thinking_budget', 'max_output_tokens', 'temperature')
+            if tier.get(key) is not None
+        }
+        return tier.get('model') or DEFAULT_MODEL, generation
+
+    def _estimated_output_tokens(self, generation):
+        """Expected output tokens of a request, capped by the tier's output limit."""
+        return min(config.ESTIMATED_OUTPUT_TOKENS, generation.get('max_output_tokens') or config.ESTIMATED_OUTPUT_TOKENS)
+
+    def _continue_truncated(self, request, response):
+        """
+        Finish a response that was cut off by the output token limit.
+
+        Each continuation resends the prompt with the text so far as the
+        model's turn against the same cached documents, so only the missing
+        tail is generated. Continuations are stitched onto the text and their
+        usage is added to the request's.
+
+        Args:
+            request (dict): Request state from _prepare_request
+            response (types.GenerateContentResponse): First response
+
+        Returns:
+            tuple: (complete analysis text, summed usage dict, completion dict
+                   with 'continuations' and 'truncated')
+        """
+        analysis_text = response.text or ''
+        usage = self._usage_from_response(response)
+        initially_truncated = truncated = self._is_truncated(response)
+        continuations = 0
+        estimate = request['estimated_tokens']
+
+        while truncated and continuations < config.MAX_CONTINUATIONS:
+            continuations += 1
+            logging.warning(f"Response truncated at {len(analysis_text)} characters, "
+                            f"continuing ({continuations}/{config.MAX_CONTINUATIONS})")
+            request['estimated_tokens'] += estimate
+            response = self._generate(
+                request['model'], request['resolved_documents'], request['prompt'], request['cached_content'],
+                estimated_tokens=estimate, generation=request['generation'], partial_text=analysis_text
+            )
+            analysis_text = self._stitch(analysis_text, response.text or '')
+            usage = self._add_usage(usage, self._usage_from_response(response))
+            truncated = self._is_truncated(response)
+
+        return analysis_text, usage, self._record_completion(initially_truncated, continuations, truncated, usage)
+
+    def _record_completion(self, initially_truncated, continuations, truncated, usage):
+        """Count a finished generation in the metrics and return its completion summary."""
+        self.metrics.record_generation(
+            truncated=initially_truncated,
+            continuations=continuations,
+            continuation_output_tokens=usage.get('continuation_output_tokens', 0),
+            recovered=not truncated
+        )
+        if truncated:
+            logging.warning(f"Response still truncated after {continuations} continuations")
+        return {'continuations': continuations, 'truncated': truncated}
+
+    def _is_truncated(self, response):
+        """Whether a response (or the last chunk of a stream) stopped at the output token limit."""
+        candidates = getattr(response, 'candidates', None) or []
+        return bool(candidates) and candidates[0].finish_reason == types.FinishReason.MAX_TOKENS
+
+    def _stitch(self, text, continuation):
+        """Append a continuation to text, dropping any tail of text the model repeated."""
+        for overlap in range(min(len(text), len(continuation), STITCH_OVERLAP_CHARS), 19, -1):
+            if text.endswith(continuation[:overlap]):
+                return text + continuation[overlap:]
+        return text + continuation
+
+    def _add_usage(self, usage, more):
+        """Add the usage of a continuation call to the usage so far."""
+        if usage is None:
+            return more
+        combined = {key: usage[key] + more[key] for key in more}
+        combined['continuation_output_tokens'] = usage.get('continuation_output_tokens', 0) + more['output_tokens']
+        return combined
+
+    def _finish_result(self, request, analysis_text, usage, completion=None):
+        """Build the result dictionary for a completed generation and store it in the result cache."""
+        documents = request['documents']
+
+        logging.info(
+            f"Input tokens: {usage['cached_input_tokens']} cached, {usage['uncached_input_tokens']} uncached; "
+            f"output tokens: {usage['output_tokens']}"
+        )
+
+        # Settle the rate limiter's token estimate against what was actually used
+        actual_tokens = usage['input_tokens'] + usage['output_tokens']
+        if actual_tokens:
+            self.rate_limiter.record_usage(actual_tokens - request['estimated_tokens'])
+
+        # Construct the URLs dictionary for all document types
+        if request['is_comparative']:
+            document_urls = {doc_key: "multiple documents" for doc_key in documents.keys()}
+        else:
+            document_urls = {
+                doc_type: doc_info['url']
+                for doc_type, doc_info in documents.items()
+            }
+
+        result = {
+            'company': request['company_name'],
+            'period': f"{request['quarter']} {request['year']}",
+            'document_types': list(documents.keys()),
+            'document_urls': document_urls,
+            'analysis': analysis_text,
+            'model': request['model'],
+            'tier': request['tier'],
+            'usage': usage,
+            'token_count': request['token_count'],
+            'selected_pages': request['selected_pages'],
+            'continuations': completion['continuations'] if completion else 0,
+            'truncated': completion['truncated'] if completion else False
+        }
+
+        # A still-truncated report is not cached, so a rerun can try to complete it
+        if request['cache_key'] and analysis_text and not result['truncated']:
+            self.result_cache.put(request['cache_key'], result)
+
+        return dict(result, cached=False)
+
+    def _error_result(self, documents, company_name, quarter, year, error):
+        """Build the result dictionary for a failed analysis."""
+        return {
+            'company': company_name,
+            'period': f"{quarter} {year}",
+            'document_types': list(documents.keys()) if documents else [],
+            'error': str(error)
+        }
+
+    def _generate(self, model, resolved_documents, prompt, cached_content=None, stream=False, estimated_tokens=0,
+                  generation=None, partial_text=None):
+        """
+        Send the documents and prompt to Gemini.
+
+        Args:
+            model (str): Gemini model id
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+            prompt (str): Rendered prompt text
+            cached_content (str): Name of a cached-content object holding the documents, if any
+            stream (bool): Return an iterator of response chunks instead of a single response
+            estimated_tokens (int): Expected tokens for the request, charged to the rate limiter
+            generation (dict): Generation settings of the latency tier, from _tier_settings
+            partial_text (str): Text of a truncated response to continue from, if any
+
+        Returns:
+            types.GenerateContentResponse: The model response, or an iterator of chunks when streaming
+        """
+        if cached_content:
+            try:
+                request_kwargs = self._cached_request(model, prompt, cached_content, generation, partial_text)
+                hedge_request = self._hedge_request(request_kwargs, resolved_documents, prompt, generation, partial_text)
+                return self.rate_limiter.call(
+                    lambda: self._call_hedged(stream, request_kwargs, hedge_request, estimated_tokens), estimated_tokens
+                )
+            except errors.ClientError as e:
+                if not self._is_cache_error(cached_content, e):
+                    raise
+
+        try:
+            return self._generate_uncached(model, resolved_documents, prompt, stream, estimated_tokens, generation,
+                                           partial_text)
+        except errors.ClientError as e:
+            if not self._invalidate_stale_uploads(resolved_documents, e):
+                raise
+        # The documents were uploaded again; retry once
+        return self._generate_uncached(model, resolved_documents, prompt, stream, estimated_tokens, generation,
+                                       partial_text)
+
+    def _generate_uncached(self, model, resolved_documents, prompt, stream, estimated_tokens, generation,
+                           partial_text):
+        """Send the prompt together with all documents."""
+        request_kwargs = self._uncached_request(model, resolved_documents, prompt, generation, partial_text)
+        hedge_request = self._hedge_request(request_kwargs, resolved_documents, prompt, generation, partial_text)
+        return self.rate_limiter.call(
+            lambda: self._call_hedged(stream, request_kwargs, hedge_request, estimated_tokens), estimated_tokens
+        )
+
+    async def _generate_async(self, model, resolved_documents, prompt, cached_content=None, estimated_tokens=0,
+                              generation=None):
+        """Async counterpart of _generate using the SDK's async client (non-streaming)."""
+        if cached_content:
+            try:
+                request_kwargs = self._cached_request(model, prompt, cached_content, generation)
+                hedge_request = self._hedge_request(request_kwargs, resolved_documents, prompt, generation)
+                return await self.rate_limiter.call_async(
+                    lambda: self._call_hedged_async(request_kwargs, hedge_request, estimated_tokens), estimated_tokens
+                )
+            except errors.ClientError as e:
+                if not self._is_cache_error(cached_content, e):
+                    raise
+
+        try:
+            return await self._generate_uncached_async(model, resolved_documents, prompt, estimated_tokens, generation)
+        except errors.ClientError as e:
+            if not await asyncio.to_thread(self._invalidate_stale_uploads, resolved_documents, e):
+                raise
+        return await self._generate_uncached_async(model, resolved_documents, prompt, estimated_tokens, generation)
+
+    async def _generate_uncached_async(self, model, resolved_documents, prompt, estimated_tokens, generation):
+        """Async counterpart of _generate_uncached."""
+        # Uploading documents is blocking file and network I/O
+        request_kwargs = await asyncio.to_thread(self._uncached_request, model, resolved_documents, prompt, generation)
+        hedge_request = self._hedge_request(request_kwargs, resolved_documents, prompt, generation)
+        return await self.rate_limiter.call_async(
+            lambda: self._call_hedged_async(request_kwargs, hedge_request, estimated_tokens), estimated_tokens
+        )
+
+    def _call_hedged(self, stream, request_kwargs, hedge_request, estimated_tokens):
+        """
+        Call the model within the per-call deadline, hedging slow non-streaming calls.
+
+        Streams are not hedged, since their chunks are already being shown;
+        the deadline then covers the wait for the first chunk.
+        """
+        def hedge():
+            # The duplicate request draws on the shared quota like any other
+            self.rate_limiter.acquire(estimated_tokens)
+            return self._call_model(stream, **hedge_request())
+
+        return self.hedger.call(
+            lambda: self._call_model(stream, **request_kwargs), None if stream else hedge, model=request_kwargs['model']
+        )
+
+    async def _call_hedged_async(self, request_kwargs, hedge_request, estimated_tokens):
+        """Async counterpart of _call_hedged; the losing request is cancelled."""
+        async def hedge():
+            await self.rate_limiter.acquire_async(estimated_tokens)
+            hedge_kwargs = await asyncio.to_thread(hedge_request)
+            return await self.client.aio.models.generate_content(**hedge_kwargs)
+
+        return await self.hedger.call_async(
+            lambda: self.client.aio.models.generate_content(**request_kwargs), hedge, model=request_kwargs['model']
+        )
+
+    def _hedge_request(self, request_kwargs, resolved_documents, prompt, generation=None, partial_text=None):
+        """
+        Return a function building the request arguments of a hedged duplicate.
+
+        Without a fallback model the hedge repeats the request. Cached content
+        belongs to the model it was created for, so a hedge on a fallback model
+        sends the documents inline.
+        """
+        fallback = self.hedger.fallback_model
+        if not fallback or fallback == request_kwargs['model']:
+            return lambda: request_kwargs
+        request_config = request_kwargs.get('config')
+        if request_config is None or not request_config.cached_content:
+            return lambda: dict(request_kwargs, model=fallback)
+        return lambda: self._uncached_request(fallback, resolved_documents, prompt, generation, partial_text)
+
+    def _cached_request(self, model, prompt, cached_content, generation=None, partial_text=None):
+        """Request arguments for a prompt sent against cached document content."""
+        contents = types.Content(role='user', parts=[types.Part(text=prompt)])
+        return {
+            'model': model,
+            'contents': [contents] + self._continuation_turns(partial_text) if partial_text else contents,
+            'config': self._generation_config(generation, cached_content=cached_content)
+        }
+
+    def _uncached_request(self, model, resolved_documents, prompt, generation=None, partial_text=None):
+        """Request arguments for a prompt sent together with all documents."""
+        # Read each document and add it to the input
+        parts = self._build_document_parts(resolved_documents)
+
+        # Add the consolidated analysis prompt after all documents
+        parts.append(types.Part(text=prompt))
+
+        # Create content with all documents and prompt
+        request_kwargs = {
+            'model': model,
+            'contents': types.Content(parts=parts)
+        }
+        if partial_text:
+            request_kwargs['contents'] = [types.Content(role='user', parts=parts)] + self._continuation_turns(partial_text)
+        if generation or self.hedger.deadline_seconds:
+            request_kwargs['config'] = self._generation_config(generation)
+        return request_kwargs
+
+    def _continuation_turns(self, partial_text):
+        """Conversation turns that hand a truncated response back to the model to continue."""
+        return [
+            types.Content(role='model', parts=[types.Part(text=partial_text)]),
+            types.Content(role='user', parts=[types.Part(text=CONTINUATION_PROMPT)])
+        ]
+
+    def _generation_config(self, generation, cached_content=None):
+        """
+        Build the GenerateContentConfig for a request.
+
+        Args:
+            generation (dict): Generation settings of the latency tier, from _tier_settings
+            cached_content (str): Name of a cached-content object holding the documents, if any
+
+        Returns:
+            types.GenerateContentConfig: Request config
+        """
+        generation = generation or {}
+        thinking_config = None
+        if generation.get('thinking_budget') is not None:
+            thinking_config = types.ThinkingConfig(thinking_budget=generation['thinking_budget'])
+        # The HTTP timeout ends requests abandoned at the deadline (e.g. a losing hedge)
+        http_options = None
+        if self.hedger.deadline_seconds:
+            http_options = types.HttpOptions(timeout=int((self.hedger.deadline_seconds + HTTP_TIMEOUT_GRACE_SECONDS) * 1000))
+        return types.GenerateContentConfig(
+            cached_content=cached_content,
+            max_output_tokens=generation.get('max_output_tokens'),
+            temperature=generation.get('temperature'),
+            thinking_config=thinking_config,
+            http_options=http_options
+        )
+
+    def _is_cache_error(self, cached_content, error):
+        """
+        Decide whether a failed cached request should be retried with the documents inline.
+
+        Returns:
+            bool: True if the cache was rejected (and has been invalidated), False for
+                  errors such as rate limiting that a retry without the cache would not fix
+        """
+        if error.code == 429:
+            return False
+        # The cache was deleted or expired early; fall back to sending the documents
+        logging.warning(f"Context cache {cached_content} unusable, sending documents uncached: {str(error)}")
+        self.context_cache.invalidate(cached_content)
+        return True
+
+    def _invalidate_stale_uploads(self, resolved_documents, error):
+        """
+        Drop the remote handles of uploaded documents that a rejected request names.
+
+        The Files API can delete a file before its recorded expiry; the request
+        then fails with a 400, 403 or 404 naming the file. Its handle is
+        forgotten so the next request uploads the document again.
+
+        Returns:
+            bool: True if any handle was invalidated
+        """
+        if not self.document_registry.enabled or error.code not in (400, 403, 404):
+            return False
+        message = str(error)
+        stale = []
+        for _, file_path, _ in resolved_documents:
+            record = self.document_registry.get_record(file_path)
+            if record and (record['uri'] in message or record['name'].split('/')[-1] in message):
+                stale.append(file_path)
+        for file_path in stale:
+            logging.warning(f"Uploaded copy of {os.path.basename(file_path)} was rejected, uploading it again")
+            self.document_registry.invalidate(file_path)
+        return bool(stale)
+
+    def _call_model(self, stream, **request_kwargs):
+        """Call generate_content, or generate_content_stream when streaming."""
+        if not stream:
+            return self.client.models.generate_content(**request_kwargs)
+
+        # The streaming call is lazy; pull the first chunk so request errors surface here
+        response_stream = self.client.models.generate_content_stream(**request_kwargs)
+        first_chunk = next(response_stream, None)
+        if first_chunk is None:
+            return iter(())
+        return itertools.chain([first_chunk], response_stream)
+
+    def _usage_from_response(self, response):
+        """
+        Summarize token usage for a response.
+
+        Returns:
+            dict: Cached, uncached and total input tokens plus output tokens
+        """
+        usage_metadata = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage_metadata, 'prompt_token_count', None) or 0
+        cached_tokens = getattr(usage_metadata, 'cached_content_token_count', None) or 0
+        return {
+            'input_tokens': prompt_tokens,
+            'cached_input_tokens': cached_tokens,
+            'uncached_input_tokens': prompt_tokens - cached_tokens,
+            'output_tokens': getattr(usage_metadata, 'candidates_token_count', None) or 0
+        }
+
+    def _resolve_documents(self, documents, is_comparative=False, companies=None):
+        """
+        Resolve the documents to send to the model.
+
+        Args:
+            documents (dict): Documents as passed to analyze_earnings_documents
+            is_comparative (bool): Whether documents use the comparative key format
+            companies (list): For comparative analysis, list of company data dictionaries
+
+        Returns:
+            list: List of (doc_key, file_path, label) tuples for files that exist on disk
+        """
+        resolved = []
+
+        if is_comparative:
+            # For comparative analysis, documents are in a different format
+            for doc_key, file_path in documents.items():
+                # Extract ticker and document type from the key (e.g., "amzn_earnings_release")
+                parts_key = doc_key.split('_', 1)
+                if len(parts_key) != 2:
+                    logging.warning(f"Invalid document key: {doc_key}. Skipping.")
+                    continue
+
+                ticker, doc_type = parts_key
+
+                # Comparative entries may carry the full download info dict
+                if isinstance(file_path, dict):
+                    file_path = file_path['path']
+
+                # Check if file exists
+                if not os.path.exists(file_path):
+                    logging.warning(f"File not found: {file_path}. Skipping.")
+                    continue
+
+                # Find the company name for this ticker
+                company_name_for_doc = ticker.upper()
+                if companies:
+                    for company_data in companies:
+                        if company_data['ticker'].lower() == ticker.lower():
+                            company_name_for_doc = f"{company_data['name']} ({ticker.upper()})"
+                            break
+
+                # Label what type of document this is
+                doc_label = "earnings release" if "earnings_release" in doc_type else "earnings call transcript"
+                resolved.append((doc_key, file_path, f"{company_name_for_doc} {doc_label}"))
+        else:
+            # Standard single-company analysis
             for doc_type, doc_info in documents.items():
                 file_path = doc_info['path']
-                
+
                 # Check if file exists
                 if not os.path.exists(file_path):
                     logging.warning(f"File not found: {file_path}. Skipping.")
                     continue
-                
-                # Determine file MIME type
-                mime_type = self._get_mime_type(file_path)
-                
-                # Label what type of document this is
-                doc_label = "earnings release" if doc_type == "earnings_release" else "earnings call transcript"
-                parts.append(types.Part(text=f"\nDOCUMENT TYPE: {doc_label.upper()}\n"))
-                
-                # Read the file as binary
-                try:
-                    with open(file_path, 'rb') as f:
-                        file_data = f.read()
-                        
-                    parts.append(
-                        types.Part(
-                            inline_data=types.Blob(
-                                mime_type=mime_type,
-                                data=file_data
-                            )
-                        )
-                    )
-                    logging.info(f"Successfully loaded {doc_label}: {os.path.basename(file_path)}")
-                except Exception as e:
-                    logging.error(f"Error reading {file_path}: {str(e)}")
-            
-            # Load the custom prompt from config if available
-            custom_prompt = None
-            if os.path.exists(config.PROMPT_CONFIG_PATH):
+
+                # Label what type of document this is, unless the caller supplied a label
+                doc_label = doc_info.get('label') or (
+                    "earnings release" if doc_type == "earnings_release" else "earnings call transcript"
+                )
+                resolved.append((doc_type, file_path, doc_label))
+
+        return resolved
+
+    def _select_inputs(self, documents, prompt, is_comparative=False, companies=None, ingestion_mode=None):
+        """
+        Resolve the documents to send and reduce them to their final form.
+
+        Args:
+            documents (dict): Documents as passed to analyze_earnings_documents
+            prompt (str): Rendered prompt, whose sections drive passage retrieval
+            is_comparative (bool): Whether documents use the comparative key format
+            companies (list): For comparative analysis, list of company data dictionaries
+            ingestion_mode (str): Override the analyzer's ingestion mode
+
+        Returns:
+            tuple: (list of (doc_key, file_path, label) tuples, dict mapping the
+                   label of each page-filtered document to its 'pages' (1-based
+                   page numbers kept) and 'total_pages')
+        """
+        ingestion_mode = ingestion_mode or self.ingestion_mode
+        resolved_documents = self._resolve_documents(documents, is_comparative, companies)
+        if ingestion_mode == 'retrieval':
+            return self._retrieve_passages(resolved_documents, prompt), {}
+        return self._filter_pages(self._ingest_documents(resolved_documents, ingestion_mode))
+
+    def _ingest_documents(self, resolved_documents, ingestion_mode=None):
+        """
+        Swap documents for their extracted text when running in 'text' ingestion mode.
+
+        The extracted text files then flow through uploads, token counting and
+        the caches exactly like the originals, keyed on their own content.
+
+        Args:
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+            ingestion_mode (str): Override the analyzer's ingestion mode
+
+        Returns:
+            list: (doc_key, file_path, label) tuples, pointing at extracted text
+                  where it is available
+        """
+        if (ingestion_mode or self.ingestion_mode) != 'text' or not resolved_documents:
+            return resolved_documents
+
+        extracted = self.text_extractor.extract_many([file_path for _, file_path, _ in resolved_documents])
+
+        ingested = []
+        for doc_key, file_path, label in resolved_documents:
+            text_path = extracted.get(file_path)
+            if text_path:
+                ingested.append((doc_key, text_path, label))
+            else:
+                logging.warning(f"No usable text extracted from {os.path.basename(file_path)}, sending the original")
+                ingested.append((doc_key, file_path, label))
+        return ingested
+
+    def _retrieve_passages(self, resolved_documents, prompt):
+        """
+        Replace the documents with the top passages retrieved for each prompt section.
+
+        Returns:
+            list: A single (doc_key, file_path, label) tuple for the passage bundle,
+                  or resolved_documents unchanged if nothing could be retrieved
+        """
+        if not resolved_documents:
+            return resolved_documents
+
+        self.retrieval_index.update()
+
+        sections = split_prompt_sections(prompt)['sections'] or [{'title': 'Analysis', 'body': prompt}]
+        labels = {file_path: label for _, file_path, label in resolved_documents}
+        context = self.retrieval_index.build_section_context(sections, list(labels), labels)
+        if '[Source:' not in context:
+            logging.warning("No passages retrieved from the index, sending the documents instead")
+            return resolved_documents
+
+        logging.info(f"Retrieved passages for {len(sections)} sections from {len(labels)} documents "
+                     f"({len(context)} characters)")
+        label = f"retrieved passages from {', '.join(labels.values())}"
+        return [('retrieved_passages', self.retrieval_index.context_path(context), label)]
+
+    def _filter_pages(self, resolved_documents):
+        """
+        Replace earnings releases with copies holding only their most relevant pages.
+
+        Transcripts are left whole, since relevant remarks are spread across the call.
+
+        Returns:
+            tuple: (list of (doc_key, file_path, label) tuples, dict of selected pages by label)
+        """
+        filtered = []
+        selected_pages = {}
+        for doc_key, file_path, label in resolved_documents:
+            if 'earnings_release' in doc_key:
+                reduced_path, pages, total_pages = self.page_filter.reduce(file_path)
+                if pages:
+                    selected_pages[label] = {'pages': pages, 'total_pages': total_pages}
+                    # Tell the model which original pages it sees so citations stay accurate
+                    label = f"{label} (pages {', '.join(map(str, pages))} of {total_pages})"
+                    file_path = reduced_path
+            filtered.append((doc_key, file_path, label))
+        return filtered, selected_pages
+
+    def _build_document_parts(self, resolved_documents):
+        """
+        Build the Gemini content parts for a list of resolved documents.
+
+        Args:
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+
+        Returns:
+            list: List of types.Part, a label part followed by the document for each file
+        """
+        parts = []
+
+        for doc_key, file_path, label in resolved_documents:
+            parts.append(types.Part(text=f"\nDOCUMENT TYPE: {label.upper()}\n"))
+
+            # Determine file MIME type
+            mime_type = self._get_mime_type(file_path)
+
+            # Reference the uploaded copy so the bytes are not resent with every request
+            if self.document_registry.enabled:
                 try:
-                    with open(config.PROMPT_CONFIG_PATH, 'r', encoding='utf-8') as f:
-                        custom_prompt = f.read().strip()
-                    logging.info("Using custom prompt from config")
+                    parts.append(self.document_registry.get_file_part(file_path, mime_type))
+                    logging.info(f"Using uploaded {label}: {os.path.basename(file_path)}")
+                    continue
                 except Exception as e:
-                    logging.error(f"Error reading custom prompt: {str(e)}")
-            
-            # Add the consolidated analysis prompt after all documents
-            if is_comparative:
-                # For comparative analysis, use a special prompt
-                if custom_prompt:
-                    prompt = custom_prompt.format(
-                        company_name=company_name,
-                        quarter=quarter,
-                        year=year
+                    logging.warning(f"Could not upload {file_path}, sending inline instead: {str(e)}")
+
+            # Read the file as binary
+            try:
+                with open(file_path, 'rb') as f:
+                    file_data = f.read()
+
+                parts.append(
+                    types.Part(
+                        inline_data=types.Blob(
+                            mime_type=mime_type,
+                            data=file_data
+                        )
                     )
-                    # Add comparative instructions
-                    prompt += "\n\n### COMPARATIVE ANALYSIS INSTRUCTIONS:\n"
-                    prompt += f"This is a comparative analysis of multiple companies: {company_name}.\n"
-                    prompt += "For each section, compare and contrast the companies directly.\n"
-                    prompt += "Highlight competitive advantages, differing strategies, and relative performance.\n"
-                    prompt += "Include a direct comparison matrix section at the end showing key metrics and strategies side by side.\n"
-                else:
-                    prompt = f"""
-                    You are a strategic analyst for Google Cloud Platform, conducting a comparative analysis of {company_name}'s {quarter} {year} earnings documents.
-                    
-                    Create an email-ready comparative analysis that analyzes and contrasts all companies, focusing on:
-                    
-                    ## Executive Summary
-                    - One paragraph overview comparing the key differences in performance and cloud strategies
-                    
-                    ## Financial Performance Comparison
-                    - Compare and contrast key financial results with cloud market implications
-                    - YoY growth rates comparison in relevant areas (revenue, profit, R&D)
-                    - Relative market share and positioning
-                    
-                    ## Cloud Strategy Comparison
-                    - Compare and contrast each company's cloud strategy and market position
-                    - Identify strategic direction changes or investments
-                    - Analyze competitive positioning against each other and Google Cloud
-                    
-                    ## Technology and AI Investment Comparison
-                    - Compare technology investments that might affect cloud adoption
-                    - Contrast AI/ML initiatives that could complement or compete with GCP offerings
-                    - Compare data center expansions or efficiency improvements
-                    - Contrast enterprise sales strategy changes relevant to cloud providers
-                    
-                    ## Customer and Partner Intelligence
-                    - Compare notable customer wins or losses in cloud services
-                    - Contrast partner ecosystem developments relevant to cloud
-                    - Identify differences in enterprise customer spending patterns
-                    
-                    ## Strategic Implications for Google/GCP
-                    - Opportunities for Google Cloud based on the comparative analysis
-                    - Potential threats to Google Cloud's market position from each company
-                    - Recommended actions for GCP leadership in response to this analysis
-                    
-                    ## Comparative Matrix
-                    - Create a table comparing key metrics, strategies, and investments across all companies
-                    
-                    Format as clean, professional markdown suitable for immediate email distribution.
-                    Be concise, data-driven, and actionable, focusing on strategic implications.
-                    For each insight, specify the exact source (company, document type and location).
-                    
-                    IMPORTANT: Do NOT include phrases like "Comparative Analysis" or "Here is an analysis of..." in your response.
-                    Start directly with the content and ensure the analysis is self-contained and ready to be sent as is.
-                    """
+                )
+                logging.info(f"Successfully loaded {label}: {os.path.basename(file_path)}")
+            except Exception as e:
+                logging.error(f"Error reading {file_path}: {str(e)}")
+
+        return parts
+
+    def _load_custom_prompt(self):
+        """Load the custom prompt template from config, or None if unavailable."""
+        if os.path.exists(config.PROMPT_CONFIG_PATH):
+            try:
+                with open(config.PROMPT_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                    custom_prompt = f.read().strip()
+                logging.info("Using custom prompt from config")
+                return custom_prompt
+            except Exception as e:
+                logging.error(f"Error reading custom prompt: {str(e)}")
+        return None
+
+    def _build_prompt(self, company_name, quarter, year, is_comparative=False):
+        """
+        Render the analysis prompt that follows the documents.
+
+        Args:
+            company_name (str): Name of the company, or for comparative, a joined string of names
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+            is_comparative (bool): Whether this is a comparative analysis of multiple companies
+
+        Returns:
+            str: Rendered prompt text
+        """
+        # Load the custom prompt from config if available
+        custom_prompt = self._load_custom_prompt()
+
+        if is_comparative:
+            # For comparative analysis, use a special prompt
+            if custom_prompt:
+                prompt = custom_prompt.format(
+                    company_name=company_name,
+                    quarter=quarter,
+                    year=year
+                )
+                # Add comparative instructions
+                prompt += "\n\n### COMPARATIVE ANALYSIS INSTRUCTIONS:\n"
+                prompt += f"This is a comparative analysis of multiple companies: {company_name}.\n"
+                prompt += "For each section, compare and contrast the companies directly.\n"
+                prompt += "Highlight competitive advantages, differing strategies, and relative performance.\n"
+                prompt += "Include a direct comparison matrix section at the end showing key metrics and strategies side by side.\n"
             else:
-                # Standard single-company analysis
-                if custom_prompt:
-                    prompt = custom_prompt.format(
-                        company_name=company_name,
-                        quarter=quarter,
-                        year=year
-                    )
-                else:
-            prompt = f"""
-            You are a strategic analyst for Google Cloud Platform, analyzing {company_name}'s {quarter} {year} earnings documents.
-            
-            Create an email-ready analysis that combines insights from all provided documents, focusing on:
-            
-            ## Financial Overview
-            - Key financial results with cloud market implications
-            - YoY growth rates in relevant areas (revenue, profit, R&D)
-            
-            ## Cloud Strategy and Competitive Position
-            - Current cloud strategy and market position
-            - Strategic direction changes or investments
-            - Competitive positioning against Google Cloud
-
-            ## Technology and AI Investments
-            - Technology investments that might affect cloud adoption
-            - AI/ML initiatives that could complement or compete with GCP offerings
-            - Data center expansions or efficiency improvements
-            - Enterprise sales strategy changes relevant to cloud providers
-            
-            ## Customer and Partner Intelligence
-            - Notable customer wins or losses in cloud services
-            - Partner ecosystem developments relevant to cloud
-            - Changes in enterprise customer spending patterns
-            
-            ## Strategic Implications for Google/GCP
-            - Opportunities for Google Cloud based on these earnings documents
-            - Potential threats to Google Cloud's market position
-            - Recommended actions for GCP leadership
-
-            Format as clean, professional markdown suitable for immediate email distribution.
-            Be concise, data-driven, and actionable, focusing on strategic implications.
-            For each insight, specify the exact source (document type and location).
-            
-            IMPORTANT: Do NOT include phrases like "Executive Summary" or "Here is an analysis of..." in your response.
-            Start directly with the content and ensure the analysis is self-contained and ready to be sent as is.
-            """
-            
-            parts.append(types.Part(text=prompt))
-            
-            # Create content with all documents and prompt
-            content = types.Content(parts=parts)
-            
-            # Generate content with a single API call
-            logging.info(f"Sending analysis request to Gemini model: {model}")
-            response = self.client.models.generate_content(
-                model=model,
-                contents=content
-            )
-            
-            logging.info(f"Successfully generated analysis for {company_name}")
-            
-            # Construct the URLs dictionary for all document types
-            if is_comparative:
-                document_urls = {doc_key: "multiple documents" for doc_key in documents.keys()}
+                prompt = f"""
+                You are a strategic analyst for Google Cloud Platform, conducting a comparative analysis of {company_name}'s {quarter} {year} earnings documents.
+
+                Create an email-ready comparative analysis that analyzes and contrasts all companies, focusing on:
+
+                ## Executive Summary
+                - One paragraph overview comparing the key differences in performance and cloud strategies
+
+                ## Financial Performance Comparison
+                - Compare and contrast key financial results with cloud market implications
+                - YoY growth rates comparison in relevant areas (revenue, profit, R&D)
+                - Relative market share and positioning
+
+                ## Cloud Strategy Comparison
+                - Compare and contrast each company's cloud strategy and market position
+                - Identify strategic direction changes or investments
+                - Analyze competitive positioning against each other and Google Cloud
+
+                ## Technology and AI Investment Comparison
+                - Compare technology investments that might affect cloud adoption
+                - Contrast AI/ML initiatives that could complement or compete with GCP offerings
+                - Compare data center expansions or efficiency improvements
+                - Contrast enterprise sales strategy changes relevant to cloud providers
+
+                ## Customer and Partner Intelligence
+                - Compare notable customer wins or losses in cloud services
+                - Contrast partner ecosystem developments relevant to cloud
+                - Identify differences in enterprise customer spending patterns
+
+                ## Strategic Implications for Google/GCP
+                - Opportunities for Google Cloud based on the comparative analysis
+                - Potential threats to Google Cloud's market position from each company
+                - Recommended actions for GCP leadership in response to this analysis
+
+                ## Comparative Matrix
+                - Create a table comparing key metrics, strategies, and investments across all companies
+
+                Format as clean, professional markdown suitable for immediate email distribution.
+                Be concise, data-driven, and actionable, focusing on strategic implications.
+                For each insight, specify the exact source (company, document type and location).
+
+                IMPORTANT: Do NOT include phrases like "Comparative Analysis" or "Here is an analysis of..." in your response.
+                Start directly with the content and ensure the analysis is self-contained and ready to be sent as is.
+                """
+        else:
+            # Standard single-company analysis
+            if custom_prompt:
+                prompt = custom_prompt.format(
+                    company_name=company_name,
+                    quarter=quarter,
+                    year=year
+                )
             else:
-            document_urls = {
-                doc_type: doc_info['url'] 
-                for doc_type, doc_info in documents.items()
-            }
-            
-            return {
-                'company': company_name,
-                'period': f"{quarter} {year}",
-                'document_types': list(documents.keys()),
-                'document_urls': document_urls,
-                'analysis': response.text
-            }
-            
-        except Exception as e:
-            logging.error(f"Error creating analysis: {str(e)}")
-            return {
-                'company': company_name,
-                'period': f"{quarter} {year}",
-                'document_types': list(documents.keys()) if documents else [],
-                'error': str(e)
-            }
-    
+                prompt = f"""
+                You are a strategic analyst for Google Cloud Platform, analyzing {company_name}'s {quarter} {year} earnings documents.
+
+                Create an email-ready analysis that combines insights from all provided documents, focusing on:
+
+                ## Financial Overview
+                - Key financial results with cloud market implications
+                - YoY growth rates in relevant areas (revenue, profit, R&D)
+
+                ## Cloud Strategy and Competitive Position
+                - Current cloud strategy and market position
+                - Strategic direction changes or investments
+                - Competitive positioning against Google Cloud
+
+                ## Technology and AI Investments
+                - Technology investments that might affect cloud adoption
+                - AI/ML initiatives that could complement or compete with GCP offerings
+                - Data center expansions or efficiency improvements
+                - Enterprise sales strategy changes relevant to cloud providers
+
+                ## Customer and Partner Intelligence
+                - Notable customer wins or losses in cloud services
+                - Partner ecosystem developments relevant to cloud
+                - Changes in enterprise customer spending patterns
+
+                ## Strategic Implications for Google/GCP
+                - Opportunities for Google Cloud based on these earnings documents
+                - Potential threats to Google Cloud's market position
+                - Recommended actions for GCP leadership
+
+                Format as clean, professional markdown suitable for immediate email distribution.
+                Be concise, data-driven, and actionable, focusing on strategic implications.
+                For each insight, specify the exact source (document type and location).
+
+                IMPORTANT: Do NOT include phrases like "Executive Summary" or "Here is an analysis of..." in your response.
+                Start directly with the content and ensure the analysis is self-contained and ready to be sent as is.
+                """
+
+        return prompt
+
+    def _build_section_prompt(self, sections, index):
+        """
+        Render the prompt for one section of a section-parallel report.
+
+        Args:
+            sections (dict): Prompt split by split_prompt_sections
+            index (int): Position of the section to write
+
+        Returns:
+            str: Rendered prompt text
+        """
+        section = sections['sections'][index]
+        titles = ", ".join(other['title'] for other in sections['sections'])
+        return (
+            f"{sections['preamble']}\n\n"
+            f"The full report has these sections: {titles}. The other sections are written separately, "
+            f"so write ONLY the section below. Start with its heading line exactly as given and do not "
+            f"cover material that belongs to the other sections.\n\n"
+            f"## {section['title']}\n{section['body']}\n\n"
+            f"{sections['instructions']}"
+        ).strip()
+
+    def _build_triage_prompt(self, company_name, quarter, year):
+        """
+        Render the screening prompt that scores a release's materiality for GCP.
+
+        Args:
+            company_name (str): Name of the company
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+
+        Returns:
+            str: Rendered prompt text
+        """
+        return f"""
+        You are screening {company_name}'s {quarter} {year} earnings documents for the Google Cloud Platform strategy team.
+        Decide how much they contain that matters for GCP: changes in cloud revenue or growth, AI/ML products or
+        infrastructure, capex and data center plans, chip supply, major customer or partner moves, and competitive
+        positioning against Google Cloud.
+
+        Respond with only a JSON object and no other text:
+        {{"materiality_score": <integer from 0 (nothing relevant to GCP) to 10 (major strategic news)>,
+          "topics": [<up to 5 short topic strings>],
+          "rationale": "<one sentence>"}}
+        """
+
+    def _build_no_impact_report(self, company_name, quarter, year, triage):
+        """
+        Render the short report emitted when triage finds nothing material.
+
+        Args:
+            company_name (str): Name of the company
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+            triage (dict): Result of triage_documents
+
+        Returns:
+            str: Markdown report
+        """
+        report = "## No Material GCP Impact\n\n"
+        report += (f"{company_name}'s {quarter} {year} earnings documents were screened by {triage['model']} and scored "
+                   f"{triage['score']:g}/10 for relevance to Google Cloud, below the threshold of {triage['threshold']:g}, "
+                   f"so no full analysis was generated.\n")
+        if triage['rationale']:
+            report += f"\n**Screening rationale:** {triage['rationale']}\n"
+        if triage['topics']:
+            report += "\n**Topics mentioned:**\n" + "".join(f"- {topic}\n" for topic in triage['topics'])
+        return report
+
+    def _build_summary_prompt(self, company_name, quarter, year):
+        """
+        Render the prompt for the compact per-company summary used by map-reduce comparisons.
+
+        Args:
+            company_name (str): Name of the company
+            quarter (str): Quarter (Q1, Q2, Q3, Q4)
+            year (str): Year
+
+        Returns:
+            str: Rendered prompt text
+        """
+        return f"""
+        You are a strategic analyst for Google Cloud Platform. Summarize {company_name}'s {quarter} {year} earnings documents
+        as compact input for a later comparison with other companies.
+
+        Use exactly these headings, with at most five terse bullets each:
+
+        #### Key Metrics
+        - Revenue, growth rates, margins and segment results, with exact figures
+
+        #### Cloud Business
+        - Cloud revenue, growth, market position and strategy changes
+
+        #### AI and Infrastructure Investment
+        - AI/ML initiatives, capex, data center and chip investments
+
+        #### Customers and Partners
+        - Notable customer wins or losses, partnerships and enterprise spending trends
+
+        #### Outlook
+        - Guidance and forward-looking commentary
+
+        #### Relevance to Google Cloud
+        - Opportunities and threats for GCP
+
+        Keep the whole summary under 400 words. Prefer numbers over adjectives.
+        Tag every bullet with its source, e.g. (earnings release, p. 3) or (transcript).
+        Do not add an introduction or conclusion.
+        """
+
+    def _build_cluster_prompt(self, cluster_name, company_names, quarter, year):
+        """
+        Render the prompt comparing the companies of one peer cluster.
+
+        Args:
+            cluster_name (str): Name of the peer cluster (e.g. "Hyperscalers")
+            company_names (list): Names of the companies in the cluster
+            quarter (str): Reference quarter
+            year (str): Reference year
+
+        Returns:
+            str: Rendered prompt text
+        """
+        return f"""
+        You are a strategic analyst for Google Cloud Platform. The document contains structured summaries of
+        the {quarter} {year} earnings of these {cluster_name} peers: {', '.join(company_names)}.
+        Compare them with each other as compact input for a later comparison across peer groups.
+
+        Use exactly these headings, with at most six terse bullets each:
+
+        #### Relative Performance
+        - Revenue, growth and margin differences between the peers, with exact figures
+
+        #### Cloud and AI Positioning
+        - How each peer's cloud and AI offerings and momentum compare
+
+        #### Infrastructure Investment
+        - Capex, data center and chip investment compared across the peers
+
+        #### Customers and Demand
+        - Shared or diverging signals on enterprise demand, customers and partnerships
+
+        #### Relevance to Google Cloud
+        - What this peer group's results mean for GCP: opportunities and threats
+
+        Keep the whole comparison under 600 words. Name the company in every bullet and keep the source
+        tags from the summaries, e.g. (MSFT earnings release, p. 3). Do not add an introduction or conclusion.
+        """
+
     def _get_mime_type(self, file_path):
         """Determine MIME type based on file extension"""
         ext = os.path.splitext(file_path)[1].lower()
@@ -299,4 +1787,4 @@ class EarningsAnalyzer:
             return 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         else:
             # Default to text
-            return 'text/plain' 
\ No newline at end of file
+            return 'text/plain'
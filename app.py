@@ -1,15 +1,18 @@
 import os
 import json
+import time
 import logging
 import subprocess
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context
 import markdown
 
 import config
 from config_manager import ConfigManager
 from downloader import EarningsDocDownloader
 from analyzer import EarningsAnalyzer
+from job_queue import JobQueue, JobCancelled
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev_key_change_in_production')
@@ -31,15 +34,17 @@ downloader = EarningsDocDownloader(config_manager)
 def index():
     """Main dashboard page"""
     companies = config_manager.get_all_companies()
-    return render_template('index.html', companies=companies)
+    return render_template('index.html', companies=companies, latency_tiers=config_manager.get_latency_tiers())
 
 @app.route('/run-analysis', methods=['POST'])
 def run_analysis():
-    """Run analysis for one or multiple companies"""
+    """Queue analysis for one or multiple companies"""
     # Handle both single and multi-company selection
     ticker = request.form.get('ticker')
     tickers = request.form.getlist('tickers')
     batch_process = request.form.get('batch_process') == 'on'
+    live_stream = request.form.get('live_stream') == 'on'
+    latency_tier = request.form.get('latency_tier') or None
     
     # Check if we have any companies selected
     if not ticker and not tickers:
@@ -48,266 +53,571 @@ def run_analysis():
     
     # If single company mode
     if ticker and not tickers:
-        return process_single_company(ticker)
-    
+        job_id = job_queue.submit('live' if live_stream else 'single', ticker=ticker, latency_tier=latency_tier)
     # If multi-company mode
-    if tickers:
-        if batch_process:
-            return process_multiple_companies_batch(tickers)
-        else:
-            return process_multiple_companies_comparative(tickers)
+    elif batch_process:
+        job_id = job_queue.submit('batch', tickers=tickers, latency_tier=latency_tier)
+    else:
+        job_id = job_queue.submit('comparative', tickers=tickers, latency_tier=latency_tier)
     
-    # Fallback
-    flash("Invalid selection", "error")
-    return redirect(url_for('index'))
+    # API clients get the job id back immediately; browsers follow the job page
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id, 'status_url': url_for('job_status_api', job_id=job_id)}), 202
+    if live_stream and ticker and not tickers:
+        return redirect(url_for('live_analysis', job_id=job_id))
+    return redirect(url_for('job_status', job_id=job_id))
 
-def process_single_company(ticker):
-    """Process a single company analysis"""
-    try:
-        company_info = config_manager.get_company(ticker)
-        if not company_info:
-            flash(f"Company ticker '{ticker}' not found", "error")
-            return redirect(url_for('index'))
-        
-        year, quarter, release_data = config_manager.get_latest_release(ticker)
-        if not release_data:
-            flash(f"No release data found for {ticker}", "error")
-            return redirect(url_for('index'))
-        
-        # Download documents
-        download_result = downloader.download_latest_earnings(ticker)
-        
-        if not download_result or not download_result['files']:
-            flash(f"No documents available for {ticker}. Please check IR site.", "error")
-            return redirect(url_for('index'))
-        
-        # Analyze documents
-        analysis = analyzer.analyze_earnings_documents(
-            download_result['files'], 
-            company_info['name'], 
-            download_result['quarter'], 
-            download_result['year']
+def job_result(files=None, messages=None, redirect_to='view_analysis'):
+    """
+    Build the stored result of an analysis job.
+    
+    Args:
+        files (list): Analysis filenames written to RESULTS_DIR
+        messages (list): List of (category, text) tuples to show the user
+        redirect_to (str): 'view_analysis' to open the first file, or 'analyses' for the list
+    """
+    return {
+        'files': files or [],
+        'messages': [{'category': category, 'text': text} for category, text in (messages or [])],
+        'redirect_to': redirect_to
+    }
+
+def analysis_text(analysis):
+    """Return the report text of an analysis result, raising instead of saving an error as a report"""
+    if 'error' in analysis:
+        raise ValueError(f"Analysis of {analysis['company']} failed: {analysis['error']}")
+    return analysis['analysis']
+
+def analyze_company(files, company_name, quarter, year, tier=None):
+    """
+    Analyze one company's documents, screening them first when triage is on and
+    using one call per report section when section-parallel generation is on
+    """
+    if config.TRIAGE_ENABLED:
+        return analyzer.analyze_earnings_documents_triaged(
+            files, company_name, quarter, year, tier=tier, triage_tier=config_manager.get_triage_tier(),
+            section_parallel=config.SECTION_PARALLEL_GENERATION
         )
-        
-        # Save analysis
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"{ticker}_{download_result['year']}_{download_result['quarter']}_{timestamp}.md"
-        output_path = os.path.join(config.RESULTS_DIR, output_filename)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else str(analysis))
-        
-        flash(f"Analysis for {company_info['name']} has been completed and saved", "success")
-        session['last_analysis'] = output_path
-        
-        return redirect(url_for('view_analysis', filename=output_filename))
+    if config.SECTION_PARALLEL_GENERATION:
+        return analyzer.analyze_earnings_documents_by_section(files, company_name, quarter, year, tier=tier)
+    return analyzer.analyze_earnings_documents(files, company_name, quarter, year, tier=tier)
+
+def process_single_company(job, ticker, latency_tier=None):
+    """Process a single company analysis"""
+    company_info = config_manager.get_company(ticker)
+    if not company_info:
+        raise ValueError(f"Company ticker '{ticker}' not found")
+    tier = config_manager.get_latency_tier(latency_tier, ticker=ticker)
     
-    except Exception as e:
-        logging.error(f"Error running analysis: {str(e)}")
-        flash(f"Error running analysis: {str(e)}", "error")
-        return redirect(url_for('index'))
+    year, quarter, release_data = config_manager.get_latest_release(ticker)
+    if not release_data:
+        raise ValueError(f"No release data found for {ticker}")
+    
+    # Download documents
+    job.set_progress(f"Downloading documents for {ticker}")
+    download_result = downloader.download_latest_earnings(ticker)
+    
+    if not download_result or not download_result['files']:
+        raise ValueError(f"No documents available for {ticker}. Please check IR site.")
+    
+    job.check_cancelled()
+    
+    # Analyze documents
+    job.set_progress(f"Analyzing {company_info['name']}")
+    analysis = analyze_company(
+        download_result['files'], 
+        company_info['name'], 
+        download_result['quarter'], 
+        download_result['year'],
+        tier=tier
+    )
+    
+    # Save analysis
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"{ticker}_{download_result['year']}_{download_result['quarter']}_{timestamp}.md"
+    output_path = os.path.join(config.RESULTS_DIR, output_filename)
+    
+    report = analysis_text(analysis)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    
+    return job_result(
+        files=[output_filename],
+        messages=[("success", f"Analysis for {company_info['name']} has been completed and saved")]
+    )
 
-def process_multiple_companies_batch(tickers):
-    """Process multiple companies as separate analyses"""
+class BatchTickerError(Exception):
+    """A per-ticker failure in batch mode, reported as '<ticker> (<reason>)'"""
+
+def analyze_batch_ticker(job, ticker, latency_tier=None):
+    """
+    Download, analyze and save one company of a batch run.
+    
+    Returns:
+        tuple: (output_filename, company_name)
+    """
+    job.check_cancelled()
+    
+    company_info = config_manager.get_company(ticker)
+    if not company_info:
+        raise BatchTickerError(f"{ticker} (not found)")
+    tier = config_manager.get_latency_tier(latency_tier, ticker=ticker)
+    
+    year, quarter, release_data = config_manager.get_latest_release(ticker)
+    if not release_data:
+        raise BatchTickerError(f"{ticker} (no release data)")
+    
+    # Download documents
+    download_result = downloader.download_latest_earnings(ticker)
+    
+    if not download_result or not download_result['files']:
+        raise BatchTickerError(f"{ticker} (no documents)")
+    
+    job.check_cancelled()
+    
+    # Analyze documents
+    analysis = analyze_company(
+        download_result['files'], 
+        company_info['name'], 
+        download_result['quarter'], 
+        download_result['year'],
+        tier=tier
+    )
+    
+    # Save analysis
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"{ticker}_{download_result['year']}_{download_result['quarter']}_{timestamp}.md"
+    output_path = os.path.join(config.RESULTS_DIR, output_filename)
+    
+    report = analysis_text(analysis)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    
+    logging.info(f"Successfully analyzed {company_info['name']} ({ticker})")
+    return output_filename, company_info['name']
+
+def process_multiple_companies_batch(job, tickers, latency_tier=None):
+    """Process multiple companies as separate analyses, running up to BATCH_CONCURRENCY at once"""
     if not tickers:
-        flash("No companies selected", "error")
-        return redirect(url_for('index'))
+        raise ValueError("No companies selected")
     
     analysis_files = []
     error_companies = []
     successful_companies = []
     start_time = datetime.now()
     
+    # Each ticker's download/analyze/save pipeline is I/O bound, so run them side by side
+    concurrency = max(1, min(config.BATCH_CONCURRENCY, len(tickers)))
+    job.set_progress(f"Analyzing {len(tickers)} companies ({concurrency} at a time)")
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch') as executor:
+        futures = [(ticker, executor.submit(analyze_batch_ticker, job, ticker, latency_tier)) for ticker in tickers]
+        
+        # Collect in submission order so reports list companies as selected
+        for ticker, future in futures:
+            try:
+                output_filename, company_name = future.result()
+                analysis_files.append(output_filename)
+                successful_companies.append(company_name)
+                job.set_progress(f"Analyzed {len(analysis_files)} of {len(tickers)} companies")
+            except JobCancelled:
+                for _, pending in futures:
+                    pending.cancel()
+                raise
+            except BatchTickerError as e:
+                error_companies.append(str(e))
+            except Exception as e:
+                logging.error(f"Error analyzing {ticker}: {str(e)}")
+                error_companies.append(f"{ticker} (error: {str(e)[:50]}...)")
+    
+    # Calculate wall-clock processing time
+    end_time = datetime.now()
+    processing_time = (end_time - start_time).total_seconds()
+    
+    # Report results
+    if not analysis_files:
+        raise ValueError(f"Failed to analyze any companies: {', '.join(error_companies)}")
+    
+    if len(analysis_files) == 1:
+        return job_result(
+            files=analysis_files,
+            messages=[("success", f"Successfully analyzed {successful_companies[0]} in {processing_time:.1f} seconds")]
+        )
+    
+    messages = [("success", f"Successfully analyzed {len(analysis_files)} companies in {processing_time:.1f} seconds: {', '.join(successful_companies)}")]
+    if error_companies:
+        messages.append(("warning", f"Failed to analyze {len(error_companies)} companies: {', '.join(error_companies)}"))
+    return job_result(files=analysis_files, messages=messages, redirect_to='analyses')
+
+def process_multiple_companies_comparative(job, tickers, latency_tier=None):
+    """Process multiple companies as a single comparative analysis"""
+    if not tickers:
+        raise ValueError("No companies selected")
+    tier = config_manager.get_latency_tier(latency_tier)
+    
+    # Collect all company info and documents
+    companies_data = []
+    company_names = []
+    failed_companies = []
+    messages = []
+    
+    # Download every company's documents concurrently
+    job.set_progress(f"Downloading documents for {len(tickers)} companies")
+    downloads = downloader.download_latest_earnings_many(tickers)
+    
     for ticker in tickers:
+        job.check_cancelled()
         try:
             company_info = config_manager.get_company(ticker)
             if not company_info:
-                error_companies.append(f"{ticker} (not found)")
+                failed_companies.append(f"{ticker} (company not found)")
                 continue
-            
+                
             year, quarter, release_data = config_manager.get_latest_release(ticker)
             if not release_data:
-                error_companies.append(f"{ticker} (no release data)")
+                failed_companies.append(f"{ticker} (no release data)")
                 continue
-            
-            # Download documents
-            download_result = downloader.download_latest_earnings(ticker)
+                
+            download_result = downloads.get(ticker)
             
             if not download_result or not download_result['files']:
-                error_companies.append(f"{ticker} (no documents)")
+                failed_companies.append(f"{ticker} (no documents available)")
                 continue
-            
-            # Analyze documents
-            analysis = analyzer.analyze_earnings_documents(
-                download_result['files'], 
-                company_info['name'], 
-                download_result['quarter'], 
-                download_result['year']
-            )
-            
-            # Save analysis
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = f"{ticker}_{download_result['year']}_{download_result['quarter']}_{timestamp}.md"
-            output_path = os.path.join(config.RESULTS_DIR, output_filename)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else str(analysis))
-            
-            analysis_files.append(output_filename)
-            successful_companies.append(company_info['name'])
-            logging.info(f"Successfully analyzed {company_info['name']} ({ticker})")
-        
+                
+            companies_data.append({
+                'ticker': ticker,
+                'name': company_info['name'],
+                'files': download_result['files'],
+                'quarter': download_result['quarter'],
+                'year': download_result['year']
+            })
+            company_names.append(company_info['name'])
         except Exception as e:
-            logging.error(f"Error analyzing {ticker}: {str(e)}")
-            error_companies.append(f"{ticker} (error: {str(e)[:50]}...)")
+            logging.error(f"Error processing company {ticker}: {str(e)}")
+            failed_companies.append(f"{ticker} (error: {str(e)[:50]}...)")
     
-    # Calculate total processing time
-    end_time = datetime.now()
-    processing_time = (end_time - start_time).total_seconds()
+    if not companies_data:
+        if failed_companies:
+            raise ValueError(f"Failed to process any companies: {', '.join(failed_companies)}")
+        raise ValueError("No valid companies found to analyze")
     
-    # Report results
-    if analysis_files:
-        if len(analysis_files) == 1:
-            flash(f"Successfully analyzed {successful_companies[0]} in {processing_time:.1f} seconds", "success")
-            return redirect(url_for('view_analysis', filename=analysis_files[0]))
-        else:
-            flash(f"Successfully analyzed {len(analysis_files)} companies in {processing_time:.1f} seconds: {', '.join(successful_companies)}", "success")
-            if error_companies:
-                flash(f"Failed to analyze {len(error_companies)} companies: {', '.join(error_companies)}", "warning")
-            return redirect(url_for('analyses'))
-    else:
-        flash(f"Failed to analyze any companies: {', '.join(error_companies)}", "error")
-        return redirect(url_for('index'))
-
-def process_multiple_companies_comparative(tickers):
-    """Process multiple companies as a single comparative analysis"""
-    if not tickers:
-        flash("No companies selected", "error")
-        return redirect(url_for('index'))
+    # Report partial failures but continue with available companies
+    if failed_companies:
+        messages.append(("warning", f"Some companies couldn't be processed: {', '.join(failed_companies)}"))
     
-    try:
-        # Collect all company info and documents
-        companies_data = []
-        company_names = []
-        failed_companies = []
+    job.check_cancelled()
         
-        for ticker in tickers:
-            try:
-                company_info = config_manager.get_company(ticker)
-                if not company_info:
-                    failed_companies.append(f"{ticker} (company not found)")
-                    continue
-                    
-                year, quarter, release_data = config_manager.get_latest_release(ticker)
-                if not release_data:
-                    failed_companies.append(f"{ticker} (no release data)")
-                    continue
-                    
-                # Download documents
-                download_result = downloader.download_latest_earnings(ticker)
-                
-                if not download_result or not download_result['files']:
-                    failed_companies.append(f"{ticker} (no documents available)")
-                    continue
-                    
-                companies_data.append({
-                    'ticker': ticker,
-                    'name': company_info['name'],
-                    'files': download_result['files'],
-                    'quarter': download_result['quarter'],
-                    'year': download_result['year']
-                })
-                company_names.append(company_info['name'])
-            except Exception as e:
-                logging.error(f"Error processing company {ticker}: {str(e)}")
-                failed_companies.append(f"{ticker} (error: {str(e)[:50]}...)")
+    if len(companies_data) == 1:
+        # If only one company is valid, switch to single company mode
+        single_company = companies_data[0]
+        messages.append(("warning", f"Only one company ({single_company['name']}) is available for analysis. Running single company analysis."))
         
-        if not companies_data:
-            if failed_companies:
-                flash(f"Failed to process any companies: {', '.join(failed_companies)}", "error")
-            else:
-                flash("No valid companies found to analyze", "error")
-            return redirect(url_for('index'))
-        
-        # Report partial failures but continue with available companies
-        if failed_companies:
-            flash(f"Some companies couldn't be processed: {', '.join(failed_companies)}", "warning")
-            
-        if len(companies_data) == 1:
-            # If only one company is valid, switch to single company mode
-            single_company = companies_data[0]
-            flash(f"Only one company ({single_company['name']}) is available for analysis. Running single company analysis.", "warning")
-            
-            # Analyze documents for the single company
-            analysis = analyzer.analyze_earnings_documents(
-                single_company['files'], 
-                single_company['name'], 
-                single_company['quarter'], 
-                single_company['year']
-            )
-            
-            # Save analysis
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = f"{single_company['ticker']}_{single_company['year']}_{single_company['quarter']}_{timestamp}.md"
-            output_path = os.path.join(config.RESULTS_DIR, output_filename)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else str(analysis))
-            
-            session['last_analysis'] = output_path
-            return redirect(url_for('view_analysis', filename=output_filename))
-            
-        # Combine document sets for analysis
-        combined_files = {}
-        for company_data in companies_data:
-            for file_type, file_path in company_data['files'].items():
-                combined_key = f"{company_data['ticker']}_{file_type}"
-                combined_files[combined_key] = file_path
+        # Analyze documents for the single company
+        job.set_progress(f"Analyzing {single_company['name']}")
+        analysis = analyze_company(
+            single_company['files'], 
+            single_company['name'], 
+            single_company['quarter'], 
+            single_company['year'],
+            tier=tier
+        )
         
-        # Create a combined analysis name
-        company_name_str = " vs. ".join(company_names)
-        if len(company_name_str) > 100:  # Truncate if too long
-            company_name_str = company_name_str[:97] + "..."
+        # Save analysis
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_filename = f"{single_company['ticker']}_{single_company['year']}_{single_company['quarter']}_{timestamp}.md"
+        output_path = os.path.join(config.RESULTS_DIR, output_filename)
         
-        # Use the quarter/year from the first company as reference
-        reference_quarter = companies_data[0]['quarter']
-        reference_year = companies_data[0]['year']
+        report = analysis_text(analysis)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(report)
         
-        # Let user know we're processing multiple companies
-        logging.info(f"Running comparative analysis of {len(companies_data)} companies: {', '.join(company_names)}")
+        return job_result(files=[output_filename], messages=messages)
         
-        # Analyze documents
+    # Combine document sets for analysis
+    combined_files = {}
+    for company_data in companies_data:
+        for file_type, file_path in company_data['files'].items():
+            combined_key = f"{company_data['ticker']}_{file_type}"
+            combined_files[combined_key] = file_path
+    
+    # Create a combined analysis name
+    company_name_str = " vs. ".join(company_names)
+    if len(company_name_str) > 100:  # Truncate if too long
+        company_name_str = company_name_str[:97] + "..."
+    
+    # Use the quarter/year from the first company as reference
+    reference_quarter = companies_data[0]['quarter']
+    reference_year = companies_data[0]['year']
+    
+    # Let user know we're processing multiple companies
+    logging.info(f"Running comparative analysis of {len(companies_data)} companies: {', '.join(company_names)}")
+    job.set_progress(f"Comparing {len(companies_data)} companies")
+    
+    # Analyze documents
+    if config.COMPARATIVE_STRATEGY not in ('single', 'map_reduce', 'hierarchical'):
+        raise ValueError(f"Unknown COMPARATIVE_STRATEGY: {config.COMPARATIVE_STRATEGY}")
+    if config.COMPARATIVE_STRATEGY == 'hierarchical':
+        clusters = config_manager.get_peer_clusters([c['ticker'] for c in companies_data])
+        job.set_progress(f"Summarizing {len(companies_data)} companies, then comparing {len(clusters)} peer groups")
+        analysis = analyzer.analyze_comparative_hierarchical(
+            companies_data,
+            clusters,
+            company_name_str,
+            reference_quarter,
+            reference_year,
+            tier=tier
+        )
+        if analysis.get('map_reduce', {}).get('failed_companies'):
+            messages.append(("warning", f"Some companies couldn't be summarized: {', '.join(analysis['map_reduce']['failed_companies'])}"))
+    elif config.COMPARATIVE_STRATEGY == 'map_reduce':
+        job.set_progress(f"Summarizing {len(companies_data)} companies, then comparing")
+        analysis = analyzer.analyze_comparative_map_reduce(
+            companies_data,
+            company_name_str,
+            reference_quarter,
+            reference_year,
+            tier=tier
+        )
+        if analysis.get('map_reduce', {}).get('failed_companies'):
+            messages.append(("warning", f"Some companies couldn't be summarized: {', '.join(analysis['map_reduce']['failed_companies'])}"))
+    else:
         analysis = analyzer.analyze_earnings_documents(
             combined_files,
             company_name_str,
             reference_quarter,
             reference_year,
             is_comparative=True,
-            companies=companies_data
+            companies=companies_data,
+            tier=tier
         )
+    
+    # Save analysis
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    tickers_str = "_".join([c['ticker'] for c in companies_data])
+    if len(tickers_str) > 50:  # Truncate if too long
+        tickers_str = tickers_str[:47] + "..."
+    
+    output_filename = f"COMPARATIVE_{tickers_str}_{reference_year}_{reference_quarter}_{timestamp}.md"
+    output_path = os.path.join(config.RESULTS_DIR, output_filename)
+    
+    report = analysis_text(analysis)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    
+    companies_count = len(companies_data)
+    messages.append(("success", f"Comparative analysis of {companies_count} companies has been completed and saved"))
+    return job_result(files=[output_filename], messages=messages)
+
+# Progress messages for the stages of a live analysis
+LIVE_STAGE_MESSAGES = {
+    'downloading': 'Downloading earnings documents...',
+    'uploading': 'Uploading documents to Gemini...',
+    'generating': 'Generating analysis...',
+    'saving': 'Saving analysis...'
+}
+
+def process_live_analysis(job, ticker, latency_tier=None):
+    """
+    Run a single company analysis, appending the report to the job output as it streams in.
+    
+    Live viewers tail the output and progress through /analysis-events/<job_id>.
+    """
+    company_info = config_manager.get_company(ticker)
+    if not company_info:
+        raise ValueError(f"Company ticker '{ticker}' not found")
+    tier = config_manager.get_latency_tier(latency_tier, ticker=ticker)
+    
+    job.set_progress(LIVE_STAGE_MESSAGES['downloading'])
+    download_result = downloader.download_latest_earnings(ticker)
+    
+    if not download_result or not download_result['files']:
+        raise ValueError(f"No documents available for {ticker}. Please check IR site.")
+    
+    job.check_cancelled()
+    
+    # Stream the analysis into the job output, chunk by chunk
+    chunks = analyzer.analyze_earnings_documents_stream(
+        download_result['files'],
+        company_info['name'],
+        download_result['quarter'],
+        download_result['year'],
+        on_stage=lambda stage: job.set_progress(LIVE_STAGE_MESSAGES.get(stage, stage)),
+        tier=tier
+    )
+    try:
+        while True:
+            try:
+                job.append_output(next(chunks))
+            except StopIteration as stop:
+                analysis = stop.value
+                break
+            job.check_cancelled()
+    finally:
+        chunks.close()
+    
+    # Save analysis
+    job.set_progress(LIVE_STAGE_MESSAGES['saving'])
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"{ticker}_{download_result['year']}_{download_result['quarter']}_{timestamp}.md"
+    output_path = os.path.join(config.RESULTS_DIR, output_filename)
+    
+    report = analysis_text(analysis)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    
+    return job_result(
+        files=[output_filename],
+        messages=[("success", f"Analysis for {company_info['name']} has been completed and saved")]
+    )
+
+# Run analyses on a bounded background worker pool so requests return immediately
+job_queue = JobQueue()
+job_queue.register('single', process_single_company)
+job_queue.register('batch', process_multiple_companies_batch)
+job_queue.register('comparative', process_multiple_companies_comparative)
+job_queue.register('live', process_live_analysis)
+job_queue.start()
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Show the progress of a queued analysis"""
+    job = job_queue.get(job_id)
+    if not job:
+        flash("Analysis job not found", "error")
+        return redirect(url_for('index'))
+    
+    # Once finished, report the outcome the same way a synchronous run would
+    if job['status'] == 'succeeded':
+        for message in job['result']['messages']:
+            flash(message['text'], message['category'])
         
-        # Save analysis
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        tickers_str = "_".join([c['ticker'] for c in companies_data])
-        if len(tickers_str) > 50:  # Truncate if too long
-            tickers_str = tickers_str[:47] + "..."
-        
-        output_filename = f"COMPARATIVE_{tickers_str}_{reference_year}_{reference_quarter}_{timestamp}.md"
-        output_path = os.path.join(config.RESULTS_DIR, output_filename)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else str(analysis))
-        
-        companies_count = len(companies_data)
-        flash(f"Comparative analysis of {companies_count} companies has been completed and saved", "success")
-        session['last_analysis'] = output_path
-        
-        return redirect(url_for('view_analysis', filename=output_filename))
+        files = job['result']['files']
+        if job['result']['redirect_to'] == 'view_analysis' and files:
+            session['last_analysis'] = os.path.join(config.RESULTS_DIR, files[0])
+            return redirect(url_for('view_analysis', filename=files[0]))
+        return redirect(url_for('analyses'))
     
-    except Exception as e:
-        logging.error(f"Error running comparative analysis: {str(e)}")
-        flash(f"Error running comparative analysis: {str(e)}", "error")
+    return render_template('job_status.html', job=job)
+
+@app.route('/api/jobs/<job_id>')
+def job_status_api(job_id):
+    """Return the state of a queued analysis as JSON"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Tell the client where to go once the job is done
+    if job['status'] == 'succeeded' and job['result']:
+        files = job['result']['files']
+        if job['result']['redirect_to'] == 'view_analysis' and files:
+            job['next_url'] = url_for('view_analysis', filename=files[0])
+        else:
+            job['next_url'] = url_for('analyses')
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running analysis"""
+    cancelled = job_queue.cancel(job_id)
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id, 'cancelled': cancelled})
+    
+    if cancelled:
+        flash("Cancellation requested", "warning")
+    else:
+        flash("Job has already finished", "error")
+    return redirect(url_for('job_status', job_id=job_id))
+
+def format_sse(event, data, event_id=None):
+    """Format a Server-Sent Events message"""
+    message = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{message}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/live-analysis/<job_id>')
+def live_analysis(job_id):
+    """View an analysis job's report while it is being generated"""
+    job = job_queue.get(job_id)
+    if not job:
+        flash("Analysis job not found", "error")
         return redirect(url_for('index'))
+    if job['kind'] != 'live':
+        return redirect(url_for('job_status', job_id=job_id))
+    
+    company_info = config_manager.get_company(job['params']['ticker']) or {'name': job['params']['ticker']}
+    return render_template('view_analysis.html',
+                        content='',
+                        raw_content='',
+                        filename=f"{company_info['name']} (live)",
+                        stream_url=url_for('analysis_events', job_id=job_id))
+
+@app.route('/analysis-events/<job_id>')
+def analysis_events(job_id):
+    """
+    Stream a live analysis job's progress and partial markdown as Server-Sent Events.
+    
+    The endpoint only reads the job; the analysis runs on the job queue. Each
+    chunk's event id is '<attempt>:<length of the output sent so far>', so a
+    reconnecting EventSource (Last-Event-ID) resumes where it left off. When a
+    job was requeued its output starts over; the client is sent a 'reset'
+    event and the new attempt streams from the beginning. Connections close
+    after SSE_CONNECTION_SECONDS and the browser reconnects, so a stream never
+    holds a server worker for the length of a model call.
+    """
+    try:
+        last_attempt, offset = (int(part) for part in request.headers.get('Last-Event-ID', '').split(':'))
+    except ValueError:
+        last_attempt, offset = None, 0
+    
+    if not job_queue.read_output(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        nonlocal last_attempt, offset
+        progress = None
+        started = time.monotonic()
+        idle_since = started
+        yield f"retry: {config.SSE_RETRY_MILLISECONDS}\n\n"
+        
+        while time.monotonic() - started < config.SSE_CONNECTION_SECONDS:
+            status, job_progress, attempt, output = job_queue.read_output(job_id, offset)
+            if last_attempt is not None and attempt != last_attempt:
+                # The job was requeued and its output starts over
+                offset = 0
+                yield format_sse('reset', {'attempt': attempt})
+                status, job_progress, attempt, output = job_queue.read_output(job_id, offset)
+            last_attempt = attempt
+            
+            if job_progress and job_progress != progress:
+                progress = job_progress
+                yield format_sse('stage', {'stage': progress})
+            if output:
+                offset += len(output)
+                idle_since = time.monotonic()
+                yield format_sse('chunk', {'text': output}, event_id=f"{attempt}:{offset}")
+            
+            if status == 'succeeded':
+                job = job_queue.get(job_id)
+                files = job['result']['files']
+                url = url_for('view_analysis', filename=files[0]) if files else url_for('analyses')
+                yield format_sse('done', {'url': url})
+                return
+            if status in ('failed', 'cancelled'):
+                job = job_queue.get(job_id)
+                yield format_sse('failed', {'message': job['error'] or f"Analysis {status}"})
+                return
+            
+            if time.monotonic() - idle_since >= 15:
+                # Keep proxies and the browser from closing an idle connection
+                idle_since = time.monotonic()
+                yield ": keepalive\n\n"
+            time.sleep(config.SSE_POLL_INTERVAL_SECONDS)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 def render_markdown(content):
     """Convert markdown content to HTML for display"""
@@ -326,6 +636,7 @@ def view_analysis(filename):
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
+        downloader.storage_manager.touch(file_path)
         
         # Convert markdown to HTML
         html_content = render_markdown(content)
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+from file_hashing import file_sha256, register_sha256
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+# Blobs and the manifest live in this hidden subdirectory of the downloads directory
+BLOB_DIRNAME = '.blobs'
+MANIFEST_FILENAME = 'manifest.json'
+
+class BlobStore:
+    """
+    Content-addressed store for downloaded documents.
+
+    Each distinct document is kept once as .blobs/<sha256[:2]>/<sha256>, and
+    the usual downloads/<ticker>/<year>_<quarter>/<filename> paths are hard
+    links to it, so the same PDF fetched from several URLs or under a custom
+    ticker takes disk space once. A manifest maps every download path to its
+    SHA-256 and source URL; analyses, uploads and caches can look documents
+    up by content instead of hashing them again.
+
+    Blobs are never modified in place: a re-issued document becomes a new
+    blob, and blobs no path links to any more are removed by forget() when
+    their downloads are deleted, or by verify(repair=True).
+
+    The manifest on disk is shared between processes and always read from
+    disk; every change is a read-modify-write under an exclusive lock.
+    """
+
+    def __init__(self, storage_path=None, enabled=None):
+        self.storage_path = storage_path or config.LOCAL_STORAGE_PATH
+        self.blob_dir = os.path.join(self.storage_path, BLOB_DIRNAME)
+        self.manifest_path = os.path.join(self.blob_dir, MANIFEST_FILENAME)
+        self.lock_path = f"{self.manifest_path}.lock"
+        self.enabled = config.BLOB_STORE_ENABLED if enabled is None else enabled
+        # Fallback for platforms without fcntl (only protects a single process)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Load the manifest from disk."""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read blob manifest {self.manifest_path}: {e}")
+            return {}
+
+    def _write(self, entries):
+        """Atomically replace the manifest with the given entries. Call with the manifest lock held."""
+        try:
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            logging.warning(f"Could not save blob manifest {self.manifest_path}: {e}")
+
+    @contextmanager
+    def _locked_manifest(self):
+        """Load the manifest under an exclusive lock and save it on exit."""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = self._load()
+                yield entries
+                self._write(entries)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def blob_path(self, sha256):
+        """Return the location of the blob holding the given content."""
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def _relpath(self, file_path):
+        return os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.storage_path))
+
+    def add(self, file_path, sha256=None, url=None):
+        """
+        Store a downloaded file and record it in the manifest.
+
+        If the content is already stored, file_path is replaced by a link to
+        the existing blob; otherwise the file becomes the new blob.
+
+        Args:
+            file_path (str): Path of the downloaded file under the storage path
+            sha256 (str): Digest of the file, if already known
+            url (str): URL the file was downloaded from
+
+        Returns:
+            str: SHA-256 of the file
+        """
+        sha256 = sha256 or file_sha256(file_path)
+        if not self.enabled:
+            return sha256
+
+        blob_path = self.blob_path(sha256)
+        linked = True
+        try:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if not os.path.exists(blob_path):
+                os.link(file_path, blob_path)
+            elif not os.path.samefile(file_path, blob_path):
+                self._link(blob_path, file_path)
+                logging.info(f"{file_path} duplicates a stored document, linked to blob {sha256[:12]}")
+        except OSError as e:
+            # e.g. a filesystem without hard links; the file is still tracked by content
+            logging.warning(f"Could not link {file_path} into the blob store: {e}")
+            linked = False
+
+        register_sha256(file_path, sha256)
+        entry = {
+            'sha256': sha256,
+            'url': url,
+            'size': os.path.getsize(file_path),
+            'linked': linked,
+            'added_at': time.time()
+        }
+        with self._locked_manifest() as entries:
+            entries[self._relpath(file_path)] = entry
+        return sha256
+
+    def link(self, sha256, file_path, url=None):
+        """
+        Materialize a stored document at file_path without downloading it.
+
+        Args:
+            sha256 (str): Digest of the stored document
+            file_path (str): Path to create under the storage path
+            url (str): URL the document is known under
+
+        Returns:
+            bool: True if the link was created
+        """
+        blob_path = self.blob_path(sha256)
+        if not self.enabled or not os.path.exists(blob_path):
+            return False
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            self._link(blob_path, file_path)
+        except OSError as e:
+            logging.warning(f"Could not link blob {sha256[:12]} to {file_path}: {e}")
+            return False
+        self.add(file_path, sha256, url)
+        return True
+
+    def _link(self, blob_path, file_path):
+        """Atomically replace file_path with a hard link to blob_path."""
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.link"
+        os.link(blob_path, tmp_path)
+        os.replace(tmp_path, file_path)
+
+    def forget(self, file_paths):
+        """
+        Drop deleted download paths from the manifest and remove blobs nothing links to any more.
+
+        Args:
+            file_paths (list): Paths that were deleted
+
+        Returns:
+            int: Number of blobs removed
+        """
+        paths = {self._relpath(file_path) for file_path in file_paths}
+        with self._locked_manifest() as entries:
+            forgotten = [entries.pop(path) for path in paths if path in entries]
+
+        removed = 0
+        for sha256 in {entry['sha256'] for entry in forgotten}:
+            blob_path = self.blob_path(sha256)
+            try:
+                if os.stat(blob_path).st_nlink == 1:
+                    os.remove(blob_path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def entries(self):
+        """
+        Return the manifest.
+
+        Returns:
+            dict: Maps each download path (relative to the storage path) to an
+                  entry with 'sha256', 'url', 'size', 'linked' and 'added_at'
+        """
+        return self._load()
+
+    def entry(self, file_path):
+        """Return the manifest entry of a download path, or None."""
+        return self._load().get(self._relpath(file_path))
+
+    def find_by_url(self, url):
+        """
+        Find a stored document previously downloaded from url.
+
+        Returns:
+            dict: Manifest entry plus its absolute 'path', or None
+        """
+        for path, entry in self.entries().items():
+            if entry.get('url') == url and os.path.exists(self.blob_path(entry['sha256'])):
+                return dict(entry, path=os.path.join(self.storage_path, path))
+        return None
+
+    def paths_for(self, sha256):
+        """Return the absolute download paths that hold the given content."""
+        return [os.path.join(self.storage_path, path) for path, entry in self.entries().items()
+                if entry['sha256'] == sha256]
+
+    def digest(self, file_path):
+        """
+        Return the SHA-256 of a download from the manifest, without reading it.
+
+        Returns:
+            str: Digest if file_path is still linked to its blob, otherwise None
+        """
+        entry = self.entry(file_path)
+        if not entry or not os.path.exists(file_path):
+            return None
+        try:
+            if not os.path.samefile(file_path, self.blob_path(entry['sha256'])):
+                return None
+        except OSError:
+            return None
+        register_sha256(file_path, entry['sha256'])
+        return entry['sha256']
+
+    def verify(self, repair=False):
+        """
+        Check the integrity of the store and the download paths.
+
+        Every blob is re-hashed and compared with its name, and every manifest
+        path is checked against its blob. With repair, corrupt blobs and the
+        paths linked to them are deleted (so they are downloaded again),
+        manifest entries of missing paths are dropped, modified or untracked
+        downloads are (re)added, and blobs no path links to are removed.
+
+        Args:
+            repair (bool): Fix the problems found
+
+        Returns:
+            dict: 'blobs' and 'paths' checked, plus lists of 'corrupt_blobs',
+                  'unreferenced_blobs', 'missing_paths', 'modified_paths' and
+                  'untracked_paths'
+        """
+        entries = self.entries()
+        report = {
+            'blobs': 0, 'paths': len(entries), 'corrupt_blobs': [], 'unreferenced_blobs': [],
+            'missing_paths': [], 'modified_paths': [], 'untracked_paths': []
+        }
+
+        for blob_path in self._blob_paths():
+            report['blobs'] += 1
+            sha256 = os.path.basename(blob_path)
+            if file_sha256(blob_path) != sha256:
+                report['corrupt_blobs'].append(sha256)
+            elif os.stat(blob_path).st_nlink == 1:
+                report['unreferenced_blobs'].append(sha256)
+
+        for path, entry in sorted(entries.items()):
+            file_path = os.path.join(self.storage_path, path)
+            if not os.path.exists(file_path):
+                report['missing_paths'].append(path)
+            elif entry['sha256'] in report['corrupt_blobs']:
+                continue
+            elif self.digest(file_path) is None and file_sha256(file_path) != entry['sha256']:
+                report['modified_paths'].append(path)
+
+        for file_path in self._download_paths():
+            if self._relpath(file_path) not in entries:
+                report['untracked_paths'].append(self._relpath(file_path))
+
+        if repair:
+            self._repair(entries, report)
+        return report
+
+    def _repair(self, entries, report):
+        """Fix the problems listed in a verify report."""
+        corrupt = set(report['corrupt_blobs'])
+        dropped = set(report['missing_paths'])
+        for path, entry in entries.items():
+            if entry['sha256'] in corrupt:
+                logging.warning(f"Removing {path}: its stored content is corrupt")
+                _remove(os.path.join(self.storage_path, path))
+                dropped.add(path)
+        for sha256 in corrupt | set(report['unreferenced_blobs']):
+            _remove(self.blob_path(sha256))
+
+        with self._locked_manifest() as on_disk:
+            for path in dropped:
+                on_disk.pop(path, None)
+
+        for path in report['modified_paths'] + report['untracked_paths']:
+            file_path = os.path.join(self.storage_path, path)
+            url = (entries.get(path) or {}).get('url')
+            self.add(file_path, url=url)
+
+    def _blob_paths(self):
+        """Yield the path of every stored blob."""
+        if not os.path.isdir(self.blob_dir):
+            return
+        for prefix in sorted(os.listdir(self.blob_dir)):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            if len(prefix) == 2 and os.path.isdir(prefix_dir):
+                for name in sorted(os.listdir(prefix_dir)):
+                    if not name.endswith('.tmp'):
+                        yield os.path.join(prefix_dir, name)
+
+    def _download_paths(self):
+        """Yield every downloaded document, skipping hidden directories and partial files."""
+        for root, dirs, files in os.walk(self.storage_path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for filename in sorted(files):
+                if not filename.startswith('.') and not filename.endswith(('.part', '.tmp', '.link')):
+                    yield os.path.join(root, filename)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -24,6 +24,131 @@ PROMPT_CONFIG_PATH = os.getenv('PROMPT_CONFIG_PATH', os.path.join(BASE_DIR, 'con
 # API Keys
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# Caching
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(CACHE_DIR, 'results'))
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '100'))
+RESULT_CACHE_MAX_AGE_HOURS = float(os.getenv('RESULT_CACHE_MAX_AGE_HOURS', '168'))
+
+# Gemini Files API uploads
+DOCUMENT_UPLOAD_ENABLED = os.getenv('DOCUMENT_UPLOAD_ENABLED', 'true').lower() == 'true'
+DOCUMENT_REGISTRY_PATH = os.getenv('DOCUMENT_REGISTRY_PATH', os.path.join(CACHE_DIR, 'document_registry.json'))
+DOCUMENT_UPLOAD_REFRESH_MARGIN_MINUTES = float(os.getenv('DOCUMENT_UPLOAD_REFRESH_MARGIN_MINUTES', '60'))
+# Give up on an upload the Files API is still processing after this long (the document is sent inline)
+DOCUMENT_UPLOAD_PROCESSING_TIMEOUT_SECONDS = float(os.getenv('DOCUMENT_UPLOAD_PROCESSING_TIMEOUT_SECONDS', '300'))
+
+# Gemini context caching of shared document prefixes
+CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+CONTEXT_CACHE_REGISTRY_PATH = os.getenv('CONTEXT_CACHE_REGISTRY_PATH', os.path.join(CACHE_DIR, 'context_cache.json'))
+CONTEXT_CACHE_TTL_MINUTES = float(os.getenv('CONTEXT_CACHE_TTL_MINUTES', '60'))
+
+# Maximum concurrent Gemini analyses for EarningsAnalyzer.analyze_many_async
+ANALYSIS_CONCURRENCY = int(os.getenv('ANALYSIS_CONCURRENCY', '4'))
+
+# How documents are sent to Gemini: 'file' sends the original PDFs, 'text' sends locally extracted text,
+# 'retrieval' sends only the top index passages for each report section
+DOCUMENT_INGESTION_MODE = os.getenv('DOCUMENT_INGESTION_MODE', 'file')
+TEXT_EXTRACTION_WORKERS = int(os.getenv('TEXT_EXTRACTION_WORKERS', str(os.cpu_count() or 2)))
+TEXT_EXTRACTION_MIN_CHARS = int(os.getenv('TEXT_EXTRACTION_MIN_CHARS', '500'))
+
+# Relevance pre-pass that sends only the top pages of each earnings release
+PAGE_FILTER_ENABLED = os.getenv('PAGE_FILTER_ENABLED', 'true').lower() == 'true'
+PAGE_FILTER_BUDGET = int(os.getenv('PAGE_FILTER_BUDGET', '8'))
+
+# Local BM25 retrieval index over downloaded filings (used by the 'retrieval' ingestion mode)
+RETRIEVAL_INDEX_DIR = os.getenv('RETRIEVAL_INDEX_DIR', os.path.join(CACHE_DIR, 'retrieval_index'))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '6'))
+RETRIEVAL_CHUNK_WORDS = int(os.getenv('RETRIEVAL_CHUNK_WORDS', '180'))
+RETRIEVAL_CHUNK_OVERLAP_WORDS = int(os.getenv('RETRIEVAL_CHUNK_OVERLAP_WORDS', '40'))
+
+# Gemini quota guard shared by all threads and worker processes on this host
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STATE_PATH = os.getenv('RATE_LIMIT_STATE_PATH', os.path.join(CACHE_DIR, 'rate_limit.json'))
+RATE_LIMIT_REQUESTS_PER_MINUTE = float(os.getenv('RATE_LIMIT_REQUESTS_PER_MINUTE', '150'))
+RATE_LIMIT_TOKENS_PER_MINUTE = float(os.getenv('RATE_LIMIT_TOKENS_PER_MINUTE', '2000000'))
+RATE_LIMIT_ESTIMATED_TOKENS_PER_REQUEST = int(os.getenv('RATE_LIMIT_ESTIMATED_TOKENS_PER_REQUEST', '50000'))
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv('RETRY_BASE_DELAY_SECONDS', '2'))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv('RETRY_MAX_DELAY_SECONDS', '60'))
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN_SECONDS', '60'))
+
+# Pre-flight token counting and input budget ('drop' trims low-priority documents, 'fail' aborts)
+TOKEN_COUNTING_ENABLED = os.getenv('TOKEN_COUNTING_ENABLED', 'true').lower() == 'true'
+INPUT_TOKEN_BUDGET = int(os.getenv('INPUT_TOKEN_BUDGET', '900000'))
+INPUT_TOKEN_BUDGET_POLICY = os.getenv('INPUT_TOKEN_BUDGET_POLICY', 'drop')
+TOKEN_COUNT_CACHE_PATH = os.getenv('TOKEN_COUNT_CACHE_PATH', os.path.join(CACHE_DIR, 'token_counts.json'))
+ESTIMATED_OUTPUT_TOKENS = int(os.getenv('ESTIMATED_OUTPUT_TOKENS', '8000'))
+INPUT_TOKEN_PRICE_PER_MILLION = float(os.getenv('INPUT_TOKEN_PRICE_PER_MILLION', '1.25'))
+OUTPUT_TOKEN_PRICE_PER_MILLION = float(os.getenv('OUTPUT_TOKEN_PRICE_PER_MILLION', '10'))
+
+# Document downloads: pooled HTTP session retries and bulk download limits (overall and per host)
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', '8'))
+DOWNLOAD_PER_HOST_CONCURRENCY = int(os.getenv('DOWNLOAD_PER_HOST_CONCURRENCY', '2'))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '3'))
+DOWNLOAD_RETRY_BACKOFF_SECONDS = float(os.getenv('DOWNLOAD_RETRY_BACKOFF_SECONDS', '0.5'))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv('DOWNLOAD_TIMEOUT_SECONDS', '30'))
+DOWNLOAD_CHUNK_BYTES = int(os.getenv('DOWNLOAD_CHUNK_BYTES', str(1024 * 1024)))
+# Revalidate existing downloads with a conditional GET: 'never', 'if_stale' (older than
+# DOWNLOAD_STALE_AFTER_HOURS) or 'always'
+DOWNLOAD_REFRESH_POLICY = os.getenv('DOWNLOAD_REFRESH_POLICY', 'if_stale')
+DOWNLOAD_STALE_AFTER_HOURS = float(os.getenv('DOWNLOAD_STALE_AFTER_HOURS', '24'))
+# Keep each distinct document once under downloads/.blobs/ with download paths hard-linked to it
+BLOB_STORE_ENABLED = os.getenv('BLOB_STORE_ENABLED', 'true').lower() == 'true'
+
+# Disk quota (MB, 0 disables it) for downloads, reports and derived artifacts; least recently used
+# items are evicted first and each ticker's latest quarter is kept
+STORAGE_QUOTA_MB = float(os.getenv('STORAGE_QUOTA_MB', '2048'))
+# Items used this recently may still be read by a running analysis and are never evicted
+STORAGE_IN_USE_SECONDS = float(os.getenv('STORAGE_IN_USE_SECONDS', '1800'))
+STORAGE_ACCESS_LOG_PATH = os.getenv('STORAGE_ACCESS_LOG_PATH', os.path.join(CACHE_DIR, 'storage_access.json'))
+
+# Background analysis jobs
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(BASE_DIR, 'jobs', 'jobs.db'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', '2'))
+JOB_STALE_AFTER_SECONDS = float(os.getenv('JOB_STALE_AFTER_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+# Live analysis streams: each SSE connection ends after SSE_CONNECTION_SECONDS (kept below the
+# gunicorn worker timeout) and the browser reconnects, resuming from the last chunk it received
+SSE_CONNECTION_SECONDS = float(os.getenv('SSE_CONNECTION_SECONDS', '20'))
+SSE_POLL_INTERVAL_SECONDS = float(os.getenv('SSE_POLL_INTERVAL_SECONDS', '0.5'))
+SSE_RETRY_MILLISECONDS = int(os.getenv('SSE_RETRY_MILLISECONDS', '1000'))
+
+# Latency tier to use when a run does not choose one (tiers are defined in company_config.json)
+LATENCY_TIER = os.getenv('LATENCY_TIER')
+
+# Continuation calls allowed to finish a response cut off by the output token limit
+MAX_CONTINUATIONS = int(os.getenv('MAX_CONTINUATIONS', '3'))
+
+# Per-call deadline for Gemini requests (0 disables it) and hedged duplicate requests sent when a call
+# runs past the model's HEDGE_PERCENTILE latency (HEDGE_DELAY_SECONDS until HEDGE_MIN_SAMPLES calls are timed)
+GENERATION_DEADLINE_SECONDS = float(os.getenv('GENERATION_DEADLINE_SECONDS', '600'))
+HEDGING_ENABLED = os.getenv('HEDGING_ENABLED', 'false').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_DELAY_SECONDS = float(os.getenv('HEDGE_DELAY_SECONDS', '120'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_FALLBACK_MODEL = os.getenv('HEDGE_FALLBACK_MODEL', '')
+
+# Two-stage triage: a cheap screening call scores materiality (0-10) and the full analysis
+# only runs at or above the threshold
+TRIAGE_ENABLED = os.getenv('TRIAGE_ENABLED', 'false').lower() == 'true'
+TRIAGE_TIER = os.getenv('TRIAGE_TIER', 'fast')
+TRIAGE_THRESHOLD = float(os.getenv('TRIAGE_THRESHOLD', '4'))
+
+# Generate each '## ' report section as its own concurrent call, retrying failed sections this many times
+SECTION_PARALLEL_GENERATION = os.getenv('SECTION_PARALLEL_GENERATION', 'false').lower() == 'true'
+SECTION_RETRY_ATTEMPTS = int(os.getenv('SECTION_RETRY_ATTEMPTS', '1'))
+
+# Comparative analyses: 'single' sends every document in one call; opt in to 'map_reduce' to compare all
+# cached per-company summaries at once, or 'hierarchical' to compare within peer clusters and then across them
+COMPARATIVE_STRATEGY = os.getenv('COMPARATIVE_STRATEGY', 'single')
+# Cluster size used when company_config.json does not set comparison.max_cluster_size
+MAX_PEER_CLUSTER_SIZE = int(os.getenv('MAX_PEER_CLUSTER_SIZE', '5'))
+
 # Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -110,6 +110,75 @@ class ConfigManager:
         first_quarter = sorted(quarters.keys())[0]
         return latest_year, first_quarter, quarters[first_quarter]
     
+    def get_latency_tiers(self):
+        """Get the latency tier definitions by name."""
+        return self.config_data.get("latency_tiers", {}).get("tiers", {})
+    
+    def get_latency_tier(self, name=None, ticker=None):
+        """
+        Resolve the latency tier to use for an analysis.
+        
+        The tier is chosen, in order, by name, by the company's "latency_tier"
+        entry, by the LATENCY_TIER environment variable, and finally by the
+        config's "default_tier".
+        
+        Args:
+            name (str, optional): Tier name chosen for this run
+            ticker (str, optional): Company ticker, for its configured tier
+        
+        Returns:
+            dict: Tier settings ('model', 'thinking_budget', 'max_output_tokens',
+                  'temperature') plus its 'name', or None if no tier is configured
+        """
+        tiers = self.get_latency_tiers()
+        if not name and ticker:
+            name = (self.get_company(ticker) or {}).get("latency_tier")
+        name = name or config.LATENCY_TIER or self.config_data.get("latency_tiers", {}).get("default_tier")
+        if not name:
+            return None
+        if name not in tiers:
+            raise ValueError(f"Unknown latency tier '{name}'. Available tiers: {', '.join(tiers) or 'none'}")
+        return dict(tiers[name], name=name)
+    
+    def get_triage_tier(self):
+        """Get the latency tier used for triage screening, or None for the analyzer's default."""
+        return self.get_latency_tier(config.TRIAGE_TIER) if config.TRIAGE_TIER else None
+    
+    def get_peer_clusters(self, tickers):
+        """
+        Group tickers into the peer clusters used for hierarchical comparisons.
+
+        Clusters come from the "comparison" section of the config. Tickers not
+        listed in any cluster are grouped under "Other", and clusters larger
+        than max_cluster_size are split into evenly sized parts.
+
+        Args:
+            tickers (list): Ticker symbols to group
+
+        Returns:
+            list: Dicts with 'name' and 'tickers' (lowercase), in config order
+        """
+        comparison = self.config_data.get("comparison", {})
+        max_size = max(int(comparison.get("max_cluster_size", config.MAX_PEER_CLUSTER_SIZE)), 1)
+
+        remaining = list(dict.fromkeys(ticker.lower() for ticker in tickers))
+        groups = []
+        for cluster_id, cluster in comparison.get("peer_clusters", {}).items():
+            members = [ticker for ticker in remaining if ticker in {t.lower() for t in cluster.get("tickers", [])}]
+            if members:
+                groups.append((cluster.get("name", cluster_id), members))
+                remaining = [ticker for ticker in remaining if ticker not in members]
+        if remaining:
+            groups.append(("Other", remaining))
+
+        clusters = []
+        for name, members in groups:
+            parts = -(-len(members) // max_size)
+            for part in range(parts):
+                part_name = name if parts == 1 else f"{name} (part {part + 1} of {parts})"
+                clusters.append({"name": part_name, "tickers": members[part::parts]})
+        return clusters
+
     def add_or_update_company(self, ticker, name, ir_site):
         """Add a new company or update an existing one."""
         ticker = ticker.lower()
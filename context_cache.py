@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from google.genai import types
+from google.genai import errors
+
+import config
+from file_hashing import file_sha256
+
+class ContextCache:
+    """
+    Manages Gemini cached-content objects for shared document prefixes.
+
+    A document set (the labelled documents for one ticker, or for a group of
+    tickers in a comparative run) is cached once per model. Every prompt
+    variant sent over the same documents then references the cached content
+    instead of paying full input-token cost and prefill latency again, until
+    the cache's TTL expires. A document set the API refused to cache (e.g.
+    below the minimum cacheable size) is remembered for the TTL too, so the
+    failing create call is not repeated on every request; transient errors
+    are retried on the next request.
+    """
+
+    def __init__(self, client, registry_path=None, ttl_minutes=None, enabled=None, rate_limiter=None):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.registry_path = registry_path or config.CONTEXT_CACHE_REGISTRY_PATH
+        self.ttl_seconds = int((ttl_minutes if ttl_minutes is not None else config.CONTEXT_CACHE_TTL_MINUTES) * 60)
+        self.enabled = config.CONTEXT_CACHE_ENABLED if enabled is None else enabled
+
+        self.hits = 0
+        self.creates = 0
+        self.failures = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._create_locks = {}
+        self._records = self._load()
+
+    @staticmethod
+    def make_key(model, resolved_documents):
+        """
+        Build a key identifying a document set for a model.
+
+        Args:
+            model (str): Gemini model id
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+
+        Returns:
+            str: Hex-encoded SHA-256 key
+        """
+        key_material = {
+            'model': model,
+            'documents': [[label, file_sha256(file_path)] for _, file_path, label in resolved_documents]
+        }
+        return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read context cache registry {self.registry_path}: {e}")
+            return {}
+
+    def _save(self):
+        """Persist live records, merging records written by other processes."""
+        now = time.time()
+        merged = self._load()
+        for key, record in self._records.items():
+            if record.get('expires_at', 0) >= merged.get(key, {}).get('expires_at', 0):
+                merged[key] = record
+        self._write({key: record for key, record in merged.items() if record.get('expires_at', 0) > now})
+
+    def _write(self, records):
+        """Atomically replace the registry file with the given records."""
+        self._records = records
+        try:
+            os.makedirs(os.path.dirname(self.registry_path), exist_ok=True)
+            tmp_path = f"{self.registry_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2)
+            os.replace(tmp_path, self.registry_path)
+        except OSError as e:
+            logging.warning(f"Could not save context cache registry {self.registry_path}: {e}")
+
+    def _is_fresh(self, record):
+        # Leave a minute of headroom so the cache cannot expire mid-request
+        return record.get('expires_at', 0) - time.time() > 60
+
+    def get_or_create(self, model, resolved_documents, build_parts):
+        """
+        Return the name of a live cached-content object for a document set.
+
+        Args:
+            model (str): Gemini model id
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+            build_parts (callable): Called with resolved_documents to build the
+                                    document parts when a new cache is needed
+
+        Returns:
+            str: Cached content name, or None if caching is disabled or failed
+        """
+        if not self.enabled or not resolved_documents:
+            return None
+
+        key = self.make_key(model, resolved_documents)
+
+        with self._lock:
+            create_lock = self._create_locks.setdefault(key, threading.Lock())
+
+        with create_lock:
+            with self._lock:
+                record = self._records.get(key)
+            if not (record and self._is_fresh(record)):
+                # Another worker process may have created the cache already
+                record = self._load().get(key)
+
+            if record and self._is_fresh(record) and record.get('failed'):
+                with self._lock:
+                    self._records[key] = record
+                    self.skipped += 1
+                logging.debug("Context cache creation failed recently for this document set, sending it uncached")
+                return None
+
+            if record and self._is_fresh(record):
+                with self._lock:
+                    self._records[key] = record
+                    self.hits += 1
+                logging.info(f"Reusing context cache {record['name']} ({record.get('token_count', 0)} tokens)")
+                return record['name']
+
+            def create():
+                return self.client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role='user', parts=build_parts(resolved_documents))],
+                        ttl=f"{self.ttl_seconds}s",
+                        display_name=f"earnings-{key[:16]}"
+                    )
+                )
+
+            try:
+                cached_content = self.rate_limiter.call(create) if self.rate_limiter else create()
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    # The API refuses sets below the minimum cacheable size; don't retry until the TTL expires
+                    if isinstance(e, errors.ClientError) and e.code == 400:
+                        self._records[key] = {
+                            'name': None,
+                            'failed': True,
+                            'error': str(e)[:200],
+                            'model': model,
+                            'created_at': time.time(),
+                            'expires_at': time.time() + self.ttl_seconds
+                        }
+                        self._save()
+                logging.warning(f"Could not create context cache, sending documents uncached: {str(e)}")
+                return None
+
+            token_count = 0
+            if cached_content.usage_metadata:
+                token_count = cached_content.usage_metadata.total_token_count or 0
+            if cached_content.expire_time:
+                expires_at = cached_content.expire_time.timestamp()
+            else:
+                expires_at = time.time() + self.ttl_seconds
+
+            record = {
+                'name': cached_content.name,
+                'model': model,
+                'documents': [label for _, _, label in resolved_documents],
+                'token_count': token_count,
+                'created_at': time.time(),
+                'expires_at': expires_at
+            }
+            with self._lock:
+                self._records[key] = record
+                self.creates += 1
+                self._save()
+
+            logging.info(f"Created context cache {cached_content.name} ({token_count} tokens, TTL {self.ttl_seconds}s)")
+            return cached_content.name
+
+    def invalidate(self, cache_name):
+        """Forget a cached-content object, e.g. after the API reports it missing."""
+        with self._lock:
+            merged = self._load()
+            merged.update(self._records)
+            self._write({key: record for key, record in merged.items() if record['name'] != cache_name})
+
+    def stats(self):
+        """Return reuse/create/failure counters for this process."""
+        with self._lock:
+            return {'hits': self.hits, 'creates': self.creates, 'failures': self.failures, 'skipped': self.skipped}
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+from google.genai import types
+
+import config
+from file_hashing import file_sha256
+
+# Uploaded files are kept by the Files API for 48 hours
+DEFAULT_FILE_TTL_SECONDS = 48 * 3600
+
+class DocumentRegistry:
+    """
+    Uploads local documents to the Gemini Files API once and remembers the
+    remote handle.
+
+    Records are keyed on the SHA-256 of the file content, so the same PDF is
+    uploaded only once no matter which path or analysis references it. A
+    record is reused until shortly before its remote expiry, after which the
+    file is transparently uploaded again.
+    """
+
+    def __init__(self, client, registry_path=None, enabled=None, refresh_margin_seconds=None,
+                 processing_timeout_seconds=None):
+        self.client = client
+        self.registry_path = registry_path or config.DOCUMENT_REGISTRY_PATH
+        self.enabled = config.DOCUMENT_UPLOAD_ENABLED if enabled is None else enabled
+        self.refresh_margin_seconds = (
+            refresh_margin_seconds if refresh_margin_seconds is not None
+            else config.DOCUMENT_UPLOAD_REFRESH_MARGIN_MINUTES * 60
+        )
+        self.processing_timeout_seconds = (
+            processing_timeout_seconds if processing_timeout_seconds is not None
+            else config.DOCUMENT_UPLOAD_PROCESSING_TIMEOUT_SECONDS
+        )
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._records = self._load()
+
+    def _load(self):
+        """Load the registry from disk."""
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read document registry {self.registry_path}: {e}")
+            return {}
+
+    def _save(self):
+        """Persist the registry, merging records written by other processes."""
+        self._write(self._merge(self._load()))
+
+    def _merge(self, on_disk):
+        """Add this process's records to on_disk where they expire no earlier than the stored ones."""
+        for sha256, record in self._records.items():
+            if record.get('expires_at', 0) >= on_disk.get(sha256, {}).get('expires_at', 0):
+                on_disk[sha256] = record
+        return on_disk
+
+    def _write(self, records):
+        """Atomically replace the registry file with the given records."""
+        self._records = records
+        try:
+            os.makedirs(os.path.dirname(self.registry_path), exist_ok=True)
+            tmp_path = f"{self.registry_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2)
+            os.replace(tmp_path, self.registry_path)
+        except OSError as e:
+            logging.warning(f"Could not save document registry {self.registry_path}: {e}")
+
+    def _is_fresh(self, record):
+        return record.get('expires_at', 0) - time.time() > self.refresh_margin_seconds
+
+    def get_remote_file(self, file_path, mime_type):
+        """
+        Return the remote file record for a local document, uploading it if needed.
+
+        Args:
+            file_path (str): Path to the local document
+            mime_type (str): MIME type of the document
+
+        Returns:
+            dict: Record with 'name', 'uri', 'mime_type', 'sha256' and 'expires_at'
+        """
+        sha256 = file_sha256(file_path)
+
+        # One lock per document so different files can upload concurrently
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(sha256, threading.Lock())
+
+        with upload_lock:
+            with self._lock:
+                record = self._records.get(sha256)
+            if record and self._is_fresh(record):
+                return record
+
+            # Another worker process may have uploaded the file in the meantime
+            record = self._load().get(sha256) or record
+            if record and self._is_fresh(record):
+                with self._lock:
+                    self._records[sha256] = record
+                return record
+
+            if record:
+                logging.info(f"Remote handle for {os.path.basename(file_path)} expired, re-uploading")
+
+            record = self._upload(file_path, mime_type, sha256)
+            with self._lock:
+                self._records[sha256] = record
+                self._save()
+            return record
+
+    def get_file_part(self, file_path, mime_type):
+        """
+        Build a content part that references the uploaded copy of a document.
+
+        Args:
+            file_path (str): Path to the local document
+            mime_type (str): MIME type of the document
+
+        Returns:
+            types.Part: Part referencing the remote file
+        """
+        record = self.get_remote_file(file_path, mime_type)
+        return types.Part.from_uri(file_uri=record['uri'], mime_type=record['mime_type'])
+
+    def get_record(self, file_path):
+        """Return the known remote file record for a local document without uploading it, or None."""
+        sha256 = file_sha256(file_path)
+        with self._lock:
+            record = self._records.get(sha256)
+        return record or self._load().get(sha256)
+
+    def invalidate(self, file_path):
+        """Forget the remote handle for a document so the next use re-uploads it."""
+        sha256 = file_sha256(file_path)
+        with self._lock:
+            self._records.pop(sha256, None)
+            on_disk = self._load()
+            if on_disk.pop(sha256, None):
+                self._write(self._merge(on_disk))
+
+    def _upload(self, file_path, mime_type, sha256):
+        """Upload a document and wait until the Files API has finished processing it."""
+        start_time = time.time()
+        uploaded = self.client.files.upload(
+            file=file_path,
+            config=types.UploadFileConfig(
+                mime_type=mime_type,
+                display_name=os.path.basename(file_path)
+            )
+        )
+
+        # Large PDFs are processed asynchronously before they can be referenced
+        while uploaded.state == types.FileState.PROCESSING:
+            if time.time() - start_time > self.processing_timeout_seconds:
+                raise TimeoutError(f"Files API still processing {file_path} after "
+                                   f"{self.processing_timeout_seconds:.0f}s")
+            time.sleep(1)
+            uploaded = self.client.files.get(name=uploaded.name)
+
+        if uploaded.state == types.FileState.FAILED:
+            raise RuntimeError(f"Files API failed to process {file_path}: {uploaded.error}")
+
+        if uploaded.expiration_time:
+            expires_at = uploaded.expiration_time.timestamp()
+        else:
+            expires_at = time.time() + DEFAULT_FILE_TTL_SECONDS
+
+        logging.info(f"Uploaded {os.path.basename(file_path)} as {uploaded.name} in {time.time() - start_time:.1f}s")
+
+        return {
+            'name': uploaded.name,
+            'uri': uploaded.uri,
+            'mime_type': uploaded.mime_type or mime_type,
+            'sha256': sha256,
+            'size_bytes': os.path.getsize(file_path),
+            'local_path': file_path,
+            'uploaded_at': datetime.now(timezone.utc).isoformat(),
+            'expires_at': expires_at
+        }
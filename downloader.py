@@ -1,12 +1,55 @@
 import os
+import re
+import json
+import time
+import base64
+import hashlib
+import threading
 import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urlparse
 import config
 from config_manager import ConfigManager
+from blob_store import BlobStore
+from storage_manager import StorageManager
 import logging
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+# Document types downloaded for each release
+DOCUMENT_TYPES = ('earnings_release', 'call_transcript')
+
+# HTTP status codes retried by the download session
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Download metadata sidecars are kept in this subdirectory of each download directory
+DOWNLOAD_META_DIRNAME = '.download_meta'
+
+# When existing downloads are revalidated against the server
+REFRESH_POLICIES = ('never', 'if_stale', 'always')
+
+# Downloads are streamed to <file>.part and renamed into place once verified
+PARTIAL_SUFFIX = '.part'
+
+class IncompleteDownloadError(IOError):
+    """Raised when a transfer ends short of, or differs from, what the server announced."""
+
+def metadata_path(file_path):
+    """Return the location of the metadata sidecar for a downloaded file."""
+    return os.path.join(os.path.dirname(file_path), DOWNLOAD_META_DIRNAME, f"{os.path.basename(file_path)}.json")
+
+def lock_path(file_path):
+    """Return the location of the lock file serializing downloads to a path."""
+    return os.path.join(os.path.dirname(file_path), DOWNLOAD_META_DIRNAME, f"{os.path.basename(file_path)}.lock")
+
 class EarningsDocDownloader:
-    def __init__(self, config_manager=None):
+    def __init__(self, config_manager=None, refresh_policy=None):
         # Try to use the configured storage path, but fall back to local directory if needed
         self.storage_path = config.LOCAL_STORAGE_PATH
         # Fallback: If the configured path is not writable, use a local directory
@@ -17,16 +60,88 @@ class EarningsDocDownloader:
             
         # Initialize config manager
         self.config_manager = config_manager or ConfigManager()
-        # Browser-like user agent to avoid 403 errors
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Pragma': 'no-cache',
-            'Cache-Control': 'no-cache',
-        }
+        
+        # Content-addressed copies of every download; download paths are links into it
+        self.blob_store = BlobStore(self.storage_path)
+        
+        # Disk quota with LRU eviction of old quarters, reports and derived artifacts
+        self.storage_manager = StorageManager(self.config_manager, self.blob_store, self.storage_path)
+        
+        # Revalidate existing downloads 'never', 'if_stale' (older than DOWNLOAD_STALE_AFTER_HOURS) or 'always'
+        self.refresh_policy = refresh_policy or config.DOWNLOAD_REFRESH_POLICY
+        if self.refresh_policy not in REFRESH_POLICIES:
+            raise ValueError(f"Unknown download refresh policy: {self.refresh_policy}")
+        self.stale_after_seconds = config.DOWNLOAD_STALE_AFTER_HOURS * 3600
+        # Keep-alive connections and retries shared by every download
+        self.session = self._build_session()
+        
+        # Concurrent downloads allowed per host, so bulk fetches stay polite
+        self.per_host_limit = max(1, config.DOWNLOAD_PER_HOST_CONCURRENCY)
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        
+        # One download per path at a time, across threads (and processes, via a lock file)
+        self._path_locks = {}
+        self._path_locks_lock = threading.Lock()
+    
+    def _build_session(self):
+        """
+        Create the pooled HTTP session, retrying throttled and failed responses.
+        
+        Dropped connections and timeouts are not retried here: _fetch retries
+        them itself so an interrupted transfer resumes, and two retry layers
+        would multiply the attempts.
+        """
+        session = requests.Session()
+        retry = Retry(
+            total=config.DOWNLOAD_RETRIES,
+            connect=0,
+            read=0,
+            other=0,
+            backoff_factor=config.DOWNLOAD_RETRY_BACKOFF_SECONDS,
+            status_forcelist=RETRYABLE_STATUS_CODES,
+            allowed_methods=frozenset(['HEAD', 'GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=config.DOWNLOAD_CONCURRENCY,
+            pool_maxsize=config.DOWNLOAD_CONCURRENCY,
+            max_retries=retry
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+            # Byte counts and ranges must refer to the file itself, not a compressed encoding of it
+            'Accept-Encoding': 'identity'
+        })
+        return session
+    
+    @contextmanager
+    def _host_slot(self, url):
+        """Hold one of the per-host download slots for url's host."""
+        host = urlparse(url).netloc.lower()
+        with self._host_slots_lock:
+            slot = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+        with slot:
+            yield
+    
+    @contextmanager
+    def _path_lock(self, file_path):
+        """Hold the exclusive lock on downloading to file_path and its partial file."""
+        with self._path_locks_lock:
+            thread_lock = self._path_locks.setdefault(file_path, threading.Lock())
+        path = lock_path(file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with thread_lock, open(path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
     
     def _create_directory_safely(self, directory):
         """Safely create a directory, handling errors gracefully."""
@@ -43,6 +158,9 @@ class EarningsDocDownloader:
         """
         Download a file from a URL and save it to the appropriate location.
         
+        An existing file is reused, or revalidated with a conditional GET when
+        the refresh policy calls for it; a re-issued document replaces it.
+        
         Args:
             url (str): URL to download
             ticker (str): Company ticker symbol
@@ -65,8 +183,8 @@ class EarningsDocDownloader:
             return None
         
         # Extract filename from URL or generate one
-            parsed_url = urlparse(url)
-                filename = os.path.basename(parsed_url.path)
+        parsed_url = urlparse(url)
+        filename = os.path.basename(parsed_url.path)
         
         # If filename is empty or doesn't have an extension, create a default one
         if not filename or '.' not in filename:
@@ -77,20 +195,153 @@ class EarningsDocDownloader:
         # Full path to save the file
         file_path = os.path.join(dir_path, filename)
             
-        # If file already exists, skip download
-        if os.path.exists(file_path):
+        # A document already downloaded from this URL under another path is linked, not fetched again
+        if not os.path.exists(file_path):
+            stored = self.blob_store.find_by_url(url)
+            if stored and self.blob_store.link(stored['sha256'], file_path, url):
+                logging.info(f"Linked {url} from the stored copy at {stored['path']}")
+                stored_metadata = self.get_metadata(stored['path'])
+                if stored_metadata:
+                    self._write_metadata(file_path, stored_metadata)
+        
+        # Reuse an existing file unless the refresh policy asks to revalidate it
+        metadata = self.get_metadata(file_path)
+        if os.path.exists(file_path) and not self._needs_revalidation(file_path, metadata):
             logging.info(f"File already exists at {file_path}")
+            # Known content needs no re-hashing by the analyzer and caches
+            self.blob_store.digest(file_path)
             return file_path
         
         # Download the file
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-            }
-            
-            # Check if URL is accessible before downloading
-            response = requests.head(url, headers=headers, timeout=10)
+            with self._host_slot(url):
+                fetched_path = self._fetch(url, file_path, metadata)
+            if fetched_path:
+                return fetched_path
+        except requests.exceptions.HTTPError as e:
+            if '403' in str(e):
+                if 'seekingalpha.com' in url:
+                    logging.warning(f"Access forbidden (403) for SeekingAlpha URL: {url}")
+                    logging.warning("SeekingAlpha requires subscription. Skipping this document.")
+                else:
+                    logging.warning(f"Access forbidden (403) for URL: {url}")
+            else:
+                logging.error(f"HTTP error downloading {url}: {e}")
+        except Exception as e:
+            logging.error(f"Error downloading {url}: {e}")
+        
+        # A failed revalidation keeps serving the copy we already have
+        if os.path.exists(file_path):
+            logging.warning(f"Could not revalidate {url}, using existing file {file_path}")
+            return file_path
+        return None
+    
+    def get_metadata(self, file_path):
+        """
+        Load the download metadata recorded for a file.
+        
+        Returns:
+            dict: 'url', 'etag', 'last_modified', 'content_length', 'sha256' and
+                  'fetched_at' (epoch seconds), or None if the file has no metadata
+        """
+        try:
+            with open(metadata_path(file_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _write_metadata(self, file_path, metadata):
+        """Atomically write the metadata sidecar of a downloaded file."""
+        path = metadata_path(file_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write download metadata for {file_path}: {e}")
+    
+    def _needs_revalidation(self, file_path, metadata):
+        """Whether an existing download should be checked against the server under the refresh policy."""
+        if not self._is_intact(file_path, metadata):
+            logging.warning(f"{file_path} does not match its recorded length, downloading it again")
+            return True
+        if self.refresh_policy != 'if_stale':
+            return self.refresh_policy == 'always'
+        # Files downloaded before metadata was recorded age from their modification time
+        fetched_at = metadata.get('fetched_at') if metadata else os.path.getmtime(file_path)
+        return time.time() - fetched_at > self.stale_after_seconds
+    
+    def _is_intact(self, file_path, metadata):
+        """Whether a file has the length recorded when it was downloaded (True if nothing was recorded)."""
+        expected = (metadata or {}).get('content_length')
+        return expected is None or os.path.getsize(file_path) == expected
+    
+    def _fetch(self, url, file_path, metadata=None):
+        """
+        Fetch url into file_path, resuming the transfer if it is interrupted.
+        
+        Only one thread or process writes a given path at a time; a caller
+        that waited for another's download reuses its result.
+        
+        Returns:
+            str: file_path, or None if the server refused the request
+        """
+        part_path = f"{file_path}{PARTIAL_SUFFIX}"
+        with self._path_lock(file_path):
+            current = self.get_metadata(file_path)
+            if current != metadata:
+                if os.path.exists(file_path) and not self._needs_revalidation(file_path, current):
+                    logging.info(f"{file_path} was downloaded while waiting for its lock")
+                    return file_path
+                metadata = current
             
+            for attempt in range(config.DOWNLOAD_RETRIES + 1):
+                try:
+                    return self._fetch_once(url, file_path, part_path, metadata)
+                except (IncompleteDownloadError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt == config.DOWNLOAD_RETRIES:
+                        raise
+                    received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                    delay = config.DOWNLOAD_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+                    logging.warning(f"Download of {url} interrupted after {received} bytes ({str(e)[:100]}), "
+                                    f"retrying in {delay:.1f}s (attempt {attempt + 2}/{config.DOWNLOAD_RETRIES + 1})")
+                    time.sleep(delay)
+    
+    def _fetch_once(self, url, file_path, part_path, metadata):
+        """
+        Stream url to part_path with a single GET, then verify it and rename it to file_path.
+        
+        A partial file left by an earlier attempt is resumed with a Range
+        request, guarded by If-Range so a changed document starts over. A 416
+        answer means the partial file already reaches the end of the document:
+        it is used if its length matches, otherwise discarded and fetched again.
+        Otherwise, when the file was downloaded from the same URL before, its
+        ETag and Last-Modified are sent as validators and a 304 response only
+        refreshes the metadata.
+        
+        Returns:
+            str: file_path, or None if the server refused the request
+        """
+        headers = {}
+        partial = self._partial_download(url, part_path)
+        if partial:
+            headers['Range'] = f"bytes={partial['offset']}-"
+            headers['If-Range'] = partial.get('etag') or partial['last_modified']
+        elif metadata and metadata.get('url') == url and os.path.exists(file_path) and self._is_intact(file_path, metadata):
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+        
+        with self.session.get(url, headers=headers, timeout=config.DOWNLOAD_TIMEOUT_SECONDS, stream=True) as response:
+            if response.status_code == 304 and not partial and headers:
+                logging.info(f"Not modified since last download: {url}")
+                self._write_metadata(file_path, dict(metadata, fetched_at=time.time()))
+                return file_path
+                
             if response.status_code == 403:
                 # Handle forbidden access (common with SeekingAlpha)
                 if 'seekingalpha.com' in url:
@@ -100,33 +351,187 @@ class EarningsDocDownloader:
                     logging.warning(f"Access forbidden (403) for URL: {url}")
                 return None
                 
-            if response.status_code != 200:
-                logging.error(f"URL returned status code {response.status_code}: {url}")
-                        return None
-                    
-            # Proceed with download
-            response = requests.get(url, headers=headers, timeout=30)
-                    response.raise_for_status()
-                    
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
+            if response.status_code == 416 and partial:
+                # The partial file reaches or passes the end of the document
+                total = self._unsatisfied_range_total(response)
+                if total != partial['offset']:
+                    self._discard_partial(part_path)
+                    raise IncompleteDownloadError(f"Partial download of {url} does not match the document")
+                logging.info(f"Partial download of {url} was already complete")
+                sha = hashlib.sha256()
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(config.DOWNLOAD_CHUNK_BYTES), b''):
+                        sha.update(chunk)
+                return self._promote_partial(url, file_path, part_path, metadata, sha.hexdigest(), partial)
             
-            logging.info(f"Downloaded {url} to {file_path}")
-            return file_path
+            if response.status_code not in (200, 206):
+                logging.error(f"URL returned status code {response.status_code}: {url}")
+                return None
             
-        except requests.exceptions.HTTPError as e:
-            if '403' in str(e):
-                if 'seekingalpha.com' in url:
-                    logging.warning(f"Access forbidden (403) for SeekingAlpha URL: {url}")
-                    logging.warning("SeekingAlpha requires subscription. Skipping this document.")
-                else:
-                    logging.warning(f"Access forbidden (403) for URL: {url}")
+            offset = 0
+            if response.status_code == 206:
+                offset, total = self._content_range(response)
+                if not partial or offset != partial['offset']:
+                    self._discard_partial(part_path)
+                    raise IncompleteDownloadError(f"Unexpected range {offset}- in response for {url}")
+                expected_length = total
+                logging.info(f"Resuming download of {url} at {offset} bytes")
             else:
-                logging.error(f"HTTP error downloading {url}: {e}")
+                # A full response replaces any partial file (the document changed or ranges are unsupported)
+                expected_length = self._content_length(response)
+                self._write_metadata(part_path, {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                })
+            
+            sha = hashlib.sha256()
+            if offset:
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(config.DOWNLOAD_CHUNK_BYTES), b''):
+                        sha.update(chunk)
+            md5 = hashlib.md5() if not offset else None
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=config.DOWNLOAD_CHUNK_BYTES):
+                    f.write(chunk)
+                    sha.update(chunk)
+                    if md5:
+                        md5.update(chunk)
+            
+            size = os.path.getsize(part_path)
+            if expected_length is not None and size != expected_length:
+                if size > expected_length:
+                    self._discard_partial(part_path)
+                raise IncompleteDownloadError(f"Received {size} of {expected_length} bytes from {url}")
+            content_md5 = response.headers.get('Content-MD5')
+            if md5 and content_md5 and base64.b64encode(md5.digest()).decode('ascii') != content_md5:
+                self._discard_partial(part_path)
+                raise IncompleteDownloadError(f"Checksum mismatch for {url}")
+            
+            partial_record = self.get_metadata(part_path) or {}
+        
+        return self._promote_partial(url, file_path, part_path, metadata, sha.hexdigest(), partial_record)
+    
+    def _promote_partial(self, url, file_path, part_path, metadata, sha256, partial_record):
+        """
+        Move a complete, verified partial file into place and record its metadata.
+        
+        Returns:
+            str: file_path
+        """
+        if metadata and metadata.get('sha256') not in (None, sha256):
+            logging.info(f"Document at {url} has changed since it was last downloaded")
+        
+        # Only a complete, verified file ever appears at file_path
+        size = os.path.getsize(part_path)
+        os.replace(part_path, file_path)
+        self._discard_partial(part_path)
+        self.blob_store.add(file_path, sha256, url)
+        self._write_metadata(file_path, {
+            'url': url,
+            'etag': partial_record.get('etag'),
+            'last_modified': partial_record.get('last_modified'),
+            'content_length': size,
+            'sha256': sha256,
+            'fetched_at': time.time()
+        })
+        
+        logging.info(f"Downloaded {url} to {file_path}")
+        return file_path
+    
+    def _partial_download(self, url, part_path):
+        """
+        Describe a partial download of url that can be resumed.
+        
+        Returns:
+            dict: The partial file's 'etag' and 'last_modified' plus its 'offset'
+                  in bytes, or None if there is nothing safely resumable
+        """
+        if not os.path.exists(part_path) or not os.path.getsize(part_path):
             return None
-        except Exception as e:
-            logging.error(f"Error downloading {url}: {e}")
+        record = self.get_metadata(part_path)
+        if not record or record.get('url') != url or not (record.get('etag') or record.get('last_modified')):
+            # Without a validator a resumed file could mix two versions of the document
+            return None
+        return dict(record, offset=os.path.getsize(part_path))
+    
+    def _discard_partial(self, part_path):
+        """Remove a partial file and its record."""
+        for path in (part_path, metadata_path(part_path)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def _content_length(self, response):
+        """Announced length of a full response body, or None if unknown or encoded."""
+        if response.headers.get('Content-Encoding', 'identity') != 'identity':
             return None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+    
+    def _content_range(self, response):
+        """Parse a 206 response's Content-Range into (first byte offset, total length or None)."""
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+        if not match:
+            raise IncompleteDownloadError(f"Missing Content-Range in partial response: {response.url}")
+        total = match.group(2)
+        return int(match.group(1)), int(total) if total != '*' else None
+    
+    def _unsatisfied_range_total(self, response):
+        """Parse a 416 response's Content-Range ('bytes */<length>') into the document length, or None."""
+        match = re.match(r'bytes \*/(\d+)', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    
+    def download_many(self, items, concurrency=None):
+        """
+        Download many documents concurrently over the pooled session.
+        
+        At most concurrency downloads run at once, and at most
+        DOWNLOAD_PER_HOST_CONCURRENCY of them against any one host.
+        
+        Args:
+            items (list): (ticker, year, quarter, doc_type) tuples, optionally with the URL
+                          as a fifth element; otherwise the URL comes from the company config
+            concurrency (int): Maximum downloads in flight (default DOWNLOAD_CONCURRENCY)
+            
+        Returns:
+            dict: Maps each item to its downloaded file path, or None if it could not be downloaded
+        """
+        items = list(dict.fromkeys(tuple(item) for item in items))
+        if not items:
+            return {}
+        
+        def download(item):
+            ticker, year, quarter, doc_type = item[:4]
+            url = item[4] if len(item) > 4 else self._release_url(ticker, year, quarter, doc_type)
+            if not url:
+                logging.warning(f"No {doc_type} URL configured for {ticker} {quarter} {year}")
+                return None
+            try:
+                return self.download_file(url, ticker, year, quarter, doc_type)
+            except Exception as e:
+                # Log but don't crash on download errors
+                logging.warning(f"Error downloading {doc_type} for {ticker} {quarter} {year}: {str(e)}")
+                return None
+        
+        concurrency = max(1, min(concurrency or config.DOWNLOAD_CONCURRENCY, len(items)))
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='download') as executor:
+            paths = dict(zip(items, executor.map(download, items)))
+        
+        # Mark the documents as used and make room for them; anything another job used recently stays too
+        downloaded = [path for path in paths.values() if path]
+        self.storage_manager.touch(*downloaded)
+        try:
+            self.storage_manager.enforce_quota(protect=downloaded)
+        except OSError as e:
+            logging.warning(f"Could not enforce the storage quota: {e}")
+        return paths
+    
+    def _release_url(self, ticker, year, quarter, doc_type):
+        """Look up the configured URL of a release document, or None."""
+        company = self.config_manager.get_company(ticker) or {}
+        return company.get("releases", {}).get(year, {}).get(quarter, {}).get(doc_type)
     
     def download_latest_earnings(self, ticker):
         """
@@ -146,45 +551,67 @@ class EarningsDocDownloader:
                      }
                  }
         """
-        # Get latest release info
-        year, quarter, release_data = self.config_manager.get_latest_release(ticker)
+        return self.download_latest_earnings_many([ticker]).get(ticker)
+    
+    def download_latest_earnings_many(self, tickers, concurrency=None):
+        """
+        Download the latest earnings documents for several companies at once.
         
-        if not release_data:
-            logging.error(f"No release data found for {ticker}")
-            return None
+        All documents are fetched concurrently through download_many, so this
+        takes about as long as the slowest single file.
+        
+        Args:
+            tickers (list): Company ticker symbols
+            concurrency (int): Maximum downloads in flight (default DOWNLOAD_CONCURRENCY)
+            
+        Returns:
+            dict: Maps each ticker to its download_latest_earnings result, or None
+                  if no documents could be downloaded
+        """
+        releases = {}
+        items = []
+        for ticker in dict.fromkeys(tickers):
+            # Get latest release info
+            year, quarter, release_data = self.config_manager.get_latest_release(ticker)
+            if not release_data:
+                logging.error(f"No release data found for {ticker}")
+                continue
+            releases[ticker] = (year, quarter, release_data)
+            items.extend(
+                (ticker, year, quarter, doc_type, release_data[doc_type])
+                for doc_type in DOCUMENT_TYPES if release_data.get(doc_type)
+            )
         
-        # Record of downloaded files
-        downloaded_files = {}
+        paths = self.download_many(items, concurrency)
         
-        # Download each available document type
-        for doc_type in ['earnings_release', 'call_transcript']:
-            if doc_type in release_data and release_data[doc_type]:
-                url = release_data[doc_type]
-                try:
-                    file_path = self.download_file(url, ticker, year, quarter, doc_type)
-                    if file_path:
-                        downloaded_files[doc_type] = {'path': file_path, 'url': url}
-                    else:
-                        logging.warning(f"Failed to download {doc_type} for {ticker} {quarter} {year}")
-                except Exception as e:
-                    # Log but don't crash on download errors
-                    logging.warning(f"Error downloading {doc_type} for {ticker} {quarter} {year}: {str(e)}")
-                    
-        # Log warning if SeekingAlpha transcript couldn't be downloaded
-        if 'call_transcript' in release_data and 'seekingalpha.com' in release_data['call_transcript'] and 'call_transcript' not in downloaded_files:
-            logging.warning(f"SeekingAlpha transcript could not be accessed - this is normal as it requires a subscription.")
-            logging.warning(f"Analysis will proceed with available documents only.")
+        results = {ticker: None for ticker in tickers}
+        for ticker, (year, quarter, release_data) in releases.items():
+            # Record of downloaded files
+            downloaded_files = {}
+            for item, file_path in paths.items():
+                if item[0] != ticker:
+                    continue
+                doc_type, url = item[3], item[4]
+                if file_path:
+                    downloaded_files[doc_type] = {'path': file_path, 'url': url}
+                else:
+                    logging.warning(f"Failed to download {doc_type} for {ticker} {quarter} {year}")
             
-        # Continue if we have at least one document
-        if downloaded_files:
-            return {
-                'quarter': quarter,
-                'year': year,
-                'files': downloaded_files
-            }
-        else:
-            logging.error(f"No documents could be downloaded for {ticker} {quarter} {year}")
-            return None
+            # Log warning if SeekingAlpha transcript couldn't be downloaded
+            if 'call_transcript' in release_data and 'seekingalpha.com' in (release_data['call_transcript'] or '') and 'call_transcript' not in downloaded_files:
+                logging.warning(f"SeekingAlpha transcript could not be accessed - this is normal as it requires a subscription.")
+                logging.warning(f"Analysis will proceed with available documents only.")
+            
+            # Continue if we have at least one document
+            if downloaded_files:
+                results[ticker] = {
+                    'quarter': quarter,
+                    'year': year,
+                    'files': downloaded_files
+                }
+            else:
+                logging.error(f"No documents could be downloaded for {ticker} {quarter} {year}")
+        return results
     
     def get_available_companies(self):
         """Returns a list of available company tickers from the configuration."""
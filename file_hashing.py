@@ -0,0 +1,55 @@
+import os
+import hashlib
+import threading
+
+# Memoized digests keyed on (path, size, mtime) so unchanged files are not re-read
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 hex digest of a file.
+
+    Digests are memoized per process and invalidated automatically when the
+    file's size or modification time changes.
+
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Number of bytes to read at a time
+
+    Returns:
+        str: Hex-encoded SHA-256 digest
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with _digest_lock:
+        digest = _digest_cache.get(memo_key)
+    if digest:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digest_cache[memo_key] = digest
+    return digest
+
+def register_sha256(file_path, digest):
+    """
+    Record a known digest for a file so file_sha256 does not re-read it.
+
+    Used when the digest was computed while the file was written, e.g. for
+    downloads stored in the blob store. Like computed digests, it is
+    invalidated when the file's size or modification time changes.
+
+    Args:
+        file_path (str): Path to the file
+        digest (str): Hex-encoded SHA-256 digest of its current content
+    """
+    stat = os.stat(file_path)
+    with _digest_lock:
+        _digest_cache[(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)] = digest
@@ -0,0 +1,102 @@
+import math
+import threading
+from collections import deque
+
+# Most recent call latencies kept for percentiles
+LATENCY_SAMPLES = 1000
+
+class GenerationMetrics:
+    """
+    Per-process counters for Gemini generation calls.
+
+    Counts completed generations, how many were cut off by the output token
+    limit, and the continuation calls and output tokens spent recovering them.
+    Also times individual calls, counting hedged requests, hedge wins and
+    missed deadlines, and keeps recent latencies for percentiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generations = 0
+        self.truncated = 0
+        self.continuations = 0
+        self.continuation_output_tokens = 0
+        self.unrecovered = 0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_generation(self, truncated=False, continuations=0, continuation_output_tokens=0, recovered=True):
+        """
+        Record one completed generation.
+
+        Args:
+            truncated (bool): Whether the first response hit the output token limit
+            continuations (int): Continuation calls made to finish it
+            continuation_output_tokens (int): Output tokens produced by those calls
+            recovered (bool): Whether the final text was complete
+        """
+        with self._lock:
+            self.generations += 1
+            self.truncated += int(truncated)
+            self.continuations += continuations
+            self.continuation_output_tokens += continuation_output_tokens
+            self.unrecovered += int(not recovered)
+
+    def record_call(self, model, latency_seconds, hedged=False, hedge_won=False, timed_out=False):
+        """
+        Record one Gemini call.
+
+        Args:
+            model (str): Gemini model id of the call
+            latency_seconds (float): Time until the first request finished, or None if it timed out
+            hedged (bool): Whether a hedged request was sent
+            hedge_won (bool): Whether the hedged request finished first
+            timed_out (bool): Whether the call missed its deadline
+        """
+        with self._lock:
+            self.calls += 1
+            self.hedged += int(hedged)
+            self.hedge_wins += int(hedge_won)
+            self.deadline_exceeded += int(timed_out)
+            if latency_seconds is not None:
+                self.latencies.append((model, latency_seconds))
+
+    def latency_percentile(self, percentile, model=None, min_samples=1):
+        """
+        Nearest-rank latency percentile of recent calls.
+
+        Args:
+            percentile (float): Percentile between 0 and 100
+            model (str): Only count calls to this model
+            min_samples (int): Return None with fewer timed calls than this
+
+        Returns:
+            float: Latency in seconds, or None without enough samples
+        """
+        with self._lock:
+            samples = sorted(latency for call_model, latency in self.latencies if model is None or call_model == model)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[max(math.ceil(percentile / 100 * len(samples)) - 1, 0)]
+
+    def stats(self):
+        """Return generation and call latency counters for this process."""
+        latency = {f'latency_p{p}': self.latency_percentile(p) for p in (50, 95, 99)}
+        with self._lock:
+            return dict({
+                'generations': self.generations,
+                'truncated': self.truncated,
+                'continuations': self.continuations,
+                'continuation_output_tokens': self.continuation_output_tokens,
+                'unrecovered': self.unrecovered,
+                'truncation_rate': (self.truncated / self.generations) if self.generations else 0.0,
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'deadline_exceeded': self.deadline_exceeded,
+                'hedge_rate': (self.hedged / self.calls) if self.calls else 0.0,
+                'hedge_win_rate': (self.hedge_wins / self.hedged) if self.hedged else 0.0
+            }, **latency)
@@ -0,0 +1,189 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import config
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a Gemini call and its hedge do not finish within the call deadline."""
+
+class HedgedCaller:
+    """
+    Per-call deadlines and hedged requests for Gemini calls.
+
+    Each call must finish within the deadline. When hedging is enabled and a
+    call is still running after the model's observed latency percentile (or
+    a fixed delay until enough calls have been timed), a duplicate request is
+    sent, optionally to a fallback model, and whichever finishes first wins.
+    The loser is cancelled; a blocking call cannot be interrupted, so in the
+    synchronous path it is abandoned and ends at its HTTP timeout.
+    """
+
+    def __init__(self, metrics, deadline_seconds=None, enabled=None, percentile=None, delay_seconds=None,
+                 min_samples=None, fallback_model=None):
+        self.metrics = metrics
+        self.deadline_seconds = config.GENERATION_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        self.enabled = config.HEDGING_ENABLED if enabled is None else enabled
+        self.percentile = percentile or config.HEDGE_PERCENTILE
+        self.delay_seconds = config.HEDGE_DELAY_SECONDS if delay_seconds is None else delay_seconds
+        self.min_samples = config.HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        self.fallback_model = config.HEDGE_FALLBACK_MODEL if fallback_model is None else fallback_model
+
+    def hedge_delay(self, model):
+        """
+        Seconds to wait for a call before hedging it.
+
+        Args:
+            model (str): Gemini model id of the call
+
+        Returns:
+            float: The model's latency percentile once min_samples calls have
+                   been timed, otherwise delay_seconds
+        """
+        delay = self.metrics.latency_percentile(self.percentile, model=model, min_samples=self.min_samples)
+        return self.delay_seconds if delay is None else delay
+
+    def call(self, primary, hedge=None, model=None):
+        """
+        Run primary within the deadline, hedging it with hedge if it is slow.
+
+        Args:
+            primary (callable): Zero-argument function performing the request
+            hedge (callable): Zero-argument function performing the duplicate request,
+                              or None to only enforce the deadline
+            model (str): Gemini model id of the primary request, for latency tracking
+
+        Returns:
+            The return value of whichever request finished first
+        """
+        race = _Race(self, model, hedge if self.enabled else None)
+        if not race.hedge and not race.deadline:
+            result = primary()
+            race.succeed(result, hedge_won=False)
+            return result
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            race.pending[executor.submit(primary)] = False
+            while True:
+                done, _ = wait(race.pending, timeout=race.next_timeout(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if race.settle(future, race.pending.pop(future)):
+                        return race.result
+                if race.give_up():
+                    raise race.error
+                if race.hedge_due():
+                    race.pending[executor.submit(race.hedge)] = True
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def call_async(self, primary, hedge=None, model=None):
+        """
+        Async counterpart of call.
+
+        Args:
+            primary (callable): Zero-argument function returning a coroutine for the request
+            hedge (callable): Zero-argument function returning a coroutine for the duplicate
+                              request, or None to only enforce the deadline
+            model (str): Gemini model id of the primary request, for latency tracking
+
+        Returns:
+            The result of whichever request finished first
+        """
+        race = _Race(self, model, hedge if self.enabled else None)
+        if not race.hedge and not race.deadline:
+            result = await primary()
+            race.succeed(result, hedge_won=False)
+            return result
+
+        try:
+            race.pending[asyncio.ensure_future(primary())] = False
+            while True:
+                done, _ = await asyncio.wait(race.pending, timeout=race.next_timeout(),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if race.settle(task, race.pending.pop(task)):
+                        return race.result
+                if race.give_up():
+                    raise race.error
+                if race.hedge_due():
+                    race.pending[asyncio.ensure_future(race.hedge())] = True
+        finally:
+            for task in race.pending:
+                task.cancel()
+
+class _Race:
+    """Bookkeeping for one call and its hedge, shared by the thread and asyncio paths."""
+
+    def __init__(self, caller, model, hedge):
+        self.caller = caller
+        self.model = model
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.deadline = caller.deadline_seconds or None
+        self.hedge_at = caller.hedge_delay(model) if hedge else None
+        self.pending = {}
+        self.hedged = False
+        self.result = None
+        self.error = None
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def next_timeout(self):
+        """Seconds until the hedge is due or the deadline passes, whichever is sooner."""
+        timeouts = []
+        if self.deadline:
+            timeouts.append(self.deadline - self.elapsed())
+        if self.hedge_at is not None and not self.hedged:
+            timeouts.append(self.hedge_at - self.elapsed())
+        return max(min(timeouts), 0) if timeouts else None
+
+    def settle(self, future, is_hedge):
+        """Take the result of a finished request; returns True if it won."""
+        error = future.exception()
+        if error is None:
+            self.succeed(future.result(), hedge_won=is_hedge)
+            return True
+        if self.pending:
+            logging.warning(f"{'Hedged' if is_hedge else 'Primary'} Gemini call failed ({str(error)[:100]}), "
+                            f"waiting for the other request")
+        self.error = error
+        return False
+
+    def succeed(self, result, hedge_won):
+        """Record a successful call."""
+        elapsed = self.elapsed()
+        self.result = result
+        self.caller.metrics.record_call(self.model, elapsed, hedged=self.hedged, hedge_won=hedge_won)
+        if hedge_won:
+            logging.info(f"Hedged request won after {elapsed:.1f}s")
+
+    def give_up(self):
+        """
+        Whether the call has failed: every request errored, or the deadline passed.
+
+        A primary that fails before the hedge is due is not hedged; the error
+        goes to the caller's retry policy instead.
+        """
+        if self.error is not None and not self.pending:
+            return True
+        if self.deadline and self.elapsed() >= self.deadline:
+            self.error = DeadlineExceededError(
+                f"Gemini call to {self.model} did not finish within its {self.deadline:.0f}s deadline"
+                + (" (hedged)" if self.hedged else "")
+            )
+            self.caller.metrics.record_call(self.model, None, hedged=self.hedged, timed_out=True)
+            return True
+        return False
+
+    def hedge_due(self):
+        """Whether to send the hedge now; marks it sent."""
+        if self.hedge_at is None or self.hedged or self.elapsed() < self.hedge_at:
+            return False
+        self.hedged = True
+        fallback = self.caller.fallback_model
+        logging.info(f"Gemini call to {self.model} still running after {self.elapsed():.1f}s, "
+                     f"sending a hedged request" + (f" to {fallback}" if fallback else ""))
+        return True
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a job handler when cancellation has been requested."""
+
+class Job:
+    """Handle passed to job handlers for progress reporting and cancellation checks."""
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.id = job_id
+
+    def is_cancelled(self):
+        """Return True if cancellation has been requested for this job."""
+        row = self.job_queue._fetch_row(self.id)
+        return bool(row and row['cancel_requested'])
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation has been requested for this job."""
+        if self.is_cancelled():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def set_progress(self, message):
+        """Record a short human-readable progress message."""
+        self.job_queue._update(self.id, progress=message)
+
+    def append_output(self, text):
+        """Append partial output (e.g. streamed report text) for live viewers to read."""
+        with self.job_queue._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET output = COALESCE(output, '') || ? WHERE id = ? AND owner = ?",
+                (text, self.id, self.job_queue.owner)
+            )
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite with a bounded worker pool.
+
+    Submissions are stored as 'queued' rows and return immediately. Every
+    process running a JobQueue polls the table and atomically claims queued
+    jobs up to its worker limit, so several gunicorn workers can share one
+    queue. Running jobs send heartbeats; jobs whose heartbeat goes stale
+    (e.g. after a restart) are put back in the queue, until a job has been
+    started max_attempts times and is marked failed instead.
+    """
+
+    def __init__(self, db_path=None, max_workers=None, poll_interval=None, stale_after=None, max_attempts=None):
+        self.db_path = db_path or config.JOB_DB_PATH
+        self.max_workers = max_workers or config.JOB_WORKERS
+        self.poll_interval = poll_interval if poll_interval is not None else config.JOB_POLL_INTERVAL_SECONDS
+        self.stale_after = stale_after if stale_after is not None else config.JOB_STALE_AFTER_SECONDS
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._handlers = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job-worker')
+        self._dispatcher = None
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL,
+                    output TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            # Tables created before partial output was stored lack the column
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'output' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN output TEXT")
+
+    def register(self, kind, handler):
+        """
+        Register the handler for a job kind.
+
+        Args:
+            kind (str): Job kind name
+            handler (callable): Called as handler(job, **params); its return
+                                value must be JSON-serializable and is stored
+                                as the job result
+        """
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Start the dispatcher thread that claims and runs queued jobs."""
+        if self._dispatcher and self._dispatcher.is_alive():
+            return
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, kind, **params):
+        """
+        Queue a job.
+
+        Args:
+            kind (str): Registered job kind
+            **params: JSON-serializable handler arguments
+
+        Returns:
+            str: Job id
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), QUEUED, time.time())
+            )
+        logging.info(f"Queued {kind} job {job_id}")
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Get the current state of a job.
+
+        Returns:
+            dict: Job state, or None if the job does not exist
+        """
+        row = self._fetch_row(job_id)
+        if not row:
+            return None
+
+        job = dict(row)
+        del job['output']
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['finished'] = job['status'] in FINISHED_STATES
+        if job['started_at']:
+            job['elapsed_seconds'] = (job['finished_at'] or time.time()) - job['started_at']
+        return job
+
+    def read_output(self, job_id, offset=0):
+        """
+        Read a job's partial output from a character offset.
+
+        A requeued job starts its output over, so readers compare the attempt
+        number with the one their offset refers to.
+
+        Returns:
+            tuple: (status, progress, attempt, output text after offset), or None if the job does not exist
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, progress, attempts, substr(COALESCE(output, ''), ?) AS output FROM jobs WHERE id = ?",
+                (offset + 1, job_id)
+            ).fetchone()
+        return (row['status'], row['progress'], row['attempts'], row['output']) if row else None
+
+    def list_jobs(self, limit=50):
+        """Return the most recent jobs, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.get(row['id']) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs are
+        asked to stop at their next cancellation check.
+
+        Returns:
+            bool: True if the job was found and not already finished
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED)
+            )
+            if cursor.rowcount:
+                logging.info(f"Cancelled queued job {job_id}")
+                return True
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                (job_id, RUNNING)
+            )
+            if cursor.rowcount:
+                logging.info(f"Requested cancellation of running job {job_id}")
+            return bool(cursor.rowcount)
+
+    def _fetch_row(self, job_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _update(self, job_id, **fields):
+        """
+        Update a job this process is running. A job that was requeued after its
+        heartbeat went stale belongs to another worker, or to nobody, and is left
+        alone.
+
+        Returns:
+            bool: True if the job was updated
+        """
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?",
+                (*fields.values(), job_id, self.owner)
+            )
+        return bool(cursor.rowcount)
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self._heartbeat()
+                self._requeue_stale()
+                self._claim_jobs()
+            except Exception as e:
+                logging.error(f"Job dispatcher error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ?",
+                [(now, job_id, self.owner) for job_id in running]
+            )
+
+    def _requeue_stale(self):
+        """
+        Put running jobs whose owner stopped sending heartbeats back in the queue,
+        or fail them once they have been started max_attempts times.
+        """
+        now = time.time()
+        cutoff = now - self.stale_after
+        stale = "status = ? AND heartbeat_at < ? AND cancel_requested = 0"
+        lost = "'Worker ' || COALESCE(owner, 'unknown') || ' stopped responding'"
+        with self._connect() as conn:
+            # A job that keeps taking its worker down would otherwise be retried forever
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, finished_at = ?, "
+                f"error = 'Gave up after ' || attempts || ' attempts: ' || {lost}, owner = NULL "
+                f"WHERE {stale} AND attempts >= ?",
+                (FAILED, now, RUNNING, cutoff, self.max_attempts)
+            )
+            if cursor.rowcount:
+                logging.error(f"Failed {cursor.rowcount} stale jobs that reached {self.max_attempts} attempts")
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, error = {lost}, owner = NULL WHERE {stale}",
+                (QUEUED, RUNNING, cutoff)
+            )
+            if cursor.rowcount:
+                logging.warning(f"Re-queued {cursor.rowcount} stale jobs")
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND heartbeat_at < ? AND cancel_requested = 1",
+                (CANCELLED, time.time(), RUNNING, cutoff)
+            )
+
+    def _claim_jobs(self):
+        with self._lock:
+            free_slots = self.max_workers - len(self._running)
+        if free_slots <= 0:
+            return
+
+        with self._connect() as conn:
+            candidates = conn.execute(
+                "SELECT id, kind FROM jobs WHERE status = ? ORDER BY created_at LIMIT ?",
+                (QUEUED, free_slots)
+            ).fetchall()
+
+        for row in candidates:
+            if row['kind'] not in self._handlers:
+                continue
+            now = time.time()
+            with self._connect() as conn:
+                # Only one process can win the claim for a given job
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1, "
+                    "output = NULL WHERE id = ? AND status = ?",
+                    (RUNNING, self.owner, now, now, row['id'], QUEUED)
+                )
+            if not cursor.rowcount:
+                continue
+            with self._lock:
+                self._running.add(row['id'])
+            self._executor.submit(self._run, row['id'])
+
+    def _run(self, job_id):
+        row = self._fetch_row(job_id)
+        handler = self._handlers[row['kind']]
+        job = Job(self, job_id)
+        logging.info(f"Running {row['kind']} job {job_id}")
+
+        try:
+            job.check_cancelled()
+            result = handler(job, **json.loads(row['params']))
+            if self._update(job_id, status=SUCCEEDED, result=json.dumps(result), error=None, finished_at=time.time()):
+                logging.info(f"Job {job_id} succeeded")
+            else:
+                logging.warning(f"Job {job_id} finished after it was taken over; discarding its result")
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, finished_at=time.time())
+            logging.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {str(e)}")
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self._wakeup.set()
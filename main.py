@@ -1,4 +1,6 @@
 import os
+import sys
+import time
 import logging
 from datetime import datetime
 import argparse
@@ -31,6 +33,25 @@ def list_available_companies(config_manager):
         else:
             print(f"{ticker.upper():<8} {info['name']:<35} {'N/A':<15} {'N/A'}")
 
+def report_failed_analysis(analysis, output_path):
+    """
+    Log a failed analysis and remove any partially streamed report.
+    
+    Args:
+        analysis (dict): Analysis result
+        output_path (str): Path the report was to be written to
+        
+    Returns:
+        bool: True if the analysis failed
+    """
+    if 'error' not in analysis:
+        return False
+    
+    logging.error(f"Analysis of {analysis['company']} failed: {analysis['error']}")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return True
+
 def generate_email_markdown(result, config_manager=None):
     """
     Generate email-friendly markdown from analysis results.
@@ -71,11 +92,191 @@ def generate_email_markdown(result, config_manager=None):
     
     # Add footer
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    email_md += f"\n\n---\n*Analysis generated on {current_time} using Gemini 2.5 Pro*  \n"
+    model = f" using {result['model']}" if result.get('model') else ""
+    email_md += f"\n\n---\n*Analysis generated on {current_time}{model}*  \n"
     email_md += "*This is an AI-generated analysis for Google Cloud executive team consumption only. Verify all information before making strategic decisions.*"
     
     return email_md
 
+def print_token_estimate(estimate):
+    """
+    Print per-document input token counts and the estimated cost of a request.
+    
+    Args:
+        estimate (dict): Estimate from EarningsAnalyzer.estimate_request
+    """
+    print(f"\nToken estimate for {estimate['model']}:")
+    print("-" * 70)
+    print(f"{'DOCUMENT':<45} {'FILE':<15} {'TOKENS':>8}")
+    print("-" * 70)
+    for doc in estimate['documents']:
+        print(f"{doc['label']:<45} {os.path.basename(doc['path'])[:15]:<15} {doc['tokens']:>8}")
+    print(f"{'prompt':<45} {'':<15} {estimate['prompt_tokens']:>8}")
+    print("-" * 70)
+    print(f"{'Total input tokens':<61} {estimate['total_tokens']:>8}")
+    print(f"{'Input budget':<61} {estimate['budget']:>8}")
+    if estimate['over_budget']:
+        if config.INPUT_TOKEN_BUDGET_POLICY == 'drop':
+            print("Over budget: low-priority documents will be dropped before generating")
+        else:
+            print("Over budget: the request will be rejected")
+    print(f"Estimated cost: ${estimate['estimated_cost_usd']:.4f} "
+          f"(assuming {estimate['estimated_output_tokens']} output tokens)")
+
+def download_all_companies(downloader):
+    """Download the latest documents of every configured company concurrently and print a summary."""
+    tickers = downloader.get_available_companies()
+    start_time = time.perf_counter()
+    downloads = downloader.download_latest_earnings_many(tickers)
+    elapsed = time.perf_counter() - start_time
+    
+    print(f"\nDownloaded latest documents for {sum(1 for d in downloads.values() if d)} of {len(tickers)} companies "
+          f"in {elapsed:.1f}s:")
+    for ticker, download in downloads.items():
+        documents = ', '.join(download['files']) if download else 'no documents'
+        period = f"{download['quarter']} {download['year']}" if download else ''
+        print(f"{ticker.upper():<8} {period:<20} {documents}")
+
+def print_storage_usage(usage):
+    """Print disk usage per ticker from StorageManager.usage()."""
+    def mb(size):
+        return f"{size / 1024 / 1024:.1f}"
+    
+    print(f"\n{'TICKER':<12} {'QUARTERS':>8} {'DOWNLOADS MB':>13} {'REPORTS MB':>11} {'DERIVED MB':>11} "
+          f"{'PINNED MB':>10}  LAST USED")
+    print("-" * 90)
+    for ticker, summary in sorted(usage['tickers'].items()):
+        last_used = datetime.fromtimestamp(summary['last_access']).strftime('%Y-%m-%d %H:%M') if summary['last_access'] else 'N/A'
+        print(f"{ticker.upper():<12} {summary['quarters']:>8} {mb(summary['downloads']):>13} {mb(summary['reports']):>11} "
+              f"{mb(summary['artifacts']):>11} {mb(summary['pinned']):>10}  {last_used}")
+    print("-" * 90)
+    quota = f"{mb(usage['quota'])} MB" if usage['quota'] else 'none'
+    print(f"Total: {mb(usage['total'])} MB (quota: {quota})")
+
+def verify_downloads(blob_store, repair=False):
+    """Print the integrity report of the downloads and their content-addressed store."""
+    report = blob_store.verify(repair=repair)
+    
+    print(f"\nChecked {report['blobs']} stored documents and {report['paths']} download paths")
+    labels = [
+        ('corrupt_blobs', 'Corrupt stored documents'),
+        ('unreferenced_blobs', 'Stored documents no download links to'),
+        ('missing_paths', 'Missing downloads'),
+        ('modified_paths', 'Downloads that differ from their stored copy'),
+        ('untracked_paths', 'Downloads not in the manifest')
+    ]
+    for key, label in labels:
+        if report[key]:
+            print(f"{label} ({len(report[key])}):")
+            for item in report[key]:
+                print(f"  {item}")
+    if not any(report[key] for key, _ in labels):
+        print("No problems found")
+    elif repair:
+        print("Repaired; removed documents will be downloaded again on the next run")
+    else:
+        print("Run with --repair-downloads to fix these")
+
+def search_filings(retrieval_index, query, ticker=None):
+    """
+    Print the passages of downloaded filings that best match a query.
+    
+    Args:
+        retrieval_index (RetrievalIndex): Index over the downloads directory
+        query (str): Free-text query
+        ticker (str, optional): Only search this company's filings
+    """
+    retrieval_index.update()
+    start_time = time.perf_counter()
+    passages = retrieval_index.search(query, tickers=[ticker] if ticker else None)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    
+    print(f"\nTop {len(passages)} passages for '{query}' ({elapsed_ms:.1f} ms):")
+    for passage in passages:
+        print("-" * 70)
+        print(f"{passage['path']} (page {passage['page']}, score {passage['score']:.2f})")
+        print(passage['text'][:500])
+
+def stream_analysis_to_file(chunks, output_path):
+    """
+    Append streamed analysis chunks to a file and stdout as they arrive.
+    
+    Args:
+        chunks (generator): Generator from EarningsAnalyzer.analyze_earnings_documents_stream
+        output_path (str): Path of the results markdown file
+        
+    Returns:
+        dict: Final analysis result returned by the generator
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+                return stop.value
+            
+            f.write(chunk)
+            f.flush()
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+
+def run_analysis(analyzer, args, analysis_args, output_path, tier=None, triage_tier=None):
+    """
+    Run one analysis in the mode chosen on the command line.
+    
+    Args:
+        analyzer (EarningsAnalyzer): Analyzer to use
+        args (argparse.Namespace): Parsed arguments (stream, triage, section_parallel,
+                                   regenerate_section, no_cache, refresh_cache)
+        analysis_args (tuple): (documents, company_name, quarter, year)
+        output_path (str): Results file, written as chunks arrive when streaming
+        tier (dict): Latency tier for the analysis
+        triage_tier (dict): Latency tier for triage screening
+        
+    Returns:
+        dict: Analysis result
+    """
+    cache_args = {'use_cache': not args.no_cache, 'refresh_cache': args.refresh_cache}
+    if args.stream:
+        return stream_analysis_to_file(
+            analyzer.analyze_earnings_documents_stream(*analysis_args, tier=tier, **cache_args),
+            output_path
+        )
+    if args.triage:
+        return analyzer.analyze_earnings_documents_triaged(
+            *analysis_args, tier=tier, triage_tier=triage_tier, section_parallel=args.section_parallel, **cache_args
+        )
+    if args.section_parallel or args.regenerate_section:
+        return analyzer.analyze_earnings_documents_by_section(
+            *analysis_args, regenerate_sections=args.regenerate_section, tier=tier, **cache_args
+        )
+    return analyzer.analyze_earnings_documents(*analysis_args, tier=tier, **cache_args)
+
+def check_analysis_modes(parser, args):
+    """
+    Reject conflicting analysis modes and apply the configured defaults of the others.
+    
+    Streaming produces one continuous response, so it cannot be combined with
+    triage or section-parallel generation, and regenerating sections bypasses
+    triage. Modes only enabled through TRIAGE_ENABLED or SECTION_PARALLEL_GENERATION
+    are turned off, with a warning, for runs that ask for an incompatible mode.
+    """
+    if args.stream and (args.triage or args.section_parallel or args.regenerate_section):
+        parser.error("--stream cannot be combined with --triage, --section-parallel or --regenerate-section")
+    if args.regenerate_section and args.triage:
+        parser.error("--regenerate-section cannot be combined with --triage")
+    
+    if args.triage is None:
+        args.triage = config.TRIAGE_ENABLED and not (args.stream or args.regenerate_section)
+        if config.TRIAGE_ENABLED and not args.triage:
+            logging.warning("TRIAGE_ENABLED is ignored with --stream or --regenerate-section")
+    if args.section_parallel is None:
+        args.section_parallel = config.SECTION_PARALLEL_GENERATION and not args.stream
+        if config.SECTION_PARALLEL_GENERATION and not args.section_parallel:
+            logging.warning("SECTION_PARALLEL_GENERATION is ignored with --stream")
+
 def main():
     parser = argparse.ArgumentParser(description='Analyze earnings documents for tech companies')
     parser.add_argument('--ticker', type=str, help='Company ticker to analyze (e.g., AMZN, GOOGL)')
@@ -89,8 +290,41 @@ def main():
                         help=f'Path to company configuration JSON file (default: {config.COMPANY_CONFIG_PATH})')
     parser.add_argument('--skip-email', action='store_true',
                         help='Skip sending email (useful when email credentials are not available)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the analysis result cache entirely')
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='Ignore cached results but store the fresh analysis in the cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the analysis to stdout and the results file as it is generated')
+    parser.add_argument('--ingestion-mode', choices=['file', 'text', 'retrieval'], default=None,
+                        help=f'Send original documents, locally extracted text, or retrieved passages per report section (default: {config.DOCUMENT_INGESTION_MODE})')
+    parser.add_argument('--refresh-downloads', choices=['never', 'if_stale', 'always'], default=None,
+                        help='When to revalidate already downloaded documents (default: DOWNLOAD_REFRESH_POLICY)')
+    parser.add_argument('--storage-usage', action='store_true',
+                        help='Report disk usage of downloads, reports and derived artifacts per ticker and exit')
+    parser.add_argument('--enforce-quota', action='store_true',
+                        help='Evict least recently used items until storage fits STORAGE_QUOTA_MB and exit')
+    parser.add_argument('--verify-downloads', action='store_true',
+                        help='Check downloaded documents against the content-addressed store and exit')
+    parser.add_argument('--repair-downloads', action='store_true',
+                        help='Like --verify-downloads, but also remove corrupt copies and track untracked files')
+    parser.add_argument('--download-all', action='store_true',
+                        help='Download the latest documents of every configured company and exit')
+    parser.add_argument('--search', type=str, default=None,
+                        help='Search the local index of downloaded filings and print the top passages (restrict with --ticker)')
+    parser.add_argument('--tier', type=str, default=None,
+                        help='Latency tier from company_config.json, e.g. fast, balanced or deep (default: the company\'s or config default tier)')
+    parser.add_argument('--triage', action=argparse.BooleanOptionalAction, default=None,
+                        help=f'Screen the documents with a cheap model first and only run the full analysis if they score at least {config.TRIAGE_THRESHOLD:g}/10 for GCP materiality')
+    parser.add_argument('--section-parallel', action=argparse.BooleanOptionalAction, default=None,
+                        help=f'Generate each report section as its own concurrent call (default: {config.SECTION_PARALLEL_GENERATION})')
+    parser.add_argument('--regenerate-section', action='append', default=None, metavar='TITLE',
+                        help='With --section-parallel, regenerate this section and reuse cached results for the rest (repeatable)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Download and count input tokens per document, print the estimated cost and exit without generating')
     
     args = parser.parse_args()
+    check_analysis_modes(parser, args)
     
     # Create output directory if it doesn't exist
     try:
@@ -101,8 +335,8 @@ def main():
         args.output_dir = os.path.join(os.getcwd(), 'results')
         logging.warning(f"Using fallback output directory: {args.output_dir}")
         try:
-    if not os.path.exists(args.output_dir):
-        os.makedirs(args.output_dir)
+            if not os.path.exists(args.output_dir):
+                os.makedirs(args.output_dir)
         except (OSError, PermissionError) as e:
             logging.error(f"Could not create fallback output directory: {e}")
             logging.error("Analysis will be performed but results cannot be saved")
@@ -111,14 +345,47 @@ def main():
     config_manager = ConfigManager(args.config_file)
     
     # Initialize downloader and analyzer
-    downloader = EarningsDocDownloader(config_manager)
-    analyzer = EarningsAnalyzer()
+    downloader = EarningsDocDownloader(config_manager, refresh_policy=args.refresh_downloads)
+    analyzer = EarningsAnalyzer(ingestion_mode=args.ingestion_mode)
     
     # List companies if requested
     if args.list_companies:
         list_available_companies(config_manager)
         return
     
+    # Report or enforce storage use if requested
+    if args.storage_usage or args.enforce_quota:
+        if args.enforce_quota:
+            evicted = downloader.storage_manager.enforce_quota()
+            print(f"\nEvicted {len(evicted)} items")
+        print_storage_usage(downloader.storage_manager.usage())
+        return
+    
+    # Check the integrity of the downloads if requested
+    if args.verify_downloads or args.repair_downloads:
+        verify_downloads(downloader.blob_store, repair=args.repair_downloads)
+        return
+    
+    # Prefetch every company's latest documents if requested
+    if args.download_all:
+        download_all_companies(downloader)
+        return
+    
+    # Search downloaded filings if requested
+    if args.search:
+        search_filings(analyzer.retrieval_index, args.search, args.ticker)
+        return
+    
+    # Resolve the latency tier (model and generation settings) for this run
+    try:
+        tier = config_manager.get_latency_tier(args.tier, ticker=args.ticker)
+        triage_tier = config_manager.get_triage_tier() if args.triage else None
+    except ValueError as e:
+        logging.error(str(e))
+        return
+    if tier:
+        logging.info(f"Using latency tier '{tier['name']}' ({tier['model']})")
+    
     # Check if ticker is provided
     if not args.ticker and not args.custom_url:
         logging.error("Please provide either --ticker or --custom-url.")
@@ -163,30 +430,39 @@ def main():
             if 'call_transcript' in release_data and 'seekingalpha.com' in release_data['call_transcript']:
                 logging.warning("SeekingAlpha transcripts require a subscription. Consider finding an alternative source.")
         
-        # Analyze documents
-        analysis = analyzer.analyze_earnings_documents(
-            download_result['files'], company_info['name'], download_result['quarter'], download_result['year']
+        analysis_args = (download_result['files'], company_info['name'], download_result['quarter'], download_result['year'])
+        if args.dry_run:
+            print_token_estimate(analyzer.estimate_request(*analysis_args, tier=tier))
+            return
+        
+        output_path = os.path.join(
+            args.output_dir,
+            f"{company_info['ticker'].lower()}_{download_result['year']}_{download_result['quarter']}_combined_gcp_impact.md"
         )
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        # Analyze documents
+        analysis = run_analysis(analyzer, args, analysis_args, output_path, tier, triage_tier)
+        
+        if report_failed_analysis(analysis, output_path):
+            return
         
         # Format the result
         result = {
-            'content': analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else analysis,
+            'content': analysis['analysis'],
             'ticker': company_info['ticker'],
             'company': company_info['name'],
             'quarter': download_result['quarter'],
             'year': download_result['year'],
             'documents': download_result['files'],
-            'release_date': release_data.get('date', 'Unknown')
+            'release_date': release_data.get('date', 'Unknown'),
+            'model': analysis.get('model')
         }
         
-        # Save the analysis
-        output_path = os.path.join(
-            args.output_dir,
-            f"{company_info['ticker'].lower()}_{download_result['year']}_{download_result['quarter']}_combined_gcp_impact.md"
-        )
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(result['content'])
+        # Save the analysis (already written chunk by chunk when streaming)
+        if not args.stream:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(result['content'])
         logging.info(f"Analysis saved to {output_path}")
         
         # Add ticker for email generation
@@ -218,33 +494,52 @@ def main():
         
         # For custom URLs, analyze as a single document
         documents = {args.file_type: {'path': file_path, 'url': args.custom_url}}
-        analysis = analyzer.analyze_earnings_documents(
-            documents,
-            "Custom Company",
-            "Custom",
-            timestamp
+        analysis_args = (documents, "Custom Company", "Custom", timestamp)
+        if args.dry_run:
+            print_token_estimate(analyzer.estimate_request(*analysis_args, tier=tier))
+            return
+        
+        output_path = os.path.join(
+            args.output_dir,
+            f"custom_{datetime.now().strftime('%Y%m%d_%H%M%S')}_combined_gcp_impact.md"
         )
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        analysis = run_analysis(analyzer, args, analysis_args, output_path, tier, triage_tier)
+        
+        if report_failed_analysis(analysis, output_path):
+            return
         
         # Format the result
         result = {
-            'content': analysis['analysis'] if isinstance(analysis, dict) and 'analysis' in analysis else analysis,
+            'content': analysis['analysis'],
             'ticker': 'custom',
             'company': 'Custom Company',
             'quarter': 'Custom',
             'year': timestamp,
-            'documents': [file_path]
+            'documents': [file_path],
+            'model': analysis.get('model')
         }
         
-        # Save the analysis
-        output_path = os.path.join(
-            args.output_dir,
-            f"custom_{datetime.now().strftime('%Y%m%d_%H%M%S')}_combined_gcp_impact.md"
-        )
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(result['content'])
+        # Save the analysis (already written chunk by chunk when streaming)
+        if not args.stream:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(result['content'])
         logging.info(f"Analysis saved to {output_path}")
     
+    cache_stats = analyzer.result_cache.stats()
+    logging.info(f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    generation_stats = analyzer.metrics.stats()
+    if generation_stats['truncated']:
+        logging.info(f"Truncated generations: {generation_stats['truncated']} of {generation_stats['generations']}, "
+                     f"recovered with {generation_stats['continuations']} continuations "
+                     f"({generation_stats['continuation_output_tokens']} output tokens)")
+    if generation_stats['hedged'] or generation_stats['deadline_exceeded']:
+        logging.info(f"Gemini calls: {generation_stats['calls']}, hedged {generation_stats['hedged']} "
+                     f"(won {generation_stats['hedge_wins']}), missed deadline {generation_stats['deadline_exceeded']}; "
+                     f"latency p50/p95/p99 "
+                     f"{'/'.join(f'{generation_stats[key] or 0:.1f}s' for key in ('latency_p50', 'latency_p95', 'latency_p99'))}")
+    
     # Save analysis to output directory
     if result:
         # Generate email-friendly markdown
@@ -255,10 +550,10 @@ def main():
         analysis_path = os.path.join(args.output_dir, analysis_filename)
         
         try:
-        with open(analysis_path, 'w') as f:
-            f.write(email_markdown)
-        
-        logging.info(f"GCP impact analysis saved to {analysis_path} (email-friendly format)")
+            with open(analysis_path, 'w') as f:
+                f.write(email_markdown)
+            
+            logging.info(f"GCP impact analysis saved to {analysis_path} (email-friendly format)")
         except (OSError, PermissionError) as e:
             logging.error(f"Could not save analysis to {analysis_path}: {e}")
             print("\nAnalysis Results:")
@@ -268,27 +563,27 @@ def main():
         
         # Send email using the email configuration (if not skipped)
         if not args.skip_email:
-        try:
-            # Check if email_config.json exists
-            if os.path.exists(config.EMAIL_CONFIG_PATH):
-                logging.info(f"Sending analysis via email (configured in {config.EMAIL_CONFIG_PATH})")
+            try:
+                # Check if email_config.json exists
+                if os.path.exists(config.EMAIL_CONFIG_PATH):
+                    logging.info(f"Sending analysis via email (configured in {config.EMAIL_CONFIG_PATH})")
                     try:
-                email_result = send_analysis_email(analysis_path)
-                
-                if email_result.get('success', False):
-                    recipients = email_result.get('recipients', [])
-                    cc = email_result.get('cc', [])
-                    all_recipients = recipients + cc
-                    logging.info(f"Email sent successfully to {', '.join(all_recipients)}")
-                else:
-                    error = email_result.get('error', 'Unknown error')
-                    logging.info(f"Email not sent: {error}")
+                        email_result = send_analysis_email(analysis_path)
+                        
+                        if email_result.get('success', False):
+                            recipients = email_result.get('recipients', [])
+                            cc = email_result.get('cc', [])
+                            all_recipients = recipients + cc
+                            logging.info(f"Email sent successfully to {', '.join(all_recipients)}")
+                        else:
+                            error = email_result.get('error', 'Unknown error')
+                            logging.info(f"Email not sent: {error}")
                     except Exception as e:
                         logging.error(f"Error during email sending: {str(e)}")
                         logging.info("Email functionality skipped - you can still view the analysis file")
-            else:
-                logging.info(f"Email not sent ({config.EMAIL_CONFIG_PATH} not found)")
-        except Exception as e:
+                else:
+                    logging.info(f"Email not sent ({config.EMAIL_CONFIG_PATH} not found)")
+            except Exception as e:
                 logging.error(f"Error in email configuration: {str(e)}")
                 logging.info("Analysis completed but email functionality was skipped")
         else:
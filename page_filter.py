@@ -0,0 +1,153 @@
+import os
+import re
+import hashlib
+import logging
+
+import config
+from file_hashing import file_sha256
+from text_extraction import TextExtractor, PAGE_SEPARATOR
+
+# Reduced documents are cached in this subdirectory of each download directory
+PAGE_CACHE_DIRNAME = '.page_cache'
+
+# Terms that mark a page as relevant to a GCP-impact analysis, with weights
+RELEVANCE_TERMS = {
+    'cloud': 3.0, 'azure': 3.0, 'aws': 3.0, 'google cloud': 3.0, 'gcp': 3.0,
+    'artificial intelligence': 3.0, 'ai': 2.0, 'generative': 2.0, 'machine learning': 2.0,
+    'gpu': 2.0, 'accelerator': 2.0, 'data center': 2.5, 'datacenter': 2.5, 'infrastructure': 1.5,
+    'capital expenditure': 2.5, 'capex': 2.5, 'property and equipment': 1.5,
+    'segment': 1.5, 'operating income': 1.0, 'revenue': 1.0, 'growth': 1.0, 'guidance': 1.5,
+    'outlook': 1.5, 'customers': 1.0, 'enterprise': 1.0, 'partnership': 1.0, 'backlog': 1.5,
+    'remaining performance obligation': 1.5, 'subscription': 1.0, 'saas': 1.5,
+}
+
+# Boilerplate that should push a page down the ranking
+BOILERPLATE_TERMS = {
+    'forward-looking statements': 6.0, 'safe harbor': 6.0, 'risks and uncertainties': 3.0,
+    'reconciliation of gaap': 4.0, 'non-gaap financial measures': 3.0, 'securities and exchange commission': 2.0,
+    'undue reliance': 4.0, 'investor relations': 1.0, 'this press release': 1.0,
+}
+
+_TERM_PATTERNS = {
+    term: re.compile(r'\b' + re.escape(term) + r'\b')
+    for term in list(RELEVANCE_TERMS) + list(BOILERPLATE_TERMS)
+}
+
+def score_page(text):
+    """
+    Score a page's relevance to cloud, AI, capex and segment topics.
+
+    Args:
+        text (str): Page text
+
+    Returns:
+        float: Weighted keyword hits per 1,000 characters, minus boilerplate penalties
+    """
+    lowered = text.lower()
+    if not lowered.strip():
+        return 0.0
+
+    relevance = sum(weight * len(_TERM_PATTERNS[term].findall(lowered)) for term, weight in RELEVANCE_TERMS.items())
+    boilerplate = sum(weight * len(_TERM_PATTERNS[term].findall(lowered)) for term, weight in BOILERPLATE_TERMS.items())
+
+    # Normalize so long, table-heavy pages do not win on length alone
+    return (relevance - boilerplate) * 1000.0 / max(len(lowered), 1000)
+
+class PageFilter:
+    """
+    Cuts documents down to their most relevant pages before they are sent.
+
+    Each page is scored for cloud/AI/capex/segment keywords; the first page
+    (headline results) plus the highest-scoring pages up to the page budget
+    are kept in their original order. PDFs are rewritten as a smaller PDF and
+    extracted text as a smaller text bundle, cached next to the downloads in
+    <download dir>/.page_cache/.
+    """
+
+    def __init__(self, text_extractor=None, page_budget=None, enabled=None):
+        self.text_extractor = text_extractor or TextExtractor()
+        self.page_budget = page_budget or config.PAGE_FILTER_BUDGET
+        self.enabled = config.PAGE_FILTER_ENABLED if enabled is None else enabled
+
+    def select_pages(self, page_texts):
+        """
+        Choose which pages to keep.
+
+        Args:
+            page_texts (list): Text of each page, in order
+
+        Returns:
+            list: Sorted 0-based indices of the pages to keep
+        """
+        if len(page_texts) <= self.page_budget:
+            return list(range(len(page_texts)))
+
+        ranked = sorted(range(1, len(page_texts)), key=lambda index: (-score_page(page_texts[index]), index))
+        return sorted([0] + ranked[:self.page_budget - 1])
+
+    def reduce(self, file_path):
+        """
+        Build the reduced version of a document.
+
+        Args:
+            file_path (str): Path to a PDF, or to extracted text with PAGE_SEPARATOR between pages
+
+        Returns:
+            tuple: (path to send, 1-based selected page numbers, total page count), or
+                   (file_path, None, None) if the document was left whole
+        """
+        if not self.enabled:
+            return file_path, None, None
+
+        is_pdf = os.path.splitext(file_path)[1].lower() == '.pdf'
+        if is_pdf:
+            text_path = self.text_extractor.extract_many([file_path]).get(file_path)
+            if not text_path:
+                # Nothing to score (e.g. a scanned PDF), so send it whole
+                return file_path, None, None
+        else:
+            text_path = file_path
+
+        with open(text_path, 'r', encoding='utf-8', errors='replace') as f:
+            page_texts = f.read().split(PAGE_SEPARATOR)
+
+        selected = self.select_pages(page_texts)
+        if len(selected) == len(page_texts):
+            return file_path, None, None
+
+        page_numbers = [index + 1 for index in selected]
+        selection_id = hashlib.sha256(','.join(map(str, page_numbers)).encode('utf-8')).hexdigest()[:12]
+        reduced_path = os.path.join(
+            os.path.dirname(file_path), PAGE_CACHE_DIRNAME,
+            f"{file_sha256(file_path)}_{selection_id}{'.pdf' if is_pdf else '.txt'}"
+        )
+
+        if not os.path.exists(reduced_path):
+            try:
+                os.makedirs(os.path.dirname(reduced_path), exist_ok=True)
+                tmp_path = f"{reduced_path}.{os.getpid()}.tmp"
+                if is_pdf:
+                    self._write_pdf(file_path, selected, tmp_path)
+                else:
+                    self._write_text(page_texts, selected, tmp_path)
+                os.replace(tmp_path, reduced_path)
+            except Exception as e:
+                logging.warning(f"Could not build reduced copy of {file_path}, sending it whole: {str(e)}")
+                return file_path, None, None
+
+        logging.info(f"Kept pages {page_numbers} of {len(page_texts)} from {os.path.basename(file_path)}")
+        return reduced_path, page_numbers, len(page_texts)
+
+    def _write_pdf(self, file_path, selected, output_path):
+        from PyPDF2 import PdfReader, PdfWriter
+        reader = PdfReader(file_path)
+        writer = PdfWriter()
+        for index in selected:
+            writer.add_page(reader.pages[index])
+        with open(output_path, 'wb') as f:
+            writer.write(f)
+
+    def _write_text(self, page_texts, selected, output_path):
+        # Keep original page numbers in the text so the model can cite them
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(PAGE_SEPARATOR.join(f"[Page {index + 1}]\n{page_texts[index]}" for index in selected))
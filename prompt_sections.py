@@ -0,0 +1,42 @@
+def split_prompt_sections(prompt):
+    """
+    Split an analysis prompt into its '## ' report sections.
+
+    The prompt format is an introduction, then one '## Heading' per report
+    section followed by its bullet points, then closing formatting
+    instructions separated from the last section by a blank line.
+
+    Args:
+        prompt (str): Rendered prompt text
+
+    Returns:
+        dict: 'preamble' (text before the first section), 'sections' (list of
+              dicts with 'title' and 'body') and 'instructions' (text after
+              the last section)
+    """
+    preamble = []
+    sections = []
+    instructions = []
+    in_section = False
+
+    for raw_line in prompt.strip().splitlines():
+        line = raw_line.strip()
+        if line.startswith('## '):
+            sections.append({'title': line[3:].strip(), 'body': []})
+            in_section = True
+        elif in_section and line:
+            sections[-1]['body'].append(line)
+        elif in_section:
+            # A blank line after the bullets closes the section; later text is
+            # instructions until the next heading
+            in_section = not sections[-1]['body']
+        elif sections:
+            instructions.append(line)
+        else:
+            preamble.append(line)
+
+    return {
+        'preamble': '\n'.join(preamble).strip(),
+        'sections': [{'title': section['title'], 'body': '\n'.join(section['body'])} for section in sections],
+        'instructions': '\n'.join(instructions).strip()
+    }
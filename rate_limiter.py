@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+import httpx
+from google.genai import errors
+
+import config
+from hedging import DeadlineExceededError
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are being short-circuited."""
+
+class RateLimiter:
+    """
+    Client-side quota guard for Gemini calls.
+
+    Combines two token buckets (requests per minute and tokens per minute),
+    exponential backoff with jitter that honors server retry hints, and a
+    circuit breaker that stops calling the API during outages. Bucket and
+    breaker state live in a small JSON file guarded by an advisory file
+    lock, so every thread and every gunicorn worker process on the host
+    draws from the same quota.
+    """
+
+    def __init__(self, state_path=None, requests_per_minute=None, tokens_per_minute=None, enabled=None):
+        self.state_path = state_path or config.RATE_LIMIT_STATE_PATH
+        self.lock_path = f"{self.state_path}.lock"
+        self.requests_per_minute = requests_per_minute or config.RATE_LIMIT_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or config.RATE_LIMIT_TOKENS_PER_MINUTE
+        self.enabled = config.RATE_LIMIT_ENABLED if enabled is None else enabled
+
+        self.max_attempts = config.RETRY_MAX_ATTEMPTS
+        self.base_delay = config.RETRY_BASE_DELAY_SECONDS
+        self.max_delay = config.RETRY_MAX_DELAY_SECONDS
+        self.failure_threshold = config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.cooldown_seconds = config.CIRCUIT_BREAKER_COOLDOWN_SECONDS
+
+        # Fallback for platforms without fcntl (only protects a single process)
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+
+    @contextmanager
+    def _locked_state(self):
+        """Load the shared state under an exclusive lock and save it on exit."""
+        with self._thread_lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.state_path, 'r', encoding='utf-8') as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = {}
+
+                yield state
+
+                tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refill(self, bucket, capacity, now):
+        """Refill a bucket in place at capacity-per-minute and return its level."""
+        level = bucket.get('level', capacity)
+        updated = bucket.get('updated', now)
+        level = min(capacity, level + (now - updated) * capacity / 60.0)
+        bucket['level'] = level
+        bucket['updated'] = now
+        return level
+
+    def _try_acquire(self, estimated_tokens):
+        """
+        Take one request and the estimated tokens from the shared buckets.
+
+        Returns:
+            float: 0 if acquired, otherwise seconds to wait before trying again
+        """
+        now = time.time()
+        with self._locked_state() as state:
+            breaker = state.setdefault('breaker', {})
+            if breaker.get('open_until', 0) > now:
+                raise CircuitOpenError(
+                    f"Gemini circuit breaker is open for another {breaker['open_until'] - now:.0f}s "
+                    f"after {breaker.get('failures', 0)} consecutive failures"
+                )
+            half_open = breaker.get('failures', 0) >= self.failure_threshold
+            if half_open and breaker.get('trial_until', 0) > now:
+                raise CircuitOpenError("Gemini circuit breaker is half-open and a trial call is in flight")
+
+            request_bucket = state.setdefault('requests', {})
+            token_bucket = state.setdefault('tokens', {})
+            request_level = self._refill(request_bucket, self.requests_per_minute, now)
+            token_level = self._refill(token_bucket, self.tokens_per_minute, now)
+
+            # A single request larger than the whole minute's budget waits for a full bucket
+            needed_tokens = min(estimated_tokens, self.tokens_per_minute)
+
+            if request_level >= 1 and token_level >= needed_tokens:
+                request_bucket['level'] = request_level - 1
+                token_bucket['level'] = token_level - needed_tokens
+                if half_open:
+                    # Let exactly one caller probe the API after the cooldown
+                    breaker['trial_until'] = now + self.cooldown_seconds
+                return 0
+
+            request_wait = max(0.0, (1 - request_level) * 60.0 / self.requests_per_minute)
+            token_wait = max(0.0, (needed_tokens - token_level) * 60.0 / self.tokens_per_minute)
+            return max(request_wait, token_wait, 0.05)
+
+    def acquire(self, estimated_tokens=0):
+        """Block until the request fits within the shared quota."""
+        if not self.enabled:
+            return
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if not wait:
+                return
+            logging.info(f"Rate limit reached, waiting {wait:.1f}s")
+            time.sleep(min(wait, 5))
+
+    async def acquire_async(self, estimated_tokens=0):
+        """Async counterpart of acquire that neither waits for the state lock nor sleeps on the event loop."""
+        if not self.enabled:
+            return
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, estimated_tokens)
+            if not wait:
+                return
+            logging.info(f"Rate limit reached, waiting {wait:.1f}s")
+            await asyncio.sleep(min(wait, 5))
+
+    def record_usage(self, token_delta):
+        """
+        Correct the token bucket once actual usage is known.
+
+        Args:
+            token_delta (int): Actual tokens used minus the estimate taken at acquire time
+        """
+        if not self.enabled or not token_delta:
+            return
+        with self._locked_state() as state:
+            token_bucket = state.setdefault('tokens', {})
+            level = self._refill(token_bucket, self.tokens_per_minute, time.time())
+            token_bucket['level'] = level - token_delta
+
+    def _record_outcome(self, success):
+        """
+        Update the shared circuit breaker after a call.
+
+        Args:
+            success (bool): True if the model answered, False for an outage-like
+                            failure, None if the call says nothing about the API's health
+        """
+        if not self.enabled:
+            return
+        with self._locked_state() as state:
+            breaker = state.setdefault('breaker', {})
+            if success:
+                state['breaker'] = {}
+                return
+            if success is None:
+                # Let another caller probe a half-open breaker
+                breaker['trial_until'] = 0
+                return
+            breaker['failures'] = breaker.get('failures', 0) + 1
+            breaker['trial_until'] = 0
+            if breaker['failures'] >= self.failure_threshold:
+                breaker['open_until'] = time.time() + self.cooldown_seconds
+                logging.error(f"Opening Gemini circuit breaker for {self.cooldown_seconds}s "
+                              f"after {breaker['failures']} consecutive failures")
+
+    def _record_error(self, error):
+        """
+        Count server errors and transport failures towards the breaker.
+
+        Client errors (bad requests, auth, quota) never reached the model, so
+        they neither count as failures nor close the breaker. Neither does a
+        missed deadline: the caller chose how long to wait, which says nothing
+        about whether the API is down.
+        """
+        if isinstance(error, DeadlineExceededError):
+            self._record_outcome(None)
+        elif isinstance(error, errors.APIError) and (error.code is None or error.code >= 500):
+            self._record_outcome(False)
+        elif isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+            self._record_outcome(False)
+        else:
+            self._record_outcome(None)
+
+    def _retry_delay(self, error, attempt):
+        """
+        Return how long to wait before retrying, or None if the error is not retryable.
+
+        Server hints (RetryInfo details or a Retry-After header) take precedence
+        over exponential backoff with full jitter.
+        """
+        if isinstance(error, DeadlineExceededError):
+            # The call already had its full deadline (and hedge); retrying would break the time promise
+            return None
+        if isinstance(error, errors.APIError):
+            if error.code not in RETRYABLE_STATUS_CODES:
+                return None
+            hint = _server_retry_hint(error)
+            if hint is not None:
+                return min(hint, self.max_delay) + random.uniform(0, 1)
+        elif not isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+            return None
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, estimated_tokens=0):
+        """
+        Call fn within the shared quota, retrying transient failures.
+
+        A call counts once towards the circuit breaker: as a failure only if
+        its last attempt fails, so retries do not trip the breaker on their own.
+
+        Args:
+            fn (callable): Zero-argument function performing one Gemini request
+            estimated_tokens (int): Expected tokens for the request
+
+        Returns:
+            The return value of fn
+        """
+        for attempt in range(self.max_attempts):
+            self.acquire(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_attempts - 1:
+                    self._record_error(e)
+                    raise
+                # Only the outcome of the whole call counts; free a half-open breaker for the retry
+                self._record_outcome(None)
+                logging.warning(f"Gemini call failed ({str(e)[:100]}), retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 2}/{self.max_attempts})")
+                time.sleep(delay)
+                continue
+            self._record_outcome(True)
+            return result
+
+    async def call_async(self, coro_fn, estimated_tokens=0):
+        """
+        Async counterpart of call.
+
+        Args:
+            coro_fn (callable): Zero-argument function returning a coroutine for one Gemini request
+            estimated_tokens (int): Expected tokens for the request
+
+        Returns:
+            The result of the awaited coroutine
+        """
+        for attempt in range(self.max_attempts):
+            await self.acquire_async(estimated_tokens)
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_attempts - 1:
+                    await asyncio.to_thread(self._record_error, e)
+                    raise
+                # Only the outcome of the whole call counts; free a half-open breaker for the retry
+                await asyncio.to_thread(self._record_outcome, None)
+                logging.warning(f"Gemini call failed ({str(e)[:100]}), retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 2}/{self.max_attempts})")
+                await asyncio.sleep(delay)
+                continue
+            await asyncio.to_thread(self._record_outcome, True)
+            return result
+
+def _server_retry_hint(error):
+    """Extract a retry delay in seconds from an API error, if the server sent one."""
+    # google.rpc.RetryInfo, e.g. {"@type": ".../google.rpc.RetryInfo", "retryDelay": "27s"}
+    details = error.details.get('error', {}).get('details', []) if isinstance(error.details, dict) else []
+    for detail in details:
+        if isinstance(detail, dict) and detail.get('@type', '').endswith('RetryInfo'):
+            try:
+                return float(str(detail.get('retryDelay', '')).rstrip('s'))
+            except ValueError:
+                pass
+
+    headers = getattr(error.response, 'headers', None) or {}
+    retry_after = headers.get('retry-after') or headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return None
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import config
+from file_hashing import file_sha256
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache for analysis results.
+
+    Entries are keyed on the SHA-256 of every input file together with the
+    rendered prompt, the model id and the comparative flag, so a result is
+    reused only when the exact same request would be sent to Gemini again.
+    Each entry is stored as a JSON file; its modification time doubles as the
+    last-access time used for LRU eviction.
+    """
+
+    def __init__(self, cache_dir=None, max_size_mb=None, max_age_hours=None, enabled=None):
+        self.cache_dir = cache_dir or config.RESULT_CACHE_DIR
+        self.max_bytes = int((max_size_mb if max_size_mb is not None else config.RESULT_CACHE_MAX_MB) * 1024 * 1024)
+        self.max_age_seconds = (max_age_hours if max_age_hours is not None else config.RESULT_CACHE_MAX_AGE_HOURS) * 3600
+        self.enabled = config.RESULT_CACHE_ENABLED if enabled is None else enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except (OSError, PermissionError) as e:
+                logging.warning(f"Could not create result cache directory {self.cache_dir}: {e}. Caching disabled.")
+                self.enabled = False
+
+    @staticmethod
+    def make_key(file_paths, prompt, model, is_comparative=False, generation=None):
+        """
+        Build a cache key for an analysis request.
+
+        Args:
+            file_paths (list): List of (doc_key, file_path) tuples sent to the model
+            prompt (str): Fully rendered prompt text
+            model (str): Gemini model id
+            is_comparative (bool): Whether this is a comparative analysis
+            generation (dict): Generation settings such as thinking budget and temperature
+
+        Returns:
+            str: Hex-encoded SHA-256 cache key
+        """
+        key_material = {
+            'files': [[doc_key, file_sha256(file_path)] for doc_key, file_path in file_paths],
+            'prompt': prompt,
+            'model': model,
+            'is_comparative': bool(is_comparative)
+        }
+        # Only part of the key when set, so keys for default settings stay unchanged
+        if generation:
+            key_material['generation'] = generation
+        encoded = json.dumps(key_material, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Args:
+            key (str): Cache key from make_key()
+
+        Returns:
+            dict: The cached result, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            if time.time() - os.path.getmtime(entry_path) > self.max_age_seconds:
+                with self._lock:
+                    self.evictions += self._remove(entry_path)
+                raise FileNotFoundError(entry_path)
+
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+
+            # Touch the entry so LRU eviction sees it as recently used
+            os.utime(entry_path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logging.info(f"Result cache hit for key {key[:12]}")
+        return entry.get('result')
+
+    def put(self, key, result):
+        """
+        Store a result and evict old entries if the cache is over its limits.
+
+        Args:
+            key (str): Cache key from make_key()
+            result (dict): Analysis result to store
+        """
+        if not self.enabled:
+            return
+
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created_at': time.time(), 'result': result}, f)
+            os.replace(tmp_path, entry_path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not write result cache entry {key[:12]}: {e}")
+            self._remove(tmp_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then least-recently-used entries until the
+        cache fits within its size limit.
+
+        Returns:
+            int: Number of entries removed
+        """
+        if not self.enabled:
+            return 0
+
+        entries = []
+        now = time.time()
+        removed = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            entry_path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                removed += self._remove(entry_path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            removed += self._remove(entry_path)
+            total_size -= size
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logging.info(f"Evicted {removed} result cache entries")
+        return removed
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        if not self.enabled:
+            return
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.json'):
+                self._remove(os.path.join(self.cache_dir, filename))
+
+    def stats(self):
+        """Return hit/miss/eviction counters for this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0
+            }
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
@@ -0,0 +1,334 @@
+import os
+import re
+import json
+import gzip
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+
+import config
+from file_hashing import file_sha256
+from text_extraction import TextExtractor, PAGE_SEPARATOR
+
+# File types indexed from the downloads directory
+INDEXED_EXTENSIONS = ('.pdf', '.txt', '.md', '.html', '.htm')
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out over
+own same she should so some such than that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def chunk_pages(page_texts, chunk_words, overlap_words):
+    """
+    Split page texts into overlapping word windows that never cross a page.
+
+    Returns:
+        list: (page_number, chunk_text) tuples with 1-based page numbers
+    """
+    chunks = []
+    step = max(1, chunk_words - overlap_words)
+    for page_number, page_text in enumerate(page_texts, start=1):
+        words = page_text.split()
+        for start in range(0, len(words), step):
+            chunks.append((page_number, ' '.join(words[start:start + chunk_words])))
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+class RetrievalIndex:
+    """
+    Local BM25 index over chunked text of the downloaded filings.
+
+    Each document version is indexed once into a compressed segment file
+    named by its SHA-256 (chunk texts plus per-chunk term frequencies), and
+    a manifest maps files under the downloads directory to their segments.
+    update() only extracts and indexes files whose size or modification
+    time changed, so new downloads are picked up incrementally. Segments are
+    merged into in-memory postings on first query, after which lookups take
+    milliseconds.
+    """
+
+    def __init__(self, index_dir=None, storage_path=None, text_extractor=None, chunk_words=None, overlap_words=None):
+        self.index_dir = index_dir or config.RETRIEVAL_INDEX_DIR
+        self.storage_path = storage_path or config.LOCAL_STORAGE_PATH
+        self.text_extractor = text_extractor or TextExtractor()
+        self.chunk_words = chunk_words or config.RETRIEVAL_CHUNK_WORDS
+        self.overlap_words = overlap_words if overlap_words is not None else config.RETRIEVAL_CHUNK_OVERLAP_WORDS
+
+        self.manifest_path = os.path.join(self.index_dir, 'manifest.json')
+        self.segments_dir = os.path.join(self.index_dir, 'segments')
+
+        self._lock = threading.Lock()
+        self._manifest = self._load_manifest()
+        self._loaded_segments = None
+        self._chunks = []
+        self._postings = {}
+        self._avg_length = 0.0
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'files': {}}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read retrieval index manifest {self.manifest_path}: {e}")
+            return {'files': {}}
+
+    def _save_manifest(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _segment_path(self, sha256):
+        return os.path.join(self.segments_dir, f"{sha256}.json.gz")
+
+    def _scan(self):
+        """Yield (relative_path, absolute_path) for every indexable file under the downloads directory."""
+        for root, dirs, files in os.walk(self.storage_path):
+            # Skip derived-artifact directories such as .text_cache and .page_cache
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for filename in sorted(files):
+                if os.path.splitext(filename)[1].lower() in INDEXED_EXTENSIONS:
+                    file_path = os.path.join(root, filename)
+                    yield os.path.relpath(file_path, self.storage_path), file_path
+
+    def update(self):
+        """
+        Bring the index up to date with the downloads directory.
+
+        Returns:
+            dict: Counts of 'added', 'removed' and 'unchanged' files
+        """
+        with self._lock:
+            files = self._manifest.setdefault('files', {})
+            seen = set()
+            changed = []
+            unchanged = 0
+
+            for relative_path, file_path in self._scan():
+                seen.add(relative_path)
+                stat = os.stat(file_path)
+                entry = files.get(relative_path)
+                if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    unchanged += 1
+                    continue
+                changed.append((relative_path, file_path, stat))
+
+            # Extract all new documents in one parallel batch
+            to_index = [(relative_path, file_path, stat, file_sha256(file_path))
+                        for relative_path, file_path, stat in changed]
+            missing = [file_path for _, file_path, _, sha256 in to_index
+                       if not os.path.exists(self._segment_path(sha256))]
+            extracted = self.text_extractor.extract_many(missing, min_chars=1) if missing else {}
+
+            added = 0
+            for relative_path, file_path, stat, sha256 in to_index:
+                if file_path in extracted:
+                    if extracted[file_path]:
+                        self._write_segment(sha256, extracted[file_path])
+                    else:
+                        # Record it with no chunks so it is not extracted again on every update
+                        logging.warning(f"No text to index in {relative_path}")
+                        self._store_segment(sha256, [])
+                files[relative_path] = {
+                    'sha256': sha256,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'indexed_at': time.time()
+                }
+                added += 1
+
+            removed = [relative_path for relative_path in files if relative_path not in seen]
+            removed_shas = {files[relative_path]['sha256'] for relative_path in removed}
+            for relative_path in removed:
+                del files[relative_path]
+
+            # Drop segments of documents that are gone (e.g. evicted) and not indexed under another path
+            for sha256 in removed_shas - {entry['sha256'] for entry in files.values()}:
+                try:
+                    os.remove(self._segment_path(sha256))
+                except OSError:
+                    pass
+
+            if added or removed:
+                self._save_manifest()
+                self._loaded_segments = None
+                logging.info(f"Retrieval index updated: {added} added, {len(removed)} removed, {unchanged} unchanged")
+
+            return {'added': added, 'removed': len(removed), 'unchanged': unchanged}
+
+    def _write_segment(self, sha256, text_path):
+        """Chunk extracted text and store the chunks with their term frequencies."""
+        with open(text_path, 'r', encoding='utf-8', errors='replace') as f:
+            page_texts = f.read().split(PAGE_SEPARATOR)
+
+        chunks = []
+        for page_number, chunk_text in chunk_pages(page_texts, self.chunk_words, self.overlap_words):
+            terms = Counter(tokenize(chunk_text))
+            if terms:
+                chunks.append({'page': page_number, 'text': chunk_text, 'terms': dict(terms)})
+        self._store_segment(sha256, chunks)
+
+    def _store_segment(self, sha256, chunks):
+        """Atomically write a document's chunks to its segment file."""
+        os.makedirs(self.segments_dir, exist_ok=True)
+        segment_path = self._segment_path(sha256)
+        tmp_path = f"{segment_path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({'sha256': sha256, 'chunks': chunks}, f, separators=(',', ':'))
+        os.replace(tmp_path, segment_path)
+
+    def _ensure_loaded(self):
+        """Merge the segments of all indexed files into in-memory postings."""
+        files = self._manifest.get('files', {})
+        segment_set = tuple(sorted((path, entry['sha256']) for path, entry in files.items()))
+        if self._loaded_segments == segment_set:
+            return
+
+        chunks = []
+        postings = defaultdict(list)
+        for relative_path, sha256 in segment_set:
+            try:
+                with gzip.open(self._segment_path(sha256), 'rt', encoding='utf-8') as f:
+                    segment = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not read index segment for {relative_path}: {e}")
+                continue
+
+            parts = relative_path.replace(os.sep, '/').split('/')
+            ticker = parts[0] if len(parts) > 2 else None
+            period = parts[1] if len(parts) > 2 else None
+            for number, chunk in enumerate(segment['chunks']):
+                chunk_id = len(chunks)
+                chunks.append({
+                    'path': relative_path,
+                    'ticker': ticker,
+                    'period': period,
+                    'page': chunk['page'],
+                    'chunk': number,
+                    'text': chunk['text'],
+                    'length': sum(chunk['terms'].values())
+                })
+                for term, frequency in chunk['terms'].items():
+                    postings[term].append((chunk_id, frequency))
+
+        self._chunks = chunks
+        self._postings = dict(postings)
+        self._avg_length = sum(chunk['length'] for chunk in chunks) / len(chunks) if chunks else 0.0
+        self._loaded_segments = segment_set
+
+    def search(self, query, k=None, tickers=None, periods=None, paths=None):
+        """
+        Return the top passages for a query by BM25 score.
+
+        Args:
+            query (str): Free-text query
+            k (int): Number of passages (default: config.RETRIEVAL_TOP_K)
+            tickers (list): Only search these tickers (lowercase download directory names)
+            periods (list): Only search these periods, e.g. ['2025_Q1']
+            paths (list): Only search these files (paths to documents under the downloads directory)
+
+        Returns:
+            list: Dicts with 'score', 'path', 'ticker', 'period', 'page', 'chunk' and 'text', best first
+        """
+        k = k or config.RETRIEVAL_TOP_K
+        with self._lock:
+            self._ensure_loaded()
+            chunks, postings, avg_length = self._chunks, self._postings, self._avg_length
+
+        if not chunks:
+            return []
+
+        ticker_filter = {ticker.lower() for ticker in tickers} if tickers else None
+        period_filter = set(periods) if periods else None
+        path_filter = {self._relative(path) for path in paths} if paths else None
+
+        def allowed(chunk):
+            return ((ticker_filter is None or (chunk['ticker'] or '').lower() in ticker_filter) and
+                    (period_filter is None or chunk['period'] in period_filter) and
+                    (path_filter is None or chunk['path'] in path_filter))
+
+        total = len(chunks)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_postings = postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (total - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for chunk_id, frequency in term_postings:
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * chunks[chunk_id]['length'] / avg_length)
+                scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+
+        ranked = sorted((chunk_id for chunk_id in scores if allowed(chunks[chunk_id])),
+                        key=lambda chunk_id: (-scores[chunk_id], chunk_id))
+        return [
+            dict({key: value for key, value in chunks[chunk_id].items() if key != 'length'}, score=scores[chunk_id])
+            for chunk_id in ranked[:k]
+        ]
+
+    def _relative(self, path):
+        """Map a document path to its manifest key, relative to the downloads directory."""
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.storage_path))
+
+    def build_section_context(self, sections, paths, labels, k=None):
+        """
+        Assemble the top passages for each report section into a text bundle.
+
+        Args:
+            sections (list): Section dicts with 'title' and 'body' (see prompt_sections)
+            paths (list): Files to retrieve from
+            labels (dict): Maps each path in paths to its document label
+            k (int): Passages per section
+
+        Returns:
+            str: Passages grouped by section, each tagged with its source document and page
+        """
+        label_by_relative = {self._relative(path): label for path, label in labels.items()}
+        first_section = {}
+        blocks = []
+        for section in sections:
+            passages = self.search(f"{section['title']}\n{section['body']}", k=k, paths=paths)
+            lines = [f"=== PASSAGES FOR SECTION: {section['title'].upper()} ==="]
+            for passage in passages:
+                source = label_by_relative.get(passage['path'], passage['path'])
+                header = f"[Source: {source}, page {passage['page']}]"
+                passage_id = (passage['path'], passage['chunk'])
+                if passage_id in first_section:
+                    # Passages relevant to several sections are sent once
+                    lines.append(f"{header} (same passage as under {first_section[passage_id]})")
+                    continue
+                first_section[passage_id] = section['title'].upper()
+                lines.append(f"{header}\n{passage['text']}")
+            blocks.append('\n\n'.join(lines))
+        return '\n\n'.join(blocks)
+
+    def context_path(self, context_text):
+        """Store an assembled context bundle by content hash and return its path."""
+        digest = hashlib.sha256(context_text.encode('utf-8')).hexdigest()
+        path = os.path.join(self.index_dir, 'contexts', f"{digest}.txt")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(context_text)
+            os.replace(tmp_path, path)
+        return path
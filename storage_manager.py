@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+from config_manager import ConfigManager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+# Derived artifacts under CACHE_DIR that can be recreated and are evicted file by file
+ARTIFACT_DIRS = ('summaries', 'cluster_reports', os.path.join('retrieval_index', 'contexts'))
+
+# Usage-report label for artifacts that belong to no single ticker
+DERIVED_LABEL = '(derived)'
+
+class StorageManager:
+    """
+    Disk quota with least-recently-used eviction for downloads, reports and derived artifacts.
+
+    Storage is tracked in eviction units: a ticker's quarter of downloads
+    (downloads/<ticker>/<year>_<quarter>/ with its text, page and metadata
+    caches), a report under RESULTS_DIR, a result cache entry, or a derived
+    artifact under CACHE_DIR. A unit was last used at the later of its newest
+    modification time and the last access recorded with touch(). When total
+    usage exceeds the quota, the least recently used units are removed until
+    it fits; each configured ticker's latest quarter is never evicted, nor is
+    anything used in the last in_use_seconds, which another job may still be
+    reading.
+    """
+
+    def __init__(self, config_manager=None, blob_store=None, storage_path=None, results_dir=None, cache_dir=None,
+                 quota_mb=None, access_log_path=None, result_cache_dir=None, in_use_seconds=None):
+        self.config_manager = config_manager or ConfigManager()
+        self.blob_store = blob_store
+        self.storage_path = storage_path or config.LOCAL_STORAGE_PATH
+        self.results_dir = results_dir or config.RESULTS_DIR
+        self.cache_dir = cache_dir or config.CACHE_DIR
+        self.result_cache_dir = result_cache_dir or config.RESULT_CACHE_DIR
+        self.quota_bytes = int((quota_mb if quota_mb is not None else config.STORAGE_QUOTA_MB) * 1024 * 1024)
+        self.in_use_seconds = in_use_seconds if in_use_seconds is not None else config.STORAGE_IN_USE_SECONDS
+        self.access_log_path = access_log_path or config.STORAGE_ACCESS_LOG_PATH
+        self.lock_path = f"{self.access_log_path}.lock"
+        # Fallback for platforms without fcntl (only protects a single process)
+        self._thread_lock = threading.Lock()
+
+    def _load_access_log(self):
+        try:
+            with open(self.access_log_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read storage access log {self.access_log_path}: {e}")
+            return {}
+
+    def _write_access_log(self, accesses):
+        """Atomically replace the access log."""
+        try:
+            tmp_path = f"{self.access_log_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(accesses, f, indent=2)
+            os.replace(tmp_path, self.access_log_path)
+        except OSError as e:
+            logging.warning(f"Could not save storage access log {self.access_log_path}: {e}")
+
+    @contextmanager
+    def _locked_access_log(self):
+        """Load the access log under an exclusive lock and save it on exit."""
+        os.makedirs(os.path.dirname(self.access_log_path) or '.', exist_ok=True)
+        with self._thread_lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                accesses = self._load_access_log()
+                yield accesses
+                self._write_access_log(accesses)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def touch(self, *paths):
+        """
+        Record that documents or reports were used, so eviction treats them as recent.
+
+        Args:
+            *paths (str): Downloaded files, reports or artifacts
+        """
+        if not paths:
+            return
+        now = time.time()
+        with self._locked_access_log() as accesses:
+            for path in paths:
+                accesses[self._unit_path(path)] = now
+
+    def _unit_path(self, path):
+        """Return the eviction unit a path belongs to: its quarter directory for downloads, else the file."""
+        path = os.path.abspath(path)
+        storage_path = os.path.abspath(self.storage_path)
+        if path.startswith(storage_path + os.sep):
+            parts = os.path.relpath(path, storage_path).split(os.sep)
+            if len(parts) >= 2:
+                return os.path.join(storage_path, parts[0], parts[1])
+        return path
+
+    def _latest_periods(self):
+        """Map each configured ticker to its latest (year, quarter)."""
+        latest = {}
+        for ticker in self.config_manager.get_all_companies():
+            year, quarter, _ = self.config_manager.get_latest_release(ticker)
+            if year and quarter:
+                latest[ticker.lower()] = (year, quarter)
+        return latest
+
+    def scan(self):
+        """
+        List every eviction unit.
+
+        Returns:
+            list: Dicts with 'kind' ('download', 'report' or 'artifact'), 'ticker',
+                  'period', 'path', 'size' (bytes freed by removing it), 'last_access'
+                  (epoch seconds), 'pinned' and, for downloads, the document 'files'
+        """
+        accesses = self._load_access_log()
+        latest = self._latest_periods()
+        units = []
+
+        for ticker in self._subdirs(self.storage_path):
+            ticker_dir = os.path.join(self.storage_path, ticker)
+            for period in self._subdirs(ticker_dir):
+                unit = self._measure(os.path.join(ticker_dir, period), accesses)
+                year, quarter = latest.get(ticker.lower(), (None, None))
+                unit.update(kind='download', ticker=ticker.lower(), period=period,
+                            pinned=period == f"{year}_{quarter}")
+                units.append(unit)
+
+        if os.path.isdir(self.results_dir):
+            for filename in sorted(os.listdir(self.results_dir)):
+                file_path = os.path.join(self.results_dir, filename)
+                if filename.startswith('.') or not os.path.isfile(file_path):
+                    continue
+                ticker = filename.split('_', 1)[0].lower()
+                ticker = ticker if ticker in latest else DERIVED_LABEL
+                year, quarter = latest.get(ticker, (None, None))
+                unit = self._measure(file_path, accesses)
+                unit.update(kind='report', ticker=ticker, period=None,
+                            pinned=filename.lower().startswith(f"{ticker}_{year}_{quarter}_".lower()))
+                units.append(unit)
+
+        for file_path in self._artifact_paths():
+            unit = self._measure(file_path, accesses)
+            unit.update(kind='artifact', ticker=DERIVED_LABEL, period=None, pinned=False)
+            units.append(unit)
+
+        return units
+
+    def _subdirs(self, path):
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path)
+                      if not name.startswith('.') and os.path.isdir(os.path.join(path, name)))
+
+    def _artifact_paths(self):
+        """Yield derived artifacts and result cache entries that are safe to delete."""
+        directories = [os.path.join(self.cache_dir, name) for name in ARTIFACT_DIRS] + [self.result_cache_dir]
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                file_path = os.path.join(directory, filename)
+                if os.path.isfile(file_path) and not filename.endswith('.tmp'):
+                    yield file_path
+
+    def _measure(self, path, accesses):
+        """Size and last use of a file or directory unit."""
+        files = [path] if os.path.isfile(path) else [
+            os.path.join(root, filename) for root, _, filenames in os.walk(path) for filename in filenames
+        ]
+        size = 0
+        last_access = 0
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            # A download also linked from the blob store has two links; more means another path shares it
+            if stat.st_nlink <= 2:
+                size += stat.st_size
+            last_access = max(last_access, stat.st_mtime)
+        return {
+            'path': path,
+            'size': size,
+            'last_access': max(last_access, accesses.get(os.path.abspath(path), 0)),
+            'files': files
+        }
+
+    def total_usage(self):
+        """Bytes used by downloads, reports and the cache directory, counting hard-linked files once."""
+        seen = set()
+        total = 0
+        for directory in dict.fromkeys([self.storage_path, self.results_dir, self.cache_dir]):
+            for root, _, filenames in os.walk(directory):
+                for filename in filenames:
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except OSError:
+                        continue
+                    if (stat.st_dev, stat.st_ino) not in seen:
+                        seen.add((stat.st_dev, stat.st_ino))
+                        total += stat.st_size
+        return total
+
+    def usage(self):
+        """
+        Summarize storage use per ticker.
+
+        Returns:
+            dict: 'tickers' maps each ticker (and '(derived)') to 'downloads', 'reports',
+                  'artifacts' and 'pinned' bytes, 'quarters' and 'last_access'; plus
+                  'total' and 'quota' in bytes
+        """
+        tickers = {}
+        for unit in self.scan():
+            summary = tickers.setdefault(unit['ticker'], {
+                'downloads': 0, 'reports': 0, 'artifacts': 0, 'pinned': 0, 'quarters': 0, 'last_access': 0
+            })
+            summary[f"{unit['kind']}s"] += unit['size']
+            summary['quarters'] += int(unit['kind'] == 'download')
+            summary['pinned'] += unit['size'] if unit['pinned'] else 0
+            summary['last_access'] = max(summary['last_access'], unit['last_access'])
+        return {'tickers': tickers, 'total': self.total_usage(), 'quota': self.quota_bytes}
+
+    def enforce_quota(self, protect=None):
+        """
+        Evict least-recently-used units until usage fits within the quota.
+
+        Units used within the last in_use_seconds, by this or any other
+        process, are kept: a concurrent analysis may be reading them.
+
+        Args:
+            protect (list): Paths that must not be evicted now (e.g. documents about to be analyzed)
+
+        Returns:
+            list: The evicted units, as returned by scan()
+        """
+        if not self.quota_bytes:
+            return []
+        total = self.total_usage()
+        if total <= self.quota_bytes:
+            return []
+
+        protected = {self._unit_path(path) for path in (protect or [])}
+        in_use_since = time.time() - self.in_use_seconds
+        evicted = []
+        for unit in sorted(self.scan(), key=lambda unit: unit['last_access']):
+            if total <= self.quota_bytes:
+                break
+            if unit['pinned'] or unit['last_access'] > in_use_since or os.path.abspath(unit['path']) in protected:
+                continue
+            if self._remove(unit):
+                total -= unit['size']
+                evicted.append(unit)
+
+        if evicted:
+            with self._locked_access_log() as accesses:
+                for unit in evicted:
+                    accesses.pop(os.path.abspath(unit['path']), None)
+            logging.info(f"Evicted {len(evicted)} least recently used items to stay within the "
+                         f"{self.quota_bytes / 1024 / 1024:.0f} MB storage quota")
+        if total > self.quota_bytes:
+            logging.warning(f"Storage use of {total / 1024 / 1024:.0f} MB is still over the "
+                            f"{self.quota_bytes / 1024 / 1024:.0f} MB quota; the rest is pinned or in use")
+        return evicted
+
+    def _remove(self, unit):
+        """Delete an eviction unit, releasing stored documents no other download links to."""
+        try:
+            if os.path.isdir(unit['path']):
+                shutil.rmtree(unit['path'])
+            else:
+                os.remove(unit['path'])
+        except OSError as e:
+            logging.warning(f"Could not evict {unit['path']}: {e}")
+            return False
+        if unit['kind'] == 'download' and self.blob_store:
+            self.blob_store.forget(unit['files'])
+        logging.info(f"Evicted {unit['kind']} {unit['path']} ({unit['size'] / 1024:.0f} KB)")
+        return True
@@ -0,0 +1,674 @@
+#!/usr/bin/env python3
+"""
+Test script for the analyzer's generation paths with a stubbed Gemini client.
+Run this with: python test_analyzer.py
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+from google.genai import types, errors
+
+import config
+from analyzer import EarningsAnalyzer, DEFAULT_MODEL
+from rate_limiter import RateLimiter
+from generation_metrics import GenerationMetrics
+from hedging import HedgedCaller
+from document_registry import DocumentRegistry
+from context_cache import ContextCache
+from result_cache import ResultCache
+from token_budget import TokenBudget
+from text_extraction import TextExtractor
+from page_filter import PageFilter
+from text_extraction import text_cache_path
+from test_document_registry import FakeFiles
+from test_text_extraction import write_pdf
+
+class FakeModels:
+    """Models API stand-in returning queued responses and recording each request."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def generate_content(self, **request_kwargs):
+        self.requests.append(request_kwargs)
+        return self.responses.pop(0)
+
+class SlowModels:
+    """Models API stand-in answering each model after its own delay."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.requests = []
+
+    def generate_content(self, **request_kwargs):
+        self.requests.append(request_kwargs)
+        time.sleep(self.delays[request_kwargs['model']])
+        return _response(f"answer from {request_kwargs['model']}")
+
+class ScriptedModels:
+    """
+    Models API stand-in answering every request with respond(prompt), as a
+    response, a stream of chunks or through the async client.
+    """
+
+    def __init__(self, respond, chunk_chars=8, delay_seconds=0):
+        self.respond = respond
+        self.chunk_chars = chunk_chars
+        self.delay_seconds = delay_seconds
+        self.prompts = []
+        self.requests = []
+
+    def _answer(self, request_kwargs):
+        self.requests.append(request_kwargs)
+        contents = request_kwargs['contents']
+        user_turn = contents[0] if isinstance(contents, list) else contents
+        prompt = user_turn.parts[-1].text
+        self.prompts.append(prompt)
+        answer = self.respond(prompt)
+        return answer if isinstance(answer, tuple) else (answer, False)
+
+    def generate_content(self, **request_kwargs):
+        text, truncated = self._answer(request_kwargs)
+        time.sleep(self.delay_seconds)
+        return _response(text, truncated)
+
+    def generate_content_stream(self, **request_kwargs):
+        text, truncated = self._answer(request_kwargs)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or ['']
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            chunk = _response(piece, truncated and last)
+            if not last:
+                chunk.usage_metadata = None
+                chunk.candidates = []
+            yield chunk
+
+    async def generate_content_async(self, **request_kwargs):
+        text, truncated = self._answer(request_kwargs)
+        await asyncio.sleep(self.delay_seconds)
+        return _response(text, truncated)
+
+class DelayedModels(ScriptedModels):
+    """Async models stand-in that answers each prompt after its own delay and tracks requests in flight."""
+
+    def __init__(self, delays):
+        super().__init__(lambda prompt: f"report for {prompt}")
+        self.delays = delays
+        self.in_flight = 0
+        self.peak = 0
+
+    async def generate_content_async(self, **request_kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            text, _ = self._answer(request_kwargs)
+            await asyncio.sleep(self.delays[self.prompts[-1]])
+            return _response(text)
+        finally:
+            self.in_flight -= 1
+
+def _response(text, truncated=False, output_tokens=10):
+    finish_reason = types.FinishReason.MAX_TOKENS if truncated else types.FinishReason.STOP
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(finish_reason=finish_reason)],
+        usage_metadata=SimpleNamespace(prompt_token_count=100, cached_content_token_count=80,
+                                       candidates_token_count=output_tokens)
+    )
+
+def _analyzer(models):
+    """An analyzer wired to a stubbed client, without the caches its constructor sets up."""
+    analyzer = EarningsAnalyzer.__new__(EarningsAnalyzer)
+    analyzer.client = SimpleNamespace(models=models)
+    analyzer.metrics = GenerationMetrics()
+    analyzer.rate_limiter = RateLimiter(enabled=False)
+    analyzer.hedger = HedgedCaller(analyzer.metrics, deadline_seconds=0, enabled=False)
+    analyzer.document_registry = SimpleNamespace(enabled=False)
+    return analyzer
+
+def _full_analyzer(tmp, models):
+    """An analyzer with a stubbed client whose caches live under tmp, sending documents inline."""
+    analyzer = _analyzer(models)
+    async_models = SimpleNamespace(generate_content=models.generate_content_async)
+    analyzer.client = SimpleNamespace(models=models, aio=SimpleNamespace(models=async_models))
+    analyzer.ingestion_mode = 'file'
+    analyzer.text_extractor = TextExtractor()
+    analyzer.page_filter = PageFilter(analyzer.text_extractor, enabled=False)
+    analyzer.result_cache = ResultCache(cache_dir=os.path.join(tmp, 'results'), enabled=True)
+    analyzer.context_cache = ContextCache(analyzer.client, registry_path=os.path.join(tmp, 'context_cache.json'),
+                                          enabled=False)
+    analyzer.token_budget = TokenBudget(analyzer.client, enabled=False,
+                                        counts_path=os.path.join(tmp, 'token_counts.json'))
+    return analyzer
+
+def _documents(tmp, ticker='acme', content='Cloud revenue grew 30%.'):
+    path = os.path.join(tmp, f"{ticker}_release.txt")
+    with open(path, 'w') as f:
+        f.write(content)
+    return {'earnings_release': {'path': path, 'url': f"https://example.com/{ticker}.pdf"}}
+
+def _request():
+    return {
+        'model': 'gemini-test',
+        'resolved_documents': [],
+        'prompt': 'Summarize the quarter.',
+        'cached_content': 'cachedContents/test',
+        'estimated_tokens': 100,
+        'generation': {}
+    }
+
+def test_stitch_drops_repeated_tail():
+    """A continuation that repeats 20 or more characters of the text has the repeat removed."""
+    analyzer = _analyzer(FakeModels([]))
+    text = "Revenue grew 12% year over year, driven by cloud"
+    continuation = "over year, driven by cloud services and advertising."
+    assert analyzer._stitch(text, continuation) == text + " services and advertising."
+
+    # Exactly the 20-character minimum still counts as an overlap
+    assert analyzer._stitch("abcdefghij0123456789", "abcdefghij0123456789 tail") == "abcdefghij0123456789 tail"
+
+def test_stitch_keeps_short_or_missing_overlap():
+    """Overlaps under 20 characters may be coincidence, so the continuation is appended whole."""
+    analyzer = _analyzer(FakeModels([]))
+    text = "Margins held at 31% while"
+    continuation = "while costs fell sharply."
+    assert analyzer._stitch(text, continuation) == text + continuation
+    assert analyzer._stitch("x 0123456789abcdefghi", "0123456789abcdefghi tail") == \
+        "x 0123456789abcdefghi0123456789abcdefghi tail"
+
+    assert analyzer._stitch("Operating income rose.", " Guidance was raised.") == \
+        "Operating income rose. Guidance was raised."
+
+def test_continuation_finishes_truncated_response():
+    """A truncated response is continued with the text so far and the pieces are stitched."""
+    models = FakeModels([_response(" services and advertising revenue.", output_tokens=7)])
+    analyzer = _analyzer(models)
+    first = _response("Revenue grew 12% year over year, driven by cloud", truncated=True)
+
+    text, usage, completion = analyzer._continue_truncated(_request(), first)
+    assert text == "Revenue grew 12% year over year, driven by cloud services and advertising revenue."
+    assert completion == {'continuations': 1, 'truncated': False}
+    assert usage['output_tokens'] == 17
+    assert usage['continuation_output_tokens'] == 7
+
+    # The continuation hands the partial text back as the model's turn
+    contents = models.requests[0]['contents']
+    assert contents[1].role == 'model'
+    assert contents[1].parts[0].text == first.text
+    assert models.requests[0]['config'].cached_content == 'cachedContents/test'
+    assert analyzer.metrics.truncated == 1 and analyzer.metrics.unrecovered == 0
+
+def test_repeated_truncation_stops_at_limit():
+    """A response that keeps hitting MAX_TOKENS is continued MAX_CONTINUATIONS times and reported truncated."""
+    responses = [_response(f" part {i}", truncated=True) for i in range(config.MAX_CONTINUATIONS + 2)]
+    models = FakeModels(responses)
+    analyzer = _analyzer(models)
+    request = _request()
+
+    text, usage, completion = analyzer._continue_truncated(request, _response("part 0", truncated=True))
+    assert len(models.requests) == config.MAX_CONTINUATIONS
+    assert completion == {'continuations': config.MAX_CONTINUATIONS, 'truncated': True}
+    assert text == "part 0" + "".join(f" part {i}" for i in range(config.MAX_CONTINUATIONS))
+    assert usage['output_tokens'] == 10 * (config.MAX_CONTINUATIONS + 1)
+    assert request['estimated_tokens'] == 100 * (config.MAX_CONTINUATIONS + 1)
+    assert analyzer.metrics.unrecovered == 1
+
+def test_hedge_to_fallback_model_wins():
+    """A slow cached call is hedged on the fallback model, which gets the documents inline and wins."""
+    models = SlowModels({'gemini-test': 1.0, 'gemini-fallback': 0.01})
+    analyzer = _analyzer(models)
+    analyzer.hedger = HedgedCaller(analyzer.metrics, deadline_seconds=5, enabled=True, delay_seconds=0.05,
+                                   min_samples=1000, fallback_model='gemini-fallback')
+    request = _request()
+
+    started = time.monotonic()
+    response = analyzer._generate(request['model'], request['resolved_documents'], request['prompt'],
+                                  request['cached_content'], estimated_tokens=100)
+    assert response.text == "answer from gemini-fallback"
+    assert time.monotonic() - started < 0.5
+    assert analyzer.metrics.hedge_wins == 1
+
+    primary, hedge = models.requests
+    assert primary['config'].cached_content == 'cachedContents/test'
+    assert hedge['model'] == 'gemini-fallback'
+    assert hedge['config'].cached_content is None
+
+class ExpiringFileModels:
+    """Models API stand-in that rejects the first uploaded file it is sent, as if it was deleted early."""
+
+    def __init__(self):
+        self.requests = []
+
+    def generate_content(self, **request_kwargs):
+        self.requests.append(request_kwargs)
+        uri = request_kwargs['contents'].parts[1].file_data.file_uri
+        if uri.endswith('/1'):
+            raise errors.ClientError(403, {'error': {
+                'message': 'You do not have permission to access the File 1 or it may not exist.',
+                'status': 'PERMISSION_DENIED'
+            }})
+        return _response(f"analysis of {uri}")
+
+def test_rejected_upload_is_uploaded_again():
+    """A request rejected for a deleted upload drops its handle, re-uploads and retries once."""
+    with tempfile.TemporaryDirectory() as tmp:
+        doc = os.path.join(tmp, 'release.pdf')
+        with open(doc, 'w') as f:
+            f.write('revenue grew')
+        files = FakeFiles()
+        models = ExpiringFileModels()
+        analyzer = _analyzer(models)
+        analyzer.client = SimpleNamespace(models=models, files=files)
+        analyzer.document_registry = DocumentRegistry(analyzer.client, registry_path=os.path.join(tmp, 'registry.json'),
+                                                      enabled=True)
+
+        response = analyzer._generate('gemini-test', [('earnings_release', doc, 'earnings release')], 'Summarize.')
+        assert response.text == "analysis of https://files.example/2"
+        assert files.uploads == 2
+        assert len(models.requests) == 2
+        assert analyzer.document_registry.get_record(doc)['name'] == 'files/2'
+
+        # Errors that name no uploaded file are raised as before
+        analyzer.client.models = FakeModels([])
+        bad_request = errors.ClientError(400, {'error': {'message': 'bad prompt', 'status': 'INVALID_ARGUMENT'}})
+        assert not analyzer._invalidate_stale_uploads([('earnings_release', doc, 'earnings release')], bad_request)
+
+def _drain(generator):
+    """Collect a generator's yielded chunks and its return value."""
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(generator))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+def test_stream_yields_chunks_of_final_result():
+    """Streamed chunks concatenate to the final analysis; a repeat run yields the cached result whole."""
+    with tempfile.TemporaryDirectory() as tmp:
+        report = "## Impact\nAcme's cloud spend on GCP is rising quickly this quarter."
+        models = ScriptedModels(lambda prompt: report)
+        analyzer = _full_analyzer(tmp, models)
+        stages = []
+
+        chunks, result = _drain(analyzer.analyze_earnings_documents_stream(
+            _documents(tmp), 'Acme', 'Q1', '2025', on_stage=stages.append
+        ))
+        assert len(chunks) > 1
+        assert "".join(chunks) == result['analysis'] == report
+        assert stages == ['uploading', 'generating']
+        assert result['cached'] is False
+
+        chunks, cached = _drain(analyzer.analyze_earnings_documents_stream(_documents(tmp), 'Acme', 'Q1', '2025'))
+        assert chunks == [report]
+        assert cached['cached'] is True
+        assert len(models.prompts) == 1
+
+def test_stream_continues_truncated_response():
+    """A truncated stream is continued and the repeated overlap is not streamed twice."""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = "Acme expects cloud migration to accelerate in the second half"
+        second = "to accelerate in the second half, driven by AI workloads."
+
+        def respond(prompt):
+            return (first, True) if len(models.prompts) == 1 else (second, False)
+
+        models = ScriptedModels(respond)
+        analyzer = _full_analyzer(tmp, models)
+        chunks, result = _drain(analyzer.analyze_earnings_documents_stream(_documents(tmp), 'Acme', 'Q1', '2025'))
+        expected = "Acme expects cloud migration to accelerate in the second half, driven by AI workloads."
+        assert "".join(chunks) == result['analysis'] == expected
+        assert result['continuations'] == 1 and result['truncated'] is False
+
+def test_stream_error_returns_error_result():
+    """A failing request ends the stream with an error result instead of raising."""
+    with tempfile.TemporaryDirectory() as tmp:
+        def respond(prompt):
+            raise errors.ClientError(400, {'error': {'message': 'bad request', 'status': 'INVALID_ARGUMENT'}})
+
+        analyzer = _full_analyzer(tmp, ScriptedModels(respond))
+        chunks, result = _drain(analyzer.analyze_earnings_documents_stream(_documents(tmp), 'Acme', 'Q1', '2025'))
+        assert chunks == []
+        assert 'bad request' in result['error']
+
+def _specs(tmp, prompts):
+    return [{'documents': _documents(tmp), 'company_name': 'Acme', 'quarter': 'Q1', 'year': '2025',
+             'prompt': prompt, 'use_cache': False} for prompt in prompts]
+
+def test_analyze_many_bounds_concurrency():
+    """Analyses run at most `concurrency` at a time and are returned in completion order."""
+    with tempfile.TemporaryDirectory() as tmp:
+        models = DelayedModels({'slow': 0.2, 'fast': 0.01, 'medium': 0.05})
+        results = _full_analyzer(tmp, models).analyze_many(_specs(tmp, ['slow', 'fast', 'medium']), concurrency=2)
+        assert models.peak == 2
+        assert [result['spec_index'] for result in results] == [1, 2, 0]
+        assert [result['analysis'] for result in results] == ['report for fast', 'report for medium', 'report for slow']
+        assert results[2]['latency_seconds'] >= 0.2
+
+def test_analyze_many_inside_running_loop():
+    """analyze_many works from code already running an event loop."""
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = _full_analyzer(tmp, DelayedModels({'first': 0.01, 'second': 0.01}))
+
+        async def caller():
+            return analyzer.analyze_many(_specs(tmp, ['first', 'second']))
+
+        results = asyncio.run(caller())
+        assert sorted(result['analysis'] for result in results) == ['report for first', 'report for second']
+
+def test_text_ingestion_sends_extracted_text():
+    """In 'text' mode documents are swapped for their extracted text unless too little was found."""
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = _full_analyzer(tmp, ScriptedModels(lambda prompt: 'ok'))
+        analyzer.text_extractor = TextExtractor(max_workers=1, min_chars=10)
+        release = write_pdf(os.path.join(tmp, 'release.pdf'), ['Cloud revenue grew 30% on AI demand'])
+        scan = write_pdf(os.path.join(tmp, 'transcript.pdf'), [''])
+        documents = {'earnings_release': {'path': release}, 'call_transcript': {'path': scan}}
+
+        assert analyzer._select_inputs(documents, 'prompt', ingestion_mode='text') == ([
+            ('earnings_release', text_cache_path(release), 'earnings release'),
+            ('call_transcript', scan, 'earnings call transcript')
+        ], {})
+        resolved, _ = analyzer._select_inputs(documents, 'prompt')
+        assert [file_path for _, file_path, _ in resolved] == [release, scan]
+
+def test_release_pages_are_filtered():
+    """Earnings releases are cut to their relevant pages and labelled with them; transcripts stay whole."""
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = _full_analyzer(tmp, ScriptedModels(lambda prompt: 'ok'))
+        analyzer.page_filter = PageFilter(TextExtractor(max_workers=1, min_chars=1), page_budget=2, enabled=True)
+        release = write_pdf(os.path.join(tmp, 'release.pdf'), ['Results', 'Safe harbor', 'Cloud and AI grew'])
+        transcript = write_pdf(os.path.join(tmp, 'transcript.pdf'), ['Operator', 'Safe harbor', 'Cloud grew'])
+        documents = {'earnings_release': {'path': release}, 'call_transcript': {'path': transcript}}
+
+        resolved, pages = analyzer._select_inputs(documents, 'prompt')
+        assert pages == {'earnings release': {'pages': [1, 3], 'total_pages': 3}}
+        assert resolved[0][2] == 'earnings release (pages 1, 3 of 3)'
+        assert resolved[0][1].endswith('.pdf') and '.page_cache' in resolved[0][1]
+        assert resolved[1] == ('call_transcript', transcript, 'earnings call transcript')
+
+def _companies(tmp, names):
+    return [
+        {'ticker': name.lower(), 'name': name, 'files': _documents(tmp, name.lower(), f"{name} cloud revenue grew."),
+         'quarter': 'Q1', 'year': '2025'}
+        for name in names
+    ]
+
+def _comparing_models(failing=()):
+    """Answers summary, peer cluster and comparison prompts, failing the summaries of `failing` companies."""
+    def respond(prompt):
+        if 'Summarize ' in prompt:
+            name = prompt.split('Summarize ', 1)[1].split("'s", 1)[0]
+            if name in failing:
+                raise errors.ClientError(400, {'error': {'message': 'unreadable', 'status': 'INVALID_ARGUMENT'}})
+            return f"#### Key Metrics\n- {name} revenue grew"
+        if ' peers: ' in prompt:
+            return "cluster comparison of " + prompt.split(' peers: ', 1)[1].split('.', 1)[0]
+        return "final comparison"
+    return ScriptedModels(respond)
+
+def _summary_prompts(models):
+    return [prompt for prompt in models.prompts if 'Summarize ' in prompt]
+
+def test_map_reduce_compares_cached_summaries():
+    """Each company is summarized once and the summaries compared; a failed company is left out."""
+    original = config.CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHE_DIR = tmp
+        try:
+            models = _comparing_models(failing=('Gamma',))
+            analyzer = _full_analyzer(tmp, models)
+            result = analyzer.analyze_comparative_map_reduce(_companies(tmp, ['Alpha', 'Beta', 'Gamma']),
+                                                             'Alpha vs. Beta vs. Gamma', 'Q1', '2025')
+            assert result['analysis'] == 'final comparison'
+            assert result['map_reduce']['companies'] == ['alpha', 'beta']
+            assert result['map_reduce']['cached_summaries'] == []
+            assert result['map_reduce']['failed_companies'][0].startswith('gamma (')
+            assert sorted(result['document_types']) == ['alpha_earnings_release', 'beta_earnings_release',
+                                                        'gamma_earnings_release']
+            summaries = os.listdir(os.path.join(tmp, 'summaries'))
+            with open(os.path.join(tmp, 'summaries', summaries[0])) as f:
+                assert f.read() == ("### Alpha (ALPHA) - Q1 2025\n#### Key Metrics\n- Alpha revenue grew\n\n"
+                                    "### Beta (BETA) - Q1 2025\n#### Key Metrics\n- Beta revenue grew")
+
+            # Adding a company costs one summary; the others come from the cache
+            models.prompts.clear()
+            result = analyzer.analyze_comparative_map_reduce(_companies(tmp, ['Alpha', 'Beta', 'Delta']),
+                                                             'Alpha vs. Beta vs. Delta', 'Q1', '2025')
+            assert result['map_reduce']['cached_summaries'] == ['alpha', 'beta']
+            assert len(_summary_prompts(models)) == 1
+        finally:
+            config.CACHE_DIR = original
+
+def test_map_reduce_without_summaries_fails():
+    """When no company can be summarized the comparison returns an error result."""
+    original = config.CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHE_DIR = tmp
+        try:
+            models = _comparing_models(failing=('Alpha', 'Beta'))
+            result = _full_analyzer(tmp, models).analyze_comparative_map_reduce(
+                _companies(tmp, ['Alpha', 'Beta']), 'Alpha vs. Beta', 'Q1', '2025'
+            )
+            assert 'No company summaries could be generated' in result['error']
+            assert models.prompts == _summary_prompts(models)
+        finally:
+            config.CACHE_DIR = original
+
+def test_hierarchical_compares_within_and_across_clusters():
+    """Clusters are compared separately and then synthesized; unchanged clusters come from the cache."""
+    original = config.CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHE_DIR = tmp
+        try:
+            models = _comparing_models()
+            analyzer = _full_analyzer(tmp, models)
+            clusters = [{'name': 'Hyperscalers', 'tickers': ['alpha', 'beta']},
+                        {'name': 'Chips', 'tickers': ['gamma']}]
+            companies = _companies(tmp, ['Alpha', 'Beta', 'Gamma'])
+            result = analyzer.analyze_comparative_hierarchical(companies, clusters, 'Peers', 'Q1', '2025')
+            assert result['analysis'] == 'final comparison'
+            assert result['map_reduce']['clusters'] == [
+                {'name': 'Hyperscalers', 'tickers': ['alpha', 'beta'], 'cached': False},
+                {'name': 'Chips', 'tickers': ['gamma'], 'cached': False}
+            ]
+            # Only the two-company cluster needs a comparison of its own
+            assert [prompt for prompt in models.prompts if ' peers: ' in prompt] == [
+                prompt for prompt in models.prompts if 'Hyperscalers peers: Alpha, Beta' in prompt
+            ]
+            reports = os.listdir(os.path.join(tmp, 'cluster_reports'))
+            with open(os.path.join(tmp, 'cluster_reports', reports[0])) as f:
+                report = f.read()
+            assert report.startswith("## Peer group: Hyperscalers (ALPHA, BETA)\ncluster comparison of Alpha, Beta")
+            assert "## Peer group: Chips (GAMMA)\n### Gamma (GAMMA)" in report
+
+            models.prompts.clear()
+            result = analyzer.analyze_comparative_hierarchical(companies, clusters, 'Peers', 'Q1', '2025')
+            assert [cluster['cached'] for cluster in result['map_reduce']['clusters']] == [True, True]
+            assert models.prompts == []
+        finally:
+            config.CACHE_DIR = original
+
+def test_hierarchical_single_cluster_is_map_reduce():
+    """With one cluster the hierarchy is skipped and the summaries are compared directly."""
+    original = config.CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.CACHE_DIR = tmp
+        try:
+            models = _comparing_models()
+            result = _full_analyzer(tmp, models).analyze_comparative_hierarchical(
+                _companies(tmp, ['Alpha', 'Beta']), [{'name': 'Other', 'tickers': ['alpha', 'beta']}],
+                'Alpha vs. Beta', 'Q1', '2025'
+            )
+            assert result['analysis'] == 'final comparison'
+            assert 'clusters' not in result['map_reduce']
+            assert not any(' peers: ' in prompt for prompt in models.prompts)
+        finally:
+            config.CACHE_DIR = original
+
+SECTIONED_PROMPT = """Analyze Acme.
+
+## Summary
+- Headline results
+
+## Cloud
+- Cloud growth
+
+## Outlook
+- Guidance
+
+Use markdown."""
+
+def _section_title(prompt):
+    return next(line[3:] for line in prompt.splitlines() if line.startswith('## '))
+
+def _sectioned_analyzer(tmp, respond):
+    models = ScriptedModels(lambda prompt: respond(_section_title(prompt), prompt))
+    analyzer = _full_analyzer(tmp, models)
+    analyzer._build_prompt = lambda company_name, quarter, year, is_comparative=False: SECTIONED_PROMPT
+    return analyzer, models
+
+def test_sections_generated_separately_and_assembled_in_order():
+    """Each section is its own call; the report keeps template order and restores dropped headings."""
+    with tempfile.TemporaryDirectory() as tmp:
+        def respond(title, prompt):
+            assert 'The full report has these sections: Summary, Cloud, Outlook.' in prompt
+            assert prompt.endswith('Use markdown.')
+            return f"{title} text" if title == 'Cloud' else f"## {title}\n\n{title} text"
+
+        analyzer, models = _sectioned_analyzer(tmp, respond)
+        result = analyzer.analyze_earnings_documents_by_section(_documents(tmp), 'Acme', 'Q1', '2025')
+        assert result['analysis'] == ("## Summary\n\nSummary text\n\n## Cloud\n\nCloud text\n\n"
+                                      "## Outlook\n\nOutlook text")
+        assert [section['title'] for section in result['sections']] == ['Summary', 'Cloud', 'Outlook']
+        assert result['usage']['output_tokens'] == 30
+        assert result['cached'] is False
+
+        # Regenerating one section leaves the others in the cache
+        models.prompts.clear()
+        result = analyzer.analyze_earnings_documents_by_section(_documents(tmp), 'Acme', 'Q1', '2025',
+                                                                regenerate_sections=['outlook'])
+        assert [_section_title(prompt) for prompt in models.prompts] == ['Outlook']
+        assert [section['cached'] for section in result['sections']] == [True, True, False]
+
+def test_failed_section_is_retried_alone():
+    """A failed or empty section is retried on its own; unknown sections and repeated failures are errors."""
+    with tempfile.TemporaryDirectory() as tmp:
+        calls = []
+
+        def respond(title, prompt):
+            calls.append(title)
+            if title == 'Cloud' and calls.count('Cloud') == 1:
+                return ''
+            return f"## {title}\n{title} text"
+
+        analyzer, _ = _sectioned_analyzer(tmp, respond)
+        result = analyzer.analyze_earnings_documents_by_section(_documents(tmp), 'Acme', 'Q1', '2025')
+        assert sorted(calls) == ['Cloud', 'Cloud', 'Outlook', 'Summary']
+        assert '## Cloud\nCloud text' in result['analysis']
+
+        result = analyzer.analyze_earnings_documents_by_section(_documents(tmp), 'Acme', 'Q1', '2025',
+                                                                regenerate_sections=['Risks'])
+        assert 'Unknown report sections: risks' in result['error']
+
+        analyzer, _ = _sectioned_analyzer(tmp, lambda title, prompt: '' if title == 'Outlook' else title)
+        result = analyzer.analyze_earnings_documents_by_section(_documents(tmp), 'Acme', 'Q1', '2025',
+                                                                use_cache=False)
+        assert 'Sections failed: Outlook (empty section)' in result['error']
+
+def test_latency_tier_sets_model_and_generation():
+    """A tier picks the model and only the generation settings it defines; no tier uses the defaults."""
+    analyzer = _analyzer(FakeModels([]))
+    assert analyzer._tier_settings(None) == (DEFAULT_MODEL, {})
+    tier = {'name': 'fast', 'model': 'gemini-2.5-flash', 'thinking_budget': 0, 'max_output_tokens': 2048,
+            'temperature': None}
+    assert analyzer._tier_settings(tier) == ('gemini-2.5-flash', {'thinking_budget': 0, 'max_output_tokens': 2048})
+    assert analyzer._tier_settings({'name': 'default'}) == (DEFAULT_MODEL, {})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        models = ScriptedModels(lambda prompt: 'report')
+        result = _full_analyzer(tmp, models).analyze_earnings_documents(_documents(tmp), 'Acme', 'Q1', '2025',
+                                                                        tier=tier)
+        assert result['model'] == 'gemini-2.5-flash'
+        request = models.requests[0]
+        assert request['model'] == 'gemini-2.5-flash'
+        assert request['config'].max_output_tokens == 2048
+        assert request['config'].thinking_config.thinking_budget == 0
+        assert request['config'].temperature is None
+
+def _triage_models(screening):
+    """Answers the triage prompt with `screening` and any other prompt with a full report."""
+    return ScriptedModels(lambda prompt: screening if 'You are screening' in prompt else '## Full report')
+
+def test_triage_skips_immaterial_release():
+    """A release scored below the threshold gets a short report from the cheap model only."""
+    with tempfile.TemporaryDirectory() as tmp:
+        screening = '{"materiality_score": 2, "topics": ["buybacks"], "rationale": "No cloud news."}'
+        models = _triage_models(f"```json\n{screening}\n```")
+        result = _full_analyzer(tmp, models).analyze_earnings_documents_triaged(
+            _documents(tmp), 'Acme', 'Q1', '2025', tier={'name': 'thorough', 'model': 'gemini-2.5-pro'}, threshold=4
+        )
+        assert [request['model'] for request in models.requests] == ['gemini-2.5-flash']
+        assert result['analysis'].startswith('## No Material GCP Impact')
+        assert 'scored 2/10' in result['analysis'] and 'threshold of 4' in result['analysis']
+        assert result['triage'] == {'score': 2.0, 'topics': ['buybacks'], 'rationale': 'No cloud news.',
+                                    'threshold': 4, 'material': False, 'model': 'gemini-2.5-flash'}
+
+def test_triage_runs_full_analysis_when_material_or_unsure():
+    """A material score, or a screening that fails or cannot be parsed, leads to the full analysis."""
+    tier = {'name': 'thorough', 'model': 'gemini-2.5-pro'}
+    with tempfile.TemporaryDirectory() as tmp:
+        models = _triage_models('{"materiality_score": 12, "topics": ["AI capex"], "rationale": "Big news."}')
+        result = _full_analyzer(tmp, models).analyze_earnings_documents_triaged(
+            _documents(tmp), 'Acme', 'Q1', '2025', tier=tier, threshold=4
+        )
+        assert [request['model'] for request in models.requests] == ['gemini-2.5-flash', 'gemini-2.5-pro']
+        assert result['analysis'] == '## Full report'
+        assert result['triage']['score'] == 10.0 and result['triage']['material']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        models = _triage_models('I cannot score this.')
+        result = _full_analyzer(tmp, models).analyze_earnings_documents_triaged(
+            _documents(tmp), 'Acme', 'Q1', '2025', tier=tier, threshold=4
+        )
+        assert result['analysis'] == '## Full report' and 'triage' not in result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def respond(prompt):
+            if 'You are screening' in prompt:
+                raise errors.ClientError(400, {'error': {'message': 'bad request', 'status': 'INVALID_ARGUMENT'}})
+            return '## Full report'
+
+        result = _full_analyzer(tmp, ScriptedModels(respond)).analyze_earnings_documents_triaged(
+            _documents(tmp), 'Acme', 'Q1', '2025', tier=tier, threshold=4
+        )
+        assert result['analysis'] == '## Full report' and 'triage' not in result
+
+if __name__ == "__main__":
+    test_stitch_drops_repeated_tail()
+    test_stitch_keeps_short_or_missing_overlap()
+    test_continuation_finishes_truncated_response()
+    test_repeated_truncation_stops_at_limit()
+    test_hedge_to_fallback_model_wins()
+    test_rejected_upload_is_uploaded_again()
+    test_stream_yields_chunks_of_final_result()
+    test_stream_continues_truncated_response()
+    test_stream_error_returns_error_result()
+    test_analyze_many_bounds_concurrency()
+    test_analyze_many_inside_running_loop()
+    test_text_ingestion_sends_extracted_text()
+    test_release_pages_are_filtered()
+    test_map_reduce_compares_cached_summaries()
+    test_map_reduce_without_summaries_fails()
+    test_hierarchical_compares_within_and_across_clusters()
+    test_hierarchical_single_cluster_is_map_reduce()
+    test_sections_generated_separately_and_assembled_in_order()
+    test_failed_section_is_retried_alone()
+    test_latency_tier_sets_model_and_generation()
+    test_triage_skips_immaterial_release()
+    test_triage_runs_full_analysis_when_material_or_unsure()
+    print("All analyzer tests passed")
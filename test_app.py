@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test script for the web app's job pages and live analysis stream.
+Run this with: python test_app.py
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+import config
+
+# Importing the app starts its job queue; keep it away from the real job database
+config.JOB_DB_PATH = os.path.join(tempfile.mkdtemp(), 'jobs.db')
+config.GEMINI_API_KEY = config.GEMINI_API_KEY or 'test-key'
+
+import app as web
+from job_queue import JobQueue, Job, JobCancelled
+
+def _queue(tmp, release, result, **kwargs):
+    def handler(job, **params):
+        release.wait(5)
+        return result
+    queue = JobQueue(db_path=os.path.join(tmp, 'jobs.db'), max_workers=1, **kwargs)
+    queue.register('live', handler)
+    return queue
+
+def _events(response):
+    """Parse an SSE response body into (event, event id, data) tuples."""
+    events = []
+    for message in response.get_data(as_text=True).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+    return events
+
+def _stream(client, job_id, last_event_id=None):
+    headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+    return _events(client.get(f"/analysis-events/{job_id}", headers=headers))
+
+def test_live_job_status_names_ticker():
+    """A queued live analysis is titled with its ticker on the job page."""
+    with tempfile.TemporaryDirectory() as tmp:
+        original = web.job_queue
+        web.job_queue = _queue(tmp, threading.Event(), None)
+        try:
+            job_id = web.job_queue.submit('live', ticker='acme')
+            page = web.app.test_client().get(f"/jobs/{job_id}").get_data(as_text=True)
+            assert 'Analysis of ACME' in page
+        finally:
+            web.job_queue = original
+
+def test_stream_resets_when_job_is_requeued():
+    """A client resuming into a new attempt is sent a reset and the new output from the start."""
+    original = (web.job_queue, config.SSE_CONNECTION_SECONDS, config.SSE_POLL_INTERVAL_SECONDS)
+    config.SSE_CONNECTION_SECONDS, config.SSE_POLL_INTERVAL_SECONDS = 0.2, 0.01
+    lost, release = threading.Event(), threading.Event()
+    with tempfile.TemporaryDirectory() as tmp:
+        first = _queue(tmp, lost, None, stale_after=0)
+        second = _queue(tmp, release, {'files': ['ACME_analysis.md'], 'messages': [], 'redirect_to': 'view_analysis'})
+        web.job_queue = first
+        try:
+            client = web.app.test_client()
+            job_id = first.submit('live', ticker='acme')
+            first._claim_jobs()
+            Job(first, job_id).append_output('# Draft')
+            assert _stream(client, job_id) == [('chunk', '1:7', {'text': '# Draft'})]
+            assert _stream(client, job_id, '1:7') == []
+
+            # The first worker is lost and another one restarts the analysis
+            time.sleep(0.01)
+            first._requeue_stale()
+            second._claim_jobs()
+            Job(second, job_id).append_output('# Final')
+            assert _stream(client, job_id, '1:7') == [
+                ('reset', None, {'attempt': 2}), ('chunk', '2:7', {'text': '# Final'})
+            ]
+
+            # Clients that sent an id without an attempt start from the beginning
+            assert _stream(client, job_id, '7')[0] == ('chunk', '2:7', {'text': '# Final'})
+
+            release.set()
+            second._executor.shutdown(wait=True)
+            assert _stream(client, job_id, '2:7') == [('done', None, {'url': '/view-analysis/ACME_analysis.md'})]
+        finally:
+            lost.set()
+            release.set()
+            first._executor.shutdown(wait=True)
+            web.job_queue, config.SSE_CONNECTION_SECONDS, config.SSE_POLL_INTERVAL_SECONDS = original
+
+class _BatchJob:
+    def __init__(self):
+        self.progress = []
+
+    def set_progress(self, message):
+        self.progress.append(message)
+
+    def check_cancelled(self):
+        pass
+
+def _run_batch(tickers, pipeline, concurrency):
+    original = (web.analyze_batch_ticker, config.BATCH_CONCURRENCY)
+    web.analyze_batch_ticker, config.BATCH_CONCURRENCY = pipeline, concurrency
+    try:
+        return web.process_multiple_companies_batch(_BatchJob(), tickers)
+    finally:
+        web.analyze_batch_ticker, config.BATCH_CONCURRENCY = original
+
+def test_batch_runs_tickers_concurrently():
+    """Batch pipelines run BATCH_CONCURRENCY at a time and report in selection order."""
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def pipeline(job, ticker, latency_tier=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        # Later tickers finish first
+        time.sleep(0.05 * (4 - len(ticker)))
+        with lock:
+            running[0] -= 1
+        if ticker == 'BBB':
+            raise web.BatchTickerError(f"{ticker} (no documents)")
+        return f"{ticker}.md", ticker.title()
+
+    started = time.monotonic()
+    result = _run_batch(['A', 'BB', 'BBB', 'CC'], pipeline, concurrency=2)
+    assert time.monotonic() - started < 0.35
+    assert peak[0] == 2
+    assert result['files'] == ['A.md', 'BB.md', 'CC.md']
+    assert result['redirect_to'] == 'analyses'
+    assert result['messages'][0]['text'].startswith('Successfully analyzed 3 companies in ')
+    assert result['messages'][0]['text'].endswith('seconds: A, Bb, Cc')
+    assert result['messages'][1] == {'category': 'warning', 'text': 'Failed to analyze 1 companies: BBB (no documents)'}
+
+def test_batch_errors_and_cancellation():
+    """Unexpected per-ticker errors are reported, a batch with no results fails, and cancelling stops it."""
+    def pipeline(job, ticker, latency_tier=None):
+        if ticker == 'BAD':
+            raise RuntimeError('connection reset')
+        if ticker == 'STOP':
+            raise JobCancelled('cancelled')
+        return f"{ticker}.md", ticker
+
+    result = _run_batch(['OK', 'BAD'], pipeline, concurrency=4)
+    assert result['files'] == ['OK.md']
+    assert result['messages'][0]['text'].startswith('Successfully analyzed OK in ')
+
+    try:
+        _run_batch(['BAD'], pipeline, concurrency=4)
+        assert False, "a batch without results should fail"
+    except ValueError as e:
+        assert str(e) == 'Failed to analyze any companies: BAD (error: connection reset...)'
+
+    try:
+        _run_batch(['OK', 'STOP'], pipeline, concurrency=1)
+        assert False, "cancellation should stop the batch"
+    except JobCancelled:
+        pass
+
+    # Real pipelines report unknown tickers in the same format
+    try:
+        web.analyze_batch_ticker(_BatchJob(), 'NOT-A-TICKER')
+        assert False, "an unknown ticker should fail"
+    except web.BatchTickerError as e:
+        assert str(e) == 'NOT-A-TICKER (not found)'
+
+if __name__ == "__main__":
+    test_live_job_status_names_ticker()
+    test_stream_resets_when_job_is_requeued()
+    test_batch_runs_tickers_concurrently()
+    test_batch_errors_and_cancellation()
+    print("All app tests passed")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed blob store.
+Run this with: python test_blob_store.py
+"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_store import BlobStore
+
+def _write_file(directory, relative_path, content):
+    path = os.path.join(directory, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def test_duplicates_share_one_blob():
+    """The same document under two paths is stored once, as hard links to one blob."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, enabled=True)
+        first = _write_file(tmp, 'AAPL/2024_Q1/release.pdf', b'revenue grew')
+        copy = _write_file(tmp, 'CUSTOM/2024_Q1/release.pdf', b'revenue grew')
+
+        sha256 = store.add(first, url='https://example.com/a.pdf')
+        assert store.add(copy, url='https://example.com/b.pdf') == sha256
+        assert os.stat(first).st_ino == os.stat(copy).st_ino == os.stat(store.blob_path(sha256)).st_ino
+        assert sorted(store.paths_for(sha256)) == sorted([first, copy])
+        assert store.digest(copy) == sha256
+
+        # A known URL is linked into a new path without downloading it
+        stored = store.find_by_url('https://example.com/a.pdf')
+        linked = os.path.join(tmp, 'AAPL/2024_Q2/release.pdf')
+        assert store.link(stored['sha256'], linked)
+        assert os.stat(linked).st_ino == os.stat(first).st_ino
+
+        # A fresh store reads the same manifest
+        assert BlobStore(tmp, enabled=True).entry(linked)['sha256'] == sha256
+
+def test_forget_removes_unlinked_blobs():
+    """A blob is removed once the last download path linking to it is forgotten."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, enabled=True)
+        first = _write_file(tmp, 'AAPL/2024_Q1/release.pdf', b'revenue grew')
+        copy = _write_file(tmp, 'AAPL/2024_Q2/release.pdf', b'revenue grew')
+        sha256 = store.add(first)
+        store.add(copy)
+
+        os.remove(first)
+        assert store.forget([first]) == 0
+        assert os.path.exists(store.blob_path(sha256))
+
+        os.remove(copy)
+        assert store.forget([copy]) == 1
+        assert not os.path.exists(store.blob_path(sha256))
+        assert store.entries() == {}
+
+def test_verify_and_repair_corrupt_blob():
+    """A blob whose content no longer matches its name is reported; repair deletes it and its paths."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, enabled=True)
+        doc = _write_file(tmp, 'AAPL/2024_Q1/release.pdf', b'revenue grew')
+        intact = _write_file(tmp, 'AAPL/2024_Q1/transcript.pdf', b'margins held')
+        sha256 = store.add(doc)
+        store.add(intact)
+
+        with open(store.blob_path(sha256), 'r+b') as f:
+            f.write(b'R')
+
+        report = store.verify()
+        assert report['blobs'] == 2
+        assert report['corrupt_blobs'] == [sha256]
+        assert report['modified_paths'] == []
+
+        store.verify(repair=True)
+        assert not os.path.exists(store.blob_path(sha256))
+        assert not os.path.exists(doc)
+        assert os.path.exists(intact)
+        assert list(store.entries()) == ['AAPL/2024_Q1/transcript.pdf']
+
+        report = store.verify()
+        assert report['corrupt_blobs'] == [] and report['blobs'] == 1
+
+def test_verify_and_repair_unreferenced_and_untracked():
+    """Blobs without download paths are removed, missing paths dropped, and stray downloads added."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, enabled=True)
+        deleted = _write_file(tmp, 'AAPL/2024_Q1/release.pdf', b'revenue grew')
+        sha256 = store.add(deleted)
+        os.remove(deleted)
+        untracked = _write_file(tmp, 'MSFT/2024_Q1/release.pdf', b'cloud grew')
+
+        report = store.verify()
+        assert report['unreferenced_blobs'] == [sha256]
+        assert report['missing_paths'] == ['AAPL/2024_Q1/release.pdf']
+        assert report['untracked_paths'] == ['MSFT/2024_Q1/release.pdf']
+
+        store.verify(repair=True)
+        assert not os.path.exists(store.blob_path(sha256))
+        assert list(store.entries()) == ['MSFT/2024_Q1/release.pdf']
+        assert store.digest(untracked) is not None
+
+        report = store.verify()
+        assert not report['unreferenced_blobs'] and not report['missing_paths'] and not report['untracked_paths']
+
+def test_manifest_shared_between_stores():
+    """Stores over the same directory (as in separate processes) see each other's changes and lose none."""
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second = BlobStore(tmp, enabled=True), BlobStore(tmp, enabled=True)
+        kept = _write_file(tmp, 'AAPL/2024_Q1/release.pdf', b'revenue grew')
+        deleted = _write_file(tmp, 'AAPL/2024_Q1/transcript.pdf', b'margins held')
+        first.add(kept)
+        first.add(deleted)
+        assert set(second.entries()) == {'AAPL/2024_Q1/release.pdf', 'AAPL/2024_Q1/transcript.pdf'}
+
+        # A path one store forgets is not brought back by the other
+        os.remove(deleted)
+        first.forget([deleted])
+        assert second.entry(deleted) is None
+        second.add(_write_file(tmp, 'MSFT/2024_Q1/release.pdf', b'cloud grew'))
+        assert sorted(first.entries()) == ['AAPL/2024_Q1/release.pdf', 'MSFT/2024_Q1/release.pdf']
+
+        # Concurrent writers each read, update and replace the manifest in turn
+        paths = [_write_file(tmp, f"T{i}/2024_Q1/release.pdf", f"document {i}".encode()) for i in range(40)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda path: BlobStore(tmp, enabled=True).add(path), paths))
+        assert len(first.entries()) == 42
+        assert all(first.digest(path) for path in paths)
+
+if __name__ == "__main__":
+    test_duplicates_share_one_blob()
+    test_forget_removes_unlinked_blobs()
+    test_verify_and_repair_corrupt_blob()
+    test_verify_and_repair_unreferenced_and_untracked()
+    test_manifest_shared_between_stores()
+    print("All blob store tests passed")
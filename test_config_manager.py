@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test script for company configuration helpers.
+Run this with: python test_config_manager.py
+"""
+
+import os
+import json
+import tempfile
+
+import config
+from config_manager import ConfigManager
+
+def _manager(tmp, comparison=None, companies=None, latency_tiers=None):
+    config_path = os.path.join(tmp, 'company_config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'companies': companies or {}, 'comparison': comparison or {}, 'latency_tiers': latency_tiers or {},
+                   'meta': {}}, f)
+    return ConfigManager(config_path)
+
+def test_peer_clusters_follow_config():
+    """Tickers are grouped by configured cluster in config order, with the rest under 'Other'."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(tmp, {'peer_clusters': {
+            'hyperscalers': {'name': 'Hyperscalers', 'tickers': ['MSFT', 'AMZN']},
+            'chips': {'name': 'Chips', 'tickers': ['NVDA']},
+            'unused': {'name': 'Unused', 'tickers': ['ORCL']}
+        }})
+        assert manager.get_peer_clusters(['NVDA', 'amzn', 'CRM', 'msft', 'nvda']) == [
+            {'name': 'Hyperscalers', 'tickers': ['amzn', 'msft']},
+            {'name': 'Chips', 'tickers': ['nvda']},
+            {'name': 'Other', 'tickers': ['crm']}
+        ]
+
+def test_large_clusters_are_split():
+    """Clusters over max_cluster_size are split into evenly sized parts."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(tmp, {'max_cluster_size': 2})
+        assert manager.get_peer_clusters(['a', 'b', 'c', 'd', 'e']) == [
+            {'name': 'Other (part 1 of 3)', 'tickers': ['a', 'd']},
+            {'name': 'Other (part 2 of 3)', 'tickers': ['b', 'e']},
+            {'name': 'Other (part 3 of 3)', 'tickers': ['c']}
+        ]
+
+def test_latency_tier_resolution():
+    """The tier comes from the run, then the company, then LATENCY_TIER, then the config default."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = _manager(tmp, companies={'acme': {'name': 'Acme', 'latency_tier': 'fast'}, 'beta': {'name': 'Beta'}},
+                           latency_tiers={'default_tier': 'thorough', 'tiers': {
+                               'fast': {'model': 'gemini-2.5-flash', 'thinking_budget': 0},
+                               'thorough': {'model': 'gemini-2.5-pro'}
+                           }})
+        original = config.LATENCY_TIER
+        config.LATENCY_TIER = None
+        try:
+            thorough = manager.get_latency_tier('thorough', ticker='acme')
+            assert thorough == {'model': 'gemini-2.5-pro', 'name': 'thorough'}
+            assert manager.get_latency_tier(ticker='acme')['name'] == 'fast'
+            assert manager.get_latency_tier(ticker='beta')['name'] == 'thorough'
+            config.LATENCY_TIER = 'fast'
+            assert manager.get_latency_tier(ticker='beta')['name'] == 'fast'
+            try:
+                manager.get_latency_tier('instant')
+                assert False, "unknown tiers should be rejected"
+            except ValueError as e:
+                assert 'Available tiers: fast, thorough' in str(e)
+        finally:
+            config.LATENCY_TIER = original
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original = config.LATENCY_TIER
+        config.LATENCY_TIER = None
+        try:
+            assert _manager(tmp).get_latency_tier() is None
+        finally:
+            config.LATENCY_TIER = original
+
+if __name__ == "__main__":
+    test_peer_clusters_follow_config()
+    test_large_clusters_are_split()
+    test_latency_tier_resolution()
+    print("All config manager tests passed")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script for Gemini context caching of shared document sets.
+Run this with: python test_context_cache.py
+"""
+
+import os
+import time
+import tempfile
+from types import SimpleNamespace
+
+from google.genai import errors
+
+from context_cache import ContextCache
+
+class FakeCaches:
+    """Caches API stand-in that raises the queued errors before succeeding."""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.creates = 0
+
+    def create(self, model, config):
+        self.creates += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return SimpleNamespace(
+            name=f"cachedContents/{self.creates}",
+            usage_metadata=SimpleNamespace(total_token_count=5000),
+            expire_time=SimpleNamespace(timestamp=lambda: time.time() + 3600)
+        )
+
+def _cache(tmp, caches, rate_limiter=None):
+    return ContextCache(SimpleNamespace(caches=caches), registry_path=os.path.join(tmp, 'context_cache.json'),
+                        ttl_minutes=60, enabled=True, rate_limiter=rate_limiter)
+
+def _documents(tmp):
+    path = os.path.join(tmp, 'release.pdf')
+    with open(path, 'w') as f:
+        f.write('revenue grew')
+    return [('earnings_release', path, 'earnings release')]
+
+def _too_small():
+    return errors.ClientError(400, {'error': {'message': 'Cached content is too small. min_total_token_count=4096',
+                                              'status': 'INVALID_ARGUMENT'}})
+
+def _unavailable():
+    return errors.ServerError(503, {'error': {'message': 'unavailable', 'status': 'UNAVAILABLE'}})
+
+def test_cache_reused_across_instances():
+    """A cache is created through the rate limiter and reused, also by another process's instance."""
+    with tempfile.TemporaryDirectory() as tmp:
+        caches = FakeCaches()
+        documents = _documents(tmp)
+        limited = []
+        rate_limiter = SimpleNamespace(call=lambda fn: limited.append(fn) or fn())
+        name = _cache(tmp, caches, rate_limiter).get_or_create('gemini-test', documents, lambda docs: [])
+        assert name == 'cachedContents/1'
+        assert len(limited) == 1
+        assert _cache(tmp, caches).get_or_create('gemini-test', documents, lambda docs: []) == name
+        assert caches.creates == 1
+
+def test_refused_set_remembered_until_ttl():
+    """A set the API refuses to cache is not sent to caches.create again until the TTL expires."""
+    with tempfile.TemporaryDirectory() as tmp:
+        caches = FakeCaches([_too_small()])
+        documents = _documents(tmp)
+        cache = _cache(tmp, caches)
+        assert cache.get_or_create('gemini-test', documents, lambda docs: []) is None
+        assert _cache(tmp, caches).get_or_create('gemini-test', documents, lambda docs: []) is None
+        assert caches.creates == 1
+        assert cache.stats()['failures'] == 1
+
+def test_transient_failure_retried_next_call():
+    """A 503 or network error is not remembered; the next request tries to create the cache again."""
+    with tempfile.TemporaryDirectory() as tmp:
+        caches = FakeCaches([_unavailable(), ConnectionError("reset")])
+        documents = _documents(tmp)
+        cache = _cache(tmp, caches)
+        assert cache.get_or_create('gemini-test', documents, lambda docs: []) is None
+        assert cache.get_or_create('gemini-test', documents, lambda docs: []) is None
+        assert cache.get_or_create('gemini-test', documents, lambda docs: []) == 'cachedContents/3'
+        assert cache.stats() == {'hits': 0, 'creates': 1, 'failures': 2, 'skipped': 0}
+
+if __name__ == "__main__":
+    test_cache_reused_across_instances()
+    test_refused_set_remembered_until_ttl()
+    test_transient_failure_retried_next_call()
+    print("All context cache tests passed")
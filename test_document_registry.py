@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for the Files API document registry.
+Run this with: python test_document_registry.py
+"""
+
+import os
+import json
+import time
+import tempfile
+from types import SimpleNamespace
+
+from google.genai import types
+
+from document_registry import DocumentRegistry
+
+class FakeFiles:
+    """Files API stand-in whose uploads expire after ttl seconds."""
+
+    def __init__(self, ttl=3600, state=types.FileState.ACTIVE):
+        self.ttl = ttl
+        self.state = state
+        self.uploads = 0
+        self.polls = 0
+
+    def upload(self, file, config):
+        self.uploads += 1
+        return SimpleNamespace(
+            name=f"files/{self.uploads}",
+            uri=f"https://files.example/{self.uploads}",
+            mime_type=config.mime_type,
+            state=self.state,
+            expiration_time=SimpleNamespace(timestamp=lambda: time.time() + self.ttl),
+            error=None
+        )
+
+    def get(self, name):
+        self.polls += 1
+        return SimpleNamespace(name=name, state=self.state)
+
+def _registry(tmp, files, refresh_margin_seconds=60, processing_timeout_seconds=60):
+    client = SimpleNamespace(files=files)
+    return DocumentRegistry(client, registry_path=os.path.join(tmp, 'registry.json'), enabled=True,
+                            refresh_margin_seconds=refresh_margin_seconds,
+                            processing_timeout_seconds=processing_timeout_seconds)
+
+def _write_file(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+def test_upload_reused_across_paths_and_processes():
+    """The same content is uploaded once, even from another path or a fresh registry."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FakeFiles()
+        registry = _registry(tmp, files)
+        first = _write_file(tmp, 'release.pdf', 'revenue grew')
+        copy = _write_file(tmp, 'copy.pdf', 'revenue grew')
+
+        record = registry.get_remote_file(first, 'application/pdf')
+        assert registry.get_remote_file(copy, 'application/pdf')['name'] == record['name']
+        assert _registry(tmp, files).get_remote_file(first, 'application/pdf')['name'] == record['name']
+        assert files.uploads == 1
+
+def test_expired_record_is_uploaded_again():
+    """A record within the refresh margin of its expiry is replaced by a new upload."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FakeFiles(ttl=30)
+        registry = _registry(tmp, files, refresh_margin_seconds=60)
+        doc = _write_file(tmp, 'release.pdf', 'revenue grew')
+
+        first = registry.get_remote_file(doc, 'application/pdf')
+        second = registry.get_remote_file(doc, 'application/pdf')
+        assert first['name'] != second['name']
+        assert files.uploads == 2
+
+def test_invalidate_keeps_other_processes_records():
+    """Invalidating one document neither revives it nor overwrites newer records of other documents."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FakeFiles()
+        registry = _registry(tmp, files)
+        other_process = _registry(tmp, files)
+        doc = _write_file(tmp, 'release.pdf', 'revenue grew')
+        other = _write_file(tmp, 'transcript.pdf', 'margins held')
+
+        registry.get_remote_file(doc, 'application/pdf')
+        registry.get_remote_file(other, 'application/pdf')
+
+        # Another process re-uploads the second document, so its record on disk is newer
+        other_process.invalidate(other)
+        newer = other_process.get_remote_file(other, 'application/pdf')
+
+        registry.invalidate(doc)
+        with open(registry.registry_path) as f:
+            on_disk = json.load(f)
+        assert newer['sha256'] in on_disk
+        assert on_disk[newer['sha256']]['name'] == newer['name']
+        assert len(on_disk) == 1
+
+        # The next use uploads the invalidated document again
+        assert registry.get_remote_file(doc, 'application/pdf')['name'] == f"files/{files.uploads}"
+        assert files.uploads == 4
+
+def test_processing_upload_times_out():
+    """An upload stuck in PROCESSING raises instead of polling forever, and nothing is recorded."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = FakeFiles(state=types.FileState.PROCESSING)
+        registry = _registry(tmp, files, processing_timeout_seconds=1.5)
+        doc = _write_file(tmp, 'release.pdf', 'revenue grew')
+        try:
+            registry.get_remote_file(doc, 'application/pdf')
+            assert False, "the upload should time out"
+        except TimeoutError:
+            pass
+        assert 1 <= files.polls <= 3
+        assert registry.get_record(doc) is None
+
+if __name__ == "__main__":
+    test_upload_reused_across_paths_and_processes()
+    test_expired_record_is_uploaded_again()
+    test_invalidate_keeps_other_processes_records()
+    test_processing_upload_times_out()
+    print("All document registry tests passed")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Test script for the document downloader against a local HTTP server.
+Run this with: python test_downloader.py
+"""
+
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+from config_manager import ConfigManager
+from downloader import EarningsDocDownloader, PARTIAL_SUFFIX
+from storage_manager import StorageManager
+
+DOCUMENT = b'Cloud revenue grew 30% year over year. ' * 100
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.documents (path -> (body, etag)) with validators and ranges.
+
+    Each request takes the next action from server.script, if any: 'drop'
+    closes the connection without answering, 'short' sends half the body
+    and 'wrong_offset' answers a range request from the start.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(dict(self.headers, path=self.path))
+            self.action = server.script.pop(0) if server.script else None
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        try:
+            time.sleep(server.delay_seconds)
+            if self.action == 'drop':
+                self.close_connection = True
+                return
+            body, etag = server.documents[self.path]
+            if self.headers.get('Range') and self.headers.get('If-Range') == etag:
+                start = 0 if self.action == 'wrong_offset' else int(self.headers['Range'][6:-1])
+                if start >= len(body):
+                    self._send(416, b'', etag, {'Content-Range': f"bytes */{len(body)}"})
+                else:
+                    self._send(206, body[start:], etag, {'Content-Range': f"bytes {start}-{len(body) - 1}/{len(body)}"})
+            elif self.headers.get('If-None-Match') == etag and 'Range' not in self.headers:
+                self._send(304, b'', etag)
+            else:
+                self._send(200, body, etag)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, body, etag, headers=None):
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Wed, 01 Jan 2025 00:00:00 GMT')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.action == 'short':
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+@contextmanager
+def _serving(documents, script=None, delay_seconds=0):
+    """Serve documents on a local port; downloads retry without backoff and stream in small chunks."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DocumentHandler)
+    server.daemon_threads = True
+    server.documents = documents
+    server.script = list(script or [])
+    server.requests = []
+    server.lock = threading.Lock()
+    server.in_flight = server.peak = 0
+    server.delay_seconds = delay_seconds
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    original = (config.DOWNLOAD_RETRY_BACKOFF_SECONDS, config.DOWNLOAD_CHUNK_BYTES)
+    config.DOWNLOAD_RETRY_BACKOFF_SECONDS, config.DOWNLOAD_CHUNK_BYTES = 0, 50
+    try:
+        yield server
+    finally:
+        config.DOWNLOAD_RETRY_BACKOFF_SECONDS, config.DOWNLOAD_CHUNK_BYTES = original
+        server.shutdown()
+        server.server_close()
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def _downloader(tmp, refresh_policy='if_stale', quota_mb=0):
+    """A downloader keeping its downloads, reports and caches under tmp."""
+    original = config.LOCAL_STORAGE_PATH
+    config.LOCAL_STORAGE_PATH = os.path.join(tmp, 'downloads')
+    try:
+        downloader = EarningsDocDownloader(ConfigManager(os.path.join(tmp, 'company_config.json')), refresh_policy)
+    finally:
+        config.LOCAL_STORAGE_PATH = original
+    cache_dir = os.path.join(tmp, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    downloader.storage_manager = StorageManager(
+        downloader.config_manager, downloader.blob_store, storage_path=downloader.storage_path,
+        results_dir=os.path.join(tmp, 'results'), cache_dir=cache_dir, quota_mb=quota_mb,
+        access_log_path=os.path.join(cache_dir, 'storage_access.json'),
+        result_cache_dir=os.path.join(cache_dir, 'results')
+    )
+    return downloader
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_dropped_connection_is_retried():
+    """A dropped connection is retried by the downloader alone, DOWNLOAD_RETRIES times."""
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}, ['drop']) as server:
+        downloader = _downloader(tmp)
+        path = downloader.download_file(_url(server, '/release.pdf'), 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _read(path) == DOCUMENT
+        assert len(server.requests) == 2
+
+        server.script = ['drop'] * 20
+        server.requests.clear()
+        server.documents['/transcript.html'] = (DOCUMENT, '"v1"')
+        url = _url(server, '/transcript.html')
+        assert downloader.download_file(url, 'ACME', '2025', 'Q1', 'call_transcript') is None
+        assert len(server.requests) == config.DOWNLOAD_RETRIES + 1
+
+def test_download_many_limits_each_host():
+    """Bulk downloads run concurrently, at most per_host_limit against one host, once per item."""
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = {f"/doc{i}.pdf": (DOCUMENT + bytes([i]), f'"{i}"') for i in range(6)}
+        with _serving(documents, delay_seconds=0.05) as server:
+            downloader = _downloader(tmp)
+            downloader.per_host_limit = 2
+            items = [('ACME', '2025', f"Q{i}", 'earnings_release', _url(server, f"/doc{i}.pdf")) for i in range(6)]
+            paths = downloader.download_many(items + items[:1], concurrency=6)
+            assert len(paths) == 6 and len(server.requests) == 6
+            assert server.peak == 2
+            for i, item in enumerate(items):
+                assert _read(paths[item]) == documents[f"/doc{i}.pdf"][0]
+
+def test_refresh_revalidates_with_conditional_get():
+    """Revalidation sends the recorded validators; a 304 keeps the file and a new version replaces it."""
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}) as server:
+        downloader = _downloader(tmp, refresh_policy='always')
+        url = _url(server, '/release.pdf')
+        path = downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release')
+        metadata = downloader.get_metadata(path)
+        assert metadata['url'] == url and metadata['etag'] == '"v1"'
+        assert metadata['content_length'] == len(DOCUMENT)
+        assert metadata['sha256'] == downloader.blob_store.digest(path)
+
+        time.sleep(0.01)
+        assert downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release') == path
+        assert server.requests[-1]['If-None-Match'] == '"v1"'
+        assert server.requests[-1]['If-Modified-Since'] == 'Wed, 01 Jan 2025 00:00:00 GMT'
+        refreshed = downloader.get_metadata(path)
+        assert refreshed['fetched_at'] > metadata['fetched_at']
+        assert dict(refreshed, fetched_at=None) == dict(metadata, fetched_at=None)
+        assert _read(path) == DOCUMENT
+
+        # A re-issued document is downloaded in full and replaces the old one
+        server.documents['/release.pdf'] = (b'Restated: ' + DOCUMENT, '"v2"')
+        assert downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release') == path
+        assert _read(path) == b'Restated: ' + DOCUMENT
+        assert downloader.get_metadata(path)['etag'] == '"v2"'
+        assert len(server.requests) == 3
+
+def test_existing_downloads_are_reused():
+    """Fresh or never-refreshed files are served without a request, and a known URL is linked to new paths."""
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}) as server:
+        url = _url(server, '/release.pdf')
+        path = _downloader(tmp).download_file(url, 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _downloader(tmp).download_file(url, 'ACME', '2025', 'Q1', 'earnings_release') == path
+
+        # 'never' skips revalidation even for a stale file
+        downloader = _downloader(tmp, refresh_policy='never')
+        downloader.stale_after_seconds = 0
+        assert downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release') == path
+        assert len(server.requests) == 1
+
+        linked = downloader.download_file(url, 'ACME', '2024', 'Q4', 'earnings_release')
+        assert linked != path and _read(linked) == DOCUMENT
+        assert os.path.samefile(linked, path)
+        assert downloader.get_metadata(linked) == downloader.get_metadata(path)
+        assert len(server.requests) == 1
+
+def _partial(downloader, url, body, etag='"v1"'):
+    """Leave a partial download of url for ACME 2025 Q1, as an interrupted earlier run would."""
+    part_path = os.path.join(downloader.storage_path, 'acme', '2025_Q1', f"release.pdf{PARTIAL_SUFFIX}")
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    with open(part_path, 'wb') as f:
+        f.write(body)
+    downloader._write_metadata(part_path, {'url': url, 'etag': etag, 'last_modified': None})
+    return part_path
+
+def test_interrupted_download_resumes():
+    """A short body is resumed with Range/If-Range; a 206 from the wrong offset restarts with a plain GET."""
+    half = len(DOCUMENT) // 2
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}, ['short']) as server:
+        downloader = _downloader(tmp)
+        url = _url(server, '/release.pdf')
+        path = downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _read(path) == DOCUMENT
+        ranges = [(request.get('Range'), request.get('If-Range')) for request in server.requests]
+        assert ranges == [(None, None), (f"bytes={half}-", '"v1"')]
+        assert downloader.get_metadata(path)['sha256'] == downloader.blob_store.digest(path)
+        assert not os.path.exists(f"{path}{PARTIAL_SUFFIX}")
+
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}) as server:
+        server.script = ['short', 'wrong_offset']
+        downloader = _downloader(tmp)
+        path = downloader.download_file(_url(server, '/release.pdf'), 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _read(path) == DOCUMENT
+        assert [r.get('Range') for r in server.requests] == [None, f"bytes={half}-", None]
+
+def test_complete_partial_is_promoted_on_416():
+    """A partial file already holding the whole document is used as is; a longer one is fetched again."""
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}) as server:
+        downloader = _downloader(tmp)
+        url = _url(server, '/release.pdf')
+        part_path = _partial(downloader, url, DOCUMENT)
+        path = downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _read(path) == DOCUMENT and not os.path.exists(part_path)
+        assert [r.get('Range') for r in server.requests] == [f"bytes={len(DOCUMENT)}-"]
+        metadata = downloader.get_metadata(path)
+        assert metadata['etag'] == '"v1"' and metadata['content_length'] == len(DOCUMENT)
+        assert downloader.blob_store.find_by_url(url)['sha256'] == metadata['sha256']
+
+    with tempfile.TemporaryDirectory() as tmp, _serving({'/release.pdf': (DOCUMENT, '"v1"')}) as server:
+        downloader = _downloader(tmp)
+        url = _url(server, '/release.pdf')
+        _partial(downloader, url, DOCUMENT + b'trailing garbage')
+        path = downloader.download_file(url, 'ACME', '2025', 'Q1', 'earnings_release')
+        assert _read(path) == DOCUMENT
+        assert [r.get('Range') for r in server.requests] == [f"bytes={len(DOCUMENT) + 16}-", None]
+
+def test_download_eviction_keeps_documents_in_use():
+    """A job's downloads do not evict documents another job downloaded moments ago and is still analyzing."""
+    documents = {'/q1.pdf': (DOCUMENT * 5, '"q1"'), '/q2.pdf': (DOCUMENT * 5 + b'!', '"q2"')}
+    with tempfile.TemporaryDirectory() as tmp, _serving(documents) as server:
+        quota_mb = len(DOCUMENT) * 8 / 1024 / 1024
+        analyzing = _downloader(tmp, quota_mb=quota_mb)
+        first = ('ACME', '2025', 'Q1', 'earnings_release', _url(server, '/q1.pdf'))
+        in_use = analyzing.download_many([first])[first]
+
+        downloading = _downloader(tmp, quota_mb=quota_mb)
+        second = ('ACME', '2025', 'Q2', 'earnings_release', _url(server, '/q2.pdf'))
+        downloading.download_many([second])
+        assert os.path.exists(in_use)
+        assert downloading.storage_manager.total_usage() > downloading.storage_manager.quota_bytes
+
+        # Documents nobody used recently are evicted as before
+        downloading.storage_manager.in_use_seconds = 0
+        downloading.download_many([second])
+        assert not os.path.exists(in_use)
+
+if __name__ == "__main__":
+    test_dropped_connection_is_retried()
+    test_download_many_limits_each_host()
+    test_refresh_revalidates_with_conditional_get()
+    test_existing_downloads_are_reused()
+    test_interrupted_download_resumes()
+    test_complete_partial_is_promoted_on_416()
+    test_download_eviction_keeps_documents_in_use()
+    print("All downloader tests passed")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test script for per-call deadlines and hedged Gemini requests.
+Run this with: python test_hedging.py
+"""
+
+import time
+import asyncio
+import threading
+
+from generation_metrics import GenerationMetrics
+from hedging import HedgedCaller, DeadlineExceededError
+
+def _caller(deadline_seconds=5, delay_seconds=0.05, fallback_model=''):
+    # min_samples is out of reach, so the hedge is always sent after delay_seconds
+    return HedgedCaller(GenerationMetrics(), deadline_seconds=deadline_seconds, enabled=True,
+                        delay_seconds=delay_seconds, min_samples=1000, fallback_model=fallback_model)
+
+def _slow(result, seconds, calls=None):
+    def request():
+        if calls is not None:
+            calls.append(result)
+        time.sleep(seconds)
+        return result
+    return request
+
+def _failing(seconds):
+    def request():
+        time.sleep(seconds)
+        raise ConnectionError("connection reset")
+    return request
+
+def test_fast_primary_is_not_hedged():
+    """A primary that finishes before the hedge delay wins without a duplicate request."""
+    caller = _caller(delay_seconds=0.5)
+    calls = []
+    assert caller.call(_slow('primary', 0.01, calls), _slow('hedge', 0.01, calls), model='m') == 'primary'
+    assert calls == ['primary']
+    assert caller.metrics.calls == 1
+    assert caller.metrics.hedged == 0
+
+def test_hedge_wins_and_loser_is_abandoned():
+    """A slow primary is hedged; the first result wins without waiting for the other request."""
+    caller = _caller(delay_seconds=0.05)
+    started = time.monotonic()
+    assert caller.call(_slow('primary', 1.0), _slow('hedge', 0.05), model='m') == 'hedge'
+    assert time.monotonic() - started < 0.5
+    assert caller.metrics.hedged == 1
+    assert caller.metrics.hedge_wins == 1
+
+    # The primary can still win a hedged race
+    caller = _caller(delay_seconds=0.05)
+    assert caller.call(_slow('primary', 0.1), _slow('hedge', 1.0), model='m') == 'primary'
+    assert caller.metrics.hedged == 1
+    assert caller.metrics.hedge_wins == 0
+
+def test_error_falls_through_to_other_request():
+    """When one request fails while the other is running, the other one's result is used."""
+    caller = _caller(delay_seconds=0.05)
+    assert caller.call(_failing(0.1), _slow('hedge', 0.2), model='m') == 'hedge'
+    assert caller.metrics.hedge_wins == 1
+
+    caller = _caller(delay_seconds=0.05)
+    assert caller.call(_slow('primary', 0.2), _failing(0.01), model='m') == 'primary'
+
+    # A primary failing before the hedge is due is left to the retry policy
+    caller = _caller(delay_seconds=0.5)
+    calls = []
+    try:
+        caller.call(_failing(0.01), _slow('hedge', 0.01, calls), model='m')
+        assert False, "the primary's error should be raised"
+    except ConnectionError:
+        pass
+    assert calls == []
+
+def test_deadline_exceeded():
+    """Neither request finishing within the deadline raises DeadlineExceededError."""
+    caller = _caller(deadline_seconds=0.2, delay_seconds=0.05)
+    started = time.monotonic()
+    try:
+        caller.call(_slow('primary', 1.0), _slow('hedge', 1.0), model='m')
+        assert False, "the call should time out"
+    except DeadlineExceededError as e:
+        assert '(hedged)' in str(e)
+    assert time.monotonic() - started < 0.5
+    assert caller.metrics.deadline_exceeded == 1
+
+def test_async_loser_is_cancelled():
+    """In the async path the losing request is cancelled."""
+    caller = _caller(delay_seconds=0.05)
+    cancelled = threading.Event()
+
+    async def primary():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return 'primary'
+
+    async def hedge():
+        await asyncio.sleep(0.05)
+        return 'hedge'
+
+    async def race():
+        result = await caller.call_async(primary, hedge, model='m')
+        # Let the cancelled task run its handler
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(race()) == 'hedge'
+    assert cancelled.is_set()
+    assert caller.metrics.hedge_wins == 1
+
+if __name__ == "__main__":
+    test_fast_primary_is_not_hedged()
+    test_hedge_wins_and_loser_is_abandoned()
+    test_error_falls_through_to_other_request()
+    test_deadline_exceeded()
+    test_async_loser_is_cancelled()
+    print("All hedging tests passed")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent job queue.
+Run this with: python test_job_queue.py
+"""
+
+import os
+import time
+import tempfile
+import threading
+
+from job_queue import JobQueue, Job
+
+def _queue(tmp, handler, **kwargs):
+    queue = JobQueue(db_path=os.path.join(tmp, 'jobs.db'), max_workers=1, **kwargs)
+    queue.register('live', handler)
+    return queue
+
+def _blocking(release, result=None):
+    def handler(job, **params):
+        release.wait(5)
+        return result
+    return handler
+
+def _wait_finished(queue, job_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['finished']:
+            return job
+        time.sleep(0.01)
+    assert False, f"job {job_id} did not finish"
+
+def test_requeued_job_output_starts_over():
+    """A requeued job's output is cleared and read_output reports the new attempt."""
+    with tempfile.TemporaryDirectory() as tmp:
+        release = threading.Event()
+        first = _queue(tmp, _blocking(release), stale_after=0)
+        job_id = first.submit('live', ticker='acme')
+        first._claim_jobs()
+        Job(first, job_id).append_output('partial report')
+        assert first.read_output(job_id) == ('running', None, 1, 'partial report')
+        assert first.read_output(job_id, 8) == ('running', None, 1, 'report')
+
+        # The first worker stops sending heartbeats and another one takes the job over
+        time.sleep(0.01)
+        first._requeue_stale()
+        assert first.get(job_id)['status'] == 'queued'
+        second = _queue(tmp, _blocking(release))
+        second._claim_jobs()
+        assert second.read_output(job_id) == ('running', None, 2, '')
+        assert first.read_output('missing') is None
+
+        release.set()
+        first._executor.shutdown(wait=True)
+        second._executor.shutdown(wait=True)
+
+def test_claimed_job_runs_once():
+    """A claimed job is owned by one queue, runs its handler and stores the result."""
+    with tempfile.TemporaryDirectory() as tmp:
+        calls = []
+        first = _queue(tmp, lambda job, **params: calls.append(params) or {'ticker': params['ticker']})
+        second = _queue(tmp, lambda job, **params: calls.append(params))
+        job_id = first.submit('live', ticker='acme')
+
+        first._claim_jobs()
+        second._claim_jobs()
+        first._executor.shutdown(wait=True)
+        job = first.get(job_id)
+        assert job['status'] == 'succeeded' and job['result'] == {'ticker': 'acme'}
+        assert job['owner'] == first.owner and job['attempts'] == 1
+        assert calls == [{'ticker': 'acme'}]
+
+def test_stale_job_is_requeued_then_failed():
+    """A job whose worker stops responding is requeued until it has been started max_attempts times."""
+    with tempfile.TemporaryDirectory() as tmp:
+        release = threading.Event()
+        queue = _queue(tmp, _blocking(release), stale_after=0, max_attempts=2)
+        job_id = queue.submit('live', ticker='acme')
+
+        queue._claim_jobs()
+        time.sleep(0.01)
+        queue._requeue_stale()
+        job = queue.get(job_id)
+        assert job['status'] == 'queued' and job['owner'] is None
+        assert job['error'] == f"Worker {queue.owner} stopped responding"
+
+        release.set()
+        queue._executor.shutdown(wait=True)
+        release = threading.Event()
+        queue = _queue(tmp, _blocking(release), stale_after=0, max_attempts=2)
+        queue._claim_jobs()
+        assert queue.get(job_id)['attempts'] == 2
+        time.sleep(0.01)
+        queue._requeue_stale()
+        job = queue.get(job_id)
+        assert job['status'] == 'failed' and job['finished']
+        assert job['error'] == f"Gave up after 2 attempts: Worker {queue.owner} stopped responding"
+
+        # The lost worker finishing later does not undo the failure
+        release.set()
+        queue._executor.shutdown(wait=True)
+        assert queue.get(job_id)['status'] == 'failed'
+
+def test_lost_worker_cannot_overwrite_new_attempt():
+    """A worker finishing a job that was taken over leaves the new attempt's state and output alone."""
+    with tempfile.TemporaryDirectory() as tmp:
+        lost, release = threading.Event(), threading.Event()
+        first = _queue(tmp, _blocking(lost, 'stale'), stale_after=0)
+        second = _queue(tmp, _blocking(release, 'fresh'))
+        job_id = first.submit('live', ticker='acme')
+
+        first._claim_jobs()
+        time.sleep(0.01)
+        first._requeue_stale()
+        second._claim_jobs()
+
+        Job(first, job_id).append_output('stale text')
+        Job(second, job_id).append_output('fresh text')
+        Job(first, job_id).set_progress('stale progress')
+        lost.set()
+        first._executor.shutdown(wait=True)
+        assert second.read_output(job_id) == ('running', None, 2, 'fresh text')
+
+        release.set()
+        second._executor.shutdown(wait=True)
+        job = second.get(job_id)
+        assert job['status'] == 'succeeded' and job['result'] == 'fresh'
+
+if __name__ == "__main__":
+    test_requeued_job_output_starts_over()
+    test_claimed_job_runs_once()
+    test_stale_job_is_requeued_then_failed()
+    test_lost_worker_cannot_overwrite_new_attempt()
+    print("All job queue tests passed")
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Test script for the command-line report helpers.
+Run this with: python test_main.py
+"""
+
+from main import generate_email_markdown
+
+def _result(**fields):
+    return dict({'company': 'Acme', 'ticker': 'ACME', 'quarter': 'Q1', 'year': '2025', 'content': '## Summary'},
+                **fields)
+
+def test_email_footer_names_model():
+    """The footer names the model that generated the analysis, and no model when it is unknown."""
+    email_md = generate_email_markdown(_result(model='gemini-2.5-flash'))
+    assert email_md.startswith('# GCP Impact Analysis: Acme (ACME) - Q1 2025')
+    assert '## Summary' in email_md
+    assert ' using gemini-2.5-flash*' in email_md
+
+    email_md = generate_email_markdown(_result(model=None))
+    assert ' using ' not in email_md and 'Gemini 2.5 Pro' not in email_md
+
+def test_email_for_failed_analysis():
+    """A failed analysis renders its error instead of a report."""
+    email_md = generate_email_markdown({'company': 'Acme', 'error': 'quota exceeded'})
+    assert email_md == "# ERROR: quota exceeded\n\nFailed to analyze Acme earnings."
+
+if __name__ == "__main__":
+    test_email_footer_names_model()
+    test_email_for_failed_analysis()
+    print("All main tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for page-level relevance filtering.
+Run this with: python test_page_filter.py
+"""
+
+import os
+import tempfile
+
+from PyPDF2 import PdfReader
+
+from page_filter import PageFilter, score_page
+from text_extraction import TextExtractor, PAGE_SEPARATOR
+from test_text_extraction import write_pdf
+
+PAGES = [
+    'Acme reports fourth quarter results',
+    'Forward-looking statements and safe harbor: undue reliance',
+    'Cloud revenue grew on AI and GPU demand in the data center',
+    'Table of contents',
+    'Capex guidance: capital expenditure for data center infrastructure',
+]
+
+def _filter(page_budget):
+    return PageFilter(TextExtractor(max_workers=1, min_chars=1), page_budget=page_budget, enabled=True)
+
+def test_scores_rank_relevant_pages():
+    """Cloud and capex pages outscore empty pages, which outscore boilerplate."""
+    assert score_page(PAGES[2]) > score_page(PAGES[3]) == 0.0
+    assert score_page(PAGES[1]) < 0
+    assert score_page('   ') == 0.0
+    # 'ai' only matches as a word
+    assert score_page('said maintained') == 0.0
+
+def test_first_page_and_top_pages_kept_in_order():
+    """The first page is always kept, plus the best-scoring pages up to the budget, in document order."""
+    assert _filter(3).select_pages(PAGES) == [0, 2, 4]
+    assert _filter(5).select_pages(PAGES) == [0, 1, 2, 3, 4]
+
+def test_reduce_pdf():
+    """A PDF is rewritten with only the selected pages and cached per selection."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = write_pdf(os.path.join(tmp, 'release.pdf'), PAGES)
+        page_filter = _filter(3)
+
+        reduced_path, pages, total_pages = page_filter.reduce(pdf)
+        assert (pages, total_pages) == ([1, 3, 5], 5)
+        assert os.path.dirname(reduced_path) == os.path.join(tmp, '.page_cache')
+        reader = PdfReader(reduced_path)
+        assert [page.extract_text().strip() for page in reader.pages] == [PAGES[0], PAGES[2], PAGES[4]]
+
+        # The same selection reuses the cached copy
+        modified = os.path.getmtime(reduced_path)
+        assert page_filter.reduce(pdf) == (reduced_path, [1, 3, 5], 5)
+        assert os.path.getmtime(reduced_path) == modified
+
+def test_reduce_text_keeps_page_numbers():
+    """Extracted text is cut to the selected pages, labelled with their original numbers."""
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = os.path.join(tmp, 'release.txt')
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(PAGE_SEPARATOR.join(PAGES))
+
+        reduced_path, pages, _ = _filter(2).reduce(text_path)
+        assert pages == [1, 3]
+        with open(reduced_path, encoding='utf-8') as f:
+            assert f.read().split(PAGE_SEPARATOR) == [f"[Page 1]\n{PAGES[0]}", f"[Page 3]\n{PAGES[2]}"]
+
+def test_documents_left_whole():
+    """Short documents, unreadable PDFs and a disabled filter send the original."""
+    with tempfile.TemporaryDirectory() as tmp:
+        short = write_pdf(os.path.join(tmp, 'short.pdf'), PAGES[:2])
+        scan = write_pdf(os.path.join(tmp, 'scan.pdf'), [''] * 6)
+        assert _filter(3).reduce(short) == (short, None, None)
+        assert PageFilter(TextExtractor(min_chars=5), page_budget=3, enabled=True).reduce(scan) == (scan, None, None)
+        assert PageFilter(page_budget=1, enabled=False).reduce(short) == (short, None, None)
+
+if __name__ == "__main__":
+    test_scores_rank_relevant_pages()
+    test_first_page_and_top_pages_kept_in_order()
+    test_reduce_pdf()
+    test_reduce_text_keeps_page_numbers()
+    test_documents_left_whole()
+    print("All page filter tests passed")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test script for splitting analysis prompts into report sections.
+Run this with: python test_prompt_sections.py
+"""
+
+from prompt_sections import split_prompt_sections
+
+PROMPT = """
+    You are a strategic analyst. Analyze Acme's Q1 2025 earnings.
+
+    ## Executive Summary
+
+    - Headline results
+    - Overall tone
+
+    ## Cloud Impact
+    - Cloud revenue and growth
+
+    Format the report in markdown.
+    Cite page numbers.
+"""
+
+def test_split_sections():
+    """The preamble, each section's bullets and the closing instructions are separated."""
+    split = split_prompt_sections(PROMPT)
+    assert split['preamble'] == "You are a strategic analyst. Analyze Acme's Q1 2025 earnings."
+    assert split['sections'] == [
+        {'title': 'Executive Summary', 'body': '- Headline results\n- Overall tone'},
+        {'title': 'Cloud Impact', 'body': '- Cloud revenue and growth'}
+    ]
+    assert split['instructions'] == 'Format the report in markdown.\nCite page numbers.'
+
+def test_prompt_without_sections():
+    """A prompt without '## ' headings is all preamble."""
+    split = split_prompt_sections("Summarize the quarter.\n\nBe brief.")
+    assert split == {'preamble': 'Summarize the quarter.\n\nBe brief.', 'sections': [], 'instructions': ''}
+
+if __name__ == "__main__":
+    test_split_sections()
+    test_prompt_without_sections()
+    print("All prompt section tests passed")
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared Gemini rate limiter and circuit breaker.
+Run this with: python test_rate_limiter.py
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing
+
+from google.genai import errors
+
+from rate_limiter import RateLimiter, CircuitOpenError
+from hedging import DeadlineExceededError
+
+def _limiter(tmp, requests_per_minute=60, tokens_per_minute=1000, failure_threshold=2, cooldown_seconds=60):
+    limiter = RateLimiter(state_path=os.path.join(tmp, 'rate_limit.json'), requests_per_minute=requests_per_minute,
+                          tokens_per_minute=tokens_per_minute, enabled=True)
+    limiter.failure_threshold = failure_threshold
+    limiter.cooldown_seconds = cooldown_seconds
+    limiter.base_delay = 0
+    return limiter
+
+def _server_error():
+    return errors.ServerError(503, {'error': {'message': 'unavailable', 'status': 'UNAVAILABLE'}})
+
+def _client_error():
+    return errors.ClientError(400, {'error': {'message': 'bad request', 'status': 'INVALID_ARGUMENT'}})
+
+def test_token_buckets():
+    """Requests and tokens are drawn from their buckets, and the wait reflects the missing amount."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, requests_per_minute=2, tokens_per_minute=1000)
+        assert limiter._try_acquire(400) == 0
+        assert limiter._try_acquire(400) == 0
+        # Out of requests: one request refills in 30s at 2 per minute
+        assert 29 < limiter._try_acquire(0) <= 30
+
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, requests_per_minute=100, tokens_per_minute=600)
+        assert limiter._try_acquire(500) == 0
+        # 100 tokens left, 300 needed: 200 tokens refill in 20s at 600 per minute
+        assert 19 < limiter._try_acquire(300) <= 20
+
+        # Actual usage lower than the estimate is given back
+        limiter.record_usage(-200)
+        assert limiter._try_acquire(300) == 0
+
+def test_breaker_opens_and_half_opens():
+    """Consecutive server errors open the breaker; after the cooldown one trial call decides."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=2, cooldown_seconds=60)
+        limiter._record_error(_server_error())
+        assert limiter._try_acquire(0) == 0
+        limiter._record_error(_server_error())
+        try:
+            limiter._try_acquire(0)
+            assert False, "breaker should be open"
+        except CircuitOpenError:
+            pass
+
+        # Cooldown over: exactly one caller gets to probe the API
+        with limiter._locked_state() as state:
+            state['breaker']['open_until'] = time.time() - 1
+        assert limiter._try_acquire(0) == 0
+        try:
+            limiter._try_acquire(0)
+            assert False, "second caller should wait for the trial call"
+        except CircuitOpenError:
+            pass
+
+        # A successful trial closes the breaker
+        limiter._record_outcome(True)
+        assert limiter._try_acquire(0) == 0
+        assert limiter._try_acquire(0) == 0
+
+def test_failed_trial_reopens_breaker():
+    """A failing trial call opens the breaker for another cooldown."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=1, cooldown_seconds=60)
+        limiter._record_error(_server_error())
+        with limiter._locked_state() as state:
+            state['breaker']['open_until'] = time.time() - 1
+        assert limiter._try_acquire(0) == 0
+        limiter._record_error(_server_error())
+        try:
+            limiter._try_acquire(0)
+            assert False, "breaker should be open again"
+        except CircuitOpenError as e:
+            assert 'open for another' in str(e)
+
+def test_client_errors_do_not_close_breaker():
+    """A 4xx response never reached the model, so it does not reset the failure count."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=2)
+        limiter._record_error(_server_error())
+        limiter._record_error(_client_error())
+        limiter._record_error(_server_error())
+        try:
+            limiter._try_acquire(0)
+            assert False, "breaker should be open"
+        except CircuitOpenError:
+            pass
+
+def test_call_retries_and_records_success():
+    """Transient errors are retried through call and call_async; success closes the breaker."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=5)
+        limiter.max_attempts = 3
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise _server_error()
+            return 'ok'
+
+        assert limiter.call(flaky) == 'ok'
+        assert len(attempts) == 3
+        with limiter._locked_state() as state:
+            assert state['breaker'] == {}
+
+        async def bad_request():
+            raise _client_error()
+
+        try:
+            asyncio.run(limiter.call_async(bad_request))
+            assert False, "client errors are not retried"
+        except errors.ClientError:
+            pass
+
+def test_exhausted_call_counts_once():
+    """A call that fails every retry is one breaker failure; a missed deadline is none."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=2)
+        limiter.max_attempts = 3
+        attempts = []
+
+        def down():
+            attempts.append(1)
+            raise _server_error()
+
+        try:
+            limiter.call(down)
+            assert False, "the last error should be raised"
+        except errors.ServerError:
+            pass
+        assert len(attempts) == 3
+        with limiter._locked_state() as state:
+            assert state['breaker']['failures'] == 1
+        assert limiter._try_acquire(0) == 0
+
+        async def too_slow():
+            raise DeadlineExceededError("no answer within 1s")
+
+        try:
+            asyncio.run(limiter.call_async(too_slow))
+            assert False, "a missed deadline is not retried"
+        except DeadlineExceededError:
+            pass
+        with limiter._locked_state() as state:
+            assert state['breaker']['failures'] == 1
+
+        async def down_async():
+            raise _server_error()
+
+        try:
+            asyncio.run(limiter.call_async(down_async))
+            assert False, "the last error should be raised"
+        except errors.ServerError:
+            pass
+        try:
+            limiter._try_acquire(0)
+            assert False, "a second exhausted call should open the breaker"
+        except CircuitOpenError:
+            pass
+
+def test_half_open_trial_is_retried():
+    """The trial call after a cooldown may retry a transient error without being locked out by itself."""
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = _limiter(tmp, failure_threshold=1)
+        limiter.max_attempts = 2
+        limiter._record_error(_server_error())
+        with limiter._locked_state() as state:
+            state['breaker']['open_until'] = time.time() - 1
+        attempts = []
+
+        def recovering():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise _server_error()
+            return 'ok'
+
+        assert limiter.call(recovering) == 'ok'
+        with limiter._locked_state() as state:
+            assert state['breaker'] == {}
+
+def _acquire_many(state_path, count, results):
+    limiter = RateLimiter(state_path=state_path, requests_per_minute=10, tokens_per_minute=1000000, enabled=True)
+    results.put(sum(1 for _ in range(count) if limiter._try_acquire(0) == 0))
+
+def test_state_shared_between_processes():
+    """Worker processes draw from one bucket: no more requests are granted than its capacity."""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'rate_limit.json')
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_acquire_many, args=(state_path, 5, results)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        granted = sum(results.get() for _ in processes)
+        assert granted == 10
+
+if __name__ == "__main__":
+    test_token_buckets()
+    test_breaker_opens_and_half_opens()
+    test_failed_trial_reopens_breaker()
+    test_client_errors_do_not_close_breaker()
+    test_call_retries_and_records_success()
+    test_exhausted_call_counts_once()
+    test_half_open_trial_is_retried()
+    test_state_shared_between_processes()
+    print("All rate limiter tests passed")
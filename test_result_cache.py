@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for the analysis result cache.
+Run this with: python test_result_cache.py
+"""
+
+import os
+import time
+import tempfile
+
+from result_cache import ResultCache
+
+def _write_file(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+def test_cache_hit_and_miss():
+    """A stored result is returned for an identical request and counted as a hit."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(cache_dir=os.path.join(tmp, 'cache'), max_size_mb=1, max_age_hours=1, enabled=True)
+        doc = _write_file(tmp, 'release.pdf', 'revenue grew')
+
+        key = ResultCache.make_key([('earnings_release', doc)], 'prompt', 'model-a')
+        assert cache.get(key) is None
+
+        cache.put(key, {'analysis': 'cached text'})
+        assert cache.get(key) == {'analysis': 'cached text'}
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+def test_key_changes_with_inputs():
+    """Changing file content, prompt, model or comparative flag changes the key."""
+    with tempfile.TemporaryDirectory() as tmp:
+        doc = _write_file(tmp, 'release.pdf', 'revenue grew')
+        base = ResultCache.make_key([('earnings_release', doc)], 'prompt', 'model-a')
+
+        assert base != ResultCache.make_key([('earnings_release', doc)], 'other prompt', 'model-a')
+        assert base != ResultCache.make_key([('earnings_release', doc)], 'prompt', 'model-b')
+        assert base != ResultCache.make_key([('earnings_release', doc)], 'prompt', 'model-a', is_comparative=True)
+
+        # Rewrite with different content and a newer mtime so the digest memo is invalidated
+        _write_file(tmp, 'release.pdf', 'revenue fell')
+        os.utime(doc, (time.time() + 5, time.time() + 5))
+        assert base != ResultCache.make_key([('earnings_release', doc)], 'prompt', 'model-a')
+
+def test_eviction_by_age_and_size():
+    """Expired entries are dropped and the least-recently-used entry goes first when over size."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(cache_dir=os.path.join(tmp, 'cache'), max_size_mb=1, max_age_hours=1, enabled=True)
+
+        cache.put('old', {'analysis': 'x'})
+        old_path = os.path.join(cache.cache_dir, 'old.json')
+        os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+        assert cache.get('old') is None
+        assert not os.path.exists(old_path)
+
+        cache.max_bytes = 300
+        cache.put('first', {'analysis': 'a' * 100})
+        os.utime(os.path.join(cache.cache_dir, 'first.json'), (time.time() - 60, time.time() - 60))
+        cache.put('second', {'analysis': 'b' * 100})
+        cache.put('third', {'analysis': 'c' * 100})
+
+        assert cache.get('first') is None
+        assert cache.get('third') == {'analysis': 'c' * 100}
+        assert cache.stats()['evictions'] >= 2
+
+if __name__ == "__main__":
+    test_cache_hit_and_miss()
+    test_key_changes_with_inputs()
+    test_eviction_by_age_and_size()
+    print("All result cache tests passed")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for the local BM25 retrieval index.
+Run this with: python test_retrieval_index.py
+"""
+
+import os
+import tempfile
+
+from retrieval_index import RetrievalIndex
+from prompt_sections import split_prompt_sections
+
+def _write_filing(storage, ticker, period, name, pages):
+    directory = os.path.join(storage, ticker, period)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\f'.join(pages))
+    return path
+
+def _index(tmp):
+    return RetrievalIndex(index_dir=os.path.join(tmp, 'index'), storage_path=os.path.join(tmp, 'downloads'),
+                          chunk_words=20, overlap_words=5)
+
+def test_search_ranks_relevant_pages():
+    """The page about cloud revenue outranks boilerplate, and filters restrict results."""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, 'downloads')
+        _write_filing(storage, 'amzn', '2025_Q1', 'release.txt', [
+            "AWS cloud revenue grew 17 percent driven by generative AI demand",
+            "This release contains forward-looking statements subject to risks and uncertainties",
+        ])
+        index = _index(tmp)
+        assert index.update() == {'added': 1, 'removed': 0, 'unchanged': 0}
+
+        results = index.search("cloud revenue AI", k=2)
+        assert results[0]['page'] == 1
+        assert results[0]['ticker'] == 'amzn' and results[0]['period'] == '2025_Q1'
+        assert index.search("cloud revenue", tickers=['msft']) == []
+
+def test_incremental_update():
+    """Only new or changed files are indexed; deleted files drop out of results."""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, 'downloads')
+        first = _write_filing(storage, 'amzn', '2025_Q1', 'release.txt', ["AWS cloud revenue grew"])
+        index = _index(tmp)
+        index.update()
+
+        _write_filing(storage, 'msft', 'FY25_Q3', 'release.txt', ["Azure cloud revenue grew 33 percent"])
+        assert index.update() == {'added': 1, 'removed': 0, 'unchanged': 1}
+        assert {result['ticker'] for result in index.search("cloud revenue")} == {'amzn', 'msft'}
+
+        os.remove(first)
+        assert index.update() == {'added': 0, 'removed': 1, 'unchanged': 1}
+        assert {result['ticker'] for result in index.search("cloud revenue")} == {'msft'}
+
+        # A fresh instance reads the same index from disk
+        assert _index(tmp).update() == {'added': 0, 'removed': 0, 'unchanged': 1}
+
+def test_files_without_text_are_recorded():
+    """A document with no extractable text is indexed once, with no chunks, and not extracted again."""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, 'downloads')
+        _write_filing(storage, 'amzn', '2025_Q1', 'release.txt', ["AWS cloud revenue grew"])
+        _write_filing(storage, 'amzn', '2025_Q1', 'scan.txt', [""])
+        index = _index(tmp)
+        assert index.update() == {'added': 2, 'removed': 0, 'unchanged': 0}
+
+        extracted = []
+        extract_many = index.text_extractor.extract_many
+        index.text_extractor.extract_many = lambda paths, **kwargs: extracted.extend(paths) or extract_many(paths, **kwargs)
+        assert index.update() == {'added': 0, 'removed': 0, 'unchanged': 2}
+        assert _index(tmp).update() == {'added': 0, 'removed': 0, 'unchanged': 2}
+        assert extracted == []
+        assert [result['ticker'] for result in index.search("cloud revenue")] == ['amzn']
+
+def test_split_prompt_sections():
+    """Report sections are read from the '## ' headings of the prompt."""
+    parts = split_prompt_sections("Intro line\n\n## Financial Overview\n- Revenue\n\n## Cloud\n- Azure\n\nFormat as markdown.")
+    assert parts['preamble'] == "Intro line"
+    assert [section['title'] for section in parts['sections']] == ['Financial Overview', 'Cloud']
+    assert parts['sections'][1]['body'] == "- Azure"
+    assert parts['instructions'] == "Format as markdown."
+
+if __name__ == "__main__":
+    test_search_ranks_relevant_pages()
+    test_incremental_update()
+    test_files_without_text_are_recorded()
+    test_split_prompt_sections()
+    print("All retrieval index tests passed")
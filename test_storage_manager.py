@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test script for the storage quota and LRU eviction.
+Run this with: python test_storage_manager.py
+"""
+
+import os
+import json
+import time
+import tempfile
+import multiprocessing
+
+from blob_store import BlobStore
+from config_manager import ConfigManager
+from storage_manager import StorageManager
+
+UNIT_BYTES = 10000
+
+def _write_file(path, age_seconds, content=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content or os.urandom(UNIT_BYTES))
+    modified = time.time() - age_seconds
+    os.utime(path, (modified, modified))
+    return path
+
+def _setup(tmp, quota_bytes=35000):
+    """
+    Six 10 KB units, oldest first: AAPL's latest quarter (pinned), an unconfigured
+    ticker's quarter, AAPL's previous quarter, its report, the latest quarter's
+    report (pinned) and a result cache entry. Units used in the last minute are in use.
+    """
+    config_path = os.path.join(tmp, 'company_config.json')
+    with open(config_path, 'w') as f:
+        json.dump({'companies': {'aapl': {'releases': {'2024': {
+            'Q1': {'date': 'January 30, 2024'}, 'Q2': {'date': 'May 2, 2024'}
+        }}}}, 'meta': {}}, f)
+
+    storage_path = os.path.join(tmp, 'downloads')
+    results_dir = os.path.join(tmp, 'results')
+    cache_dir = os.path.join(tmp, 'cache')
+    blob_store = BlobStore(storage_path, enabled=True)
+    paths = {
+        'latest': _write_file(os.path.join(storage_path, 'AAPL', '2024_Q2', 'release.pdf'), 1000),
+        'unconfigured': _write_file(os.path.join(storage_path, 'MSFT', '2023_Q4', 'release.pdf'), 900),
+        'previous': _write_file(os.path.join(storage_path, 'AAPL', '2024_Q1', 'release.pdf'), 800),
+        'previous_report': _write_file(os.path.join(results_dir, 'AAPL_2024_Q1_analysis.md'), 700),
+        'latest_report': _write_file(os.path.join(results_dir, 'AAPL_2024_Q2_analysis.md'), 600),
+        'cached_result': _write_file(os.path.join(cache_dir, 'results', 'entry.json'), 500),
+    }
+    for key in ('latest', 'unconfigured', 'previous'):
+        blob_store.add(paths[key])
+
+    manager = StorageManager(
+        ConfigManager(config_path), blob_store, storage_path=storage_path, results_dir=results_dir,
+        cache_dir=cache_dir, quota_mb=quota_bytes / 1024 / 1024,
+        access_log_path=os.path.join(cache_dir, 'storage_access.json'),
+        result_cache_dir=os.path.join(cache_dir, 'results'), in_use_seconds=60
+    )
+    return manager, paths
+
+def _evicted(evicted):
+    return [unit['path'] for unit in evicted]
+
+def test_least_recently_used_evicted_first():
+    """Units are evicted oldest first until usage fits, skipping the latest quarter and its report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, paths = _setup(tmp)
+        units = {unit['path']: unit for unit in manager.scan()}
+        assert units[os.path.dirname(paths['latest'])]['pinned']
+        assert units[paths['latest_report']]['pinned']
+        assert not units[os.path.dirname(paths['unconfigured'])]['pinned']
+
+        evicted = manager.enforce_quota()
+        assert _evicted(evicted) == [
+            os.path.dirname(paths['unconfigured']), os.path.dirname(paths['previous']), paths['previous_report']
+        ]
+        assert manager.total_usage() <= manager.quota_bytes
+        assert os.path.exists(paths['latest']) and os.path.exists(paths['latest_report'])
+        assert os.path.exists(paths['cached_result'])
+
+        # Nothing more to do once usage fits
+        assert manager.enforce_quota() == []
+
+def test_touch_and_protect_keep_units():
+    """Units used within in_use_seconds, here by another process, and protected paths are not evicted."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, paths = _setup(tmp)
+        other = StorageManager(manager.config_manager, access_log_path=manager.access_log_path,
+                               storage_path=manager.storage_path)
+        other.touch(paths['unconfigured'])
+        evicted = manager.enforce_quota(protect=[paths['previous']])
+        assert _evicted(evicted) == [paths['previous_report'], paths['cached_result']]
+        assert os.path.exists(paths['previous']) and os.path.exists(paths['unconfigured'])
+        assert manager.total_usage() > manager.quota_bytes
+
+        # Once it is no longer in use, the touched unit can go
+        manager.in_use_seconds = 0
+        assert _evicted(manager.enforce_quota(protect=[paths['previous']])) == [os.path.dirname(paths['unconfigured'])]
+
+        # Evicted units are dropped from the access log
+        with open(manager.access_log_path) as f:
+            assert json.load(f) == {}
+
+def test_eviction_releases_blobs():
+    """Evicting a quarter removes the stored copies no other download links to."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, paths = _setup(tmp)
+        shared_sha256 = manager.blob_store.digest(paths['unconfigured'])
+        previous_sha256 = manager.blob_store.digest(paths['previous'])
+        shared = os.path.join(manager.storage_path, 'MSFT', '2024_Q1', 'release.pdf')
+        manager.blob_store.link(shared_sha256, shared)
+        manager.touch(shared)
+
+        # The old MSFT quarter shares its document with a newer quarter, so evicting it frees nothing
+        units = {unit['path']: unit for unit in manager.scan()}
+        assert units[os.path.dirname(paths['unconfigured'])]['size'] == 0
+
+        evicted = manager.enforce_quota()
+        assert _evicted(evicted) == [
+            os.path.dirname(paths['unconfigured']), os.path.dirname(paths['previous']),
+            paths['previous_report'], paths['cached_result']
+        ]
+        assert os.path.exists(manager.blob_store.blob_path(shared_sha256))
+        assert not os.path.exists(manager.blob_store.blob_path(previous_sha256))
+        assert manager.blob_store.entry(paths['previous']) is None
+        assert manager.total_usage() <= manager.quota_bytes
+
+def _touch_many(manager, prefix, count):
+    for i in range(count):
+        manager.touch(os.path.join(manager.results_dir, f"{prefix}_{i}.md"))
+
+def test_access_log_shared_between_processes():
+    """Concurrent touches from several processes are all kept in the access log."""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, _ = _setup(tmp)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_touch_many, args=(manager, f"p{n}", 20)) for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(manager.access_log_path) as f:
+            assert len(json.load(f)) == 80
+
+if __name__ == "__main__":
+    test_least_recently_used_evicted_first()
+    test_touch_and_protect_keep_units()
+    test_eviction_releases_blobs()
+    test_access_log_shared_between_processes()
+    print("All storage manager tests passed")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for local text extraction and its cache.
+Run this with: python test_text_extraction.py
+"""
+
+import os
+import tempfile
+
+from text_extraction import TextExtractor, extract_text, text_cache_path, PAGE_SEPARATOR
+
+def write_pdf(path, page_texts):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    content = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+def test_extract_formats():
+    """PDF pages are joined with form feeds, HTML is converted to text and plain text is read as is."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = write_pdf(os.path.join(tmp, 'release.pdf'), ['Revenue grew', 'Cloud grew'])
+        assert extract_text(pdf).split(PAGE_SEPARATOR) == ['Revenue grew', 'Cloud grew']
+
+        html = _write_text(os.path.join(tmp, 'release.html'), '<html><h1>Results</h1><p>Cloud grew</p></html>')
+        text = extract_text(html)
+        assert '# Results' in text and 'Cloud grew' in text and '<p>' not in text
+
+        plain = _write_text(os.path.join(tmp, 'transcript.txt'), 'Operator: welcome')
+        assert extract_text(plain) == 'Operator: welcome'
+
+def test_extract_many_caches_by_content():
+    """Each document version is extracted once, in parallel when several are missing, and reused afterwards."""
+    with tempfile.TemporaryDirectory() as tmp:
+        extractor = TextExtractor(max_workers=2, min_chars=5)
+        os.makedirs(os.path.join(tmp, 'AAPL'))
+        first = write_pdf(os.path.join(tmp, 'AAPL', 'release.pdf'), ['Services revenue grew'])
+        second = _write_text(os.path.join(tmp, 'transcript.txt'), 'Operator: welcome to the call')
+
+        results = extractor.extract_many([first, second, first])
+        assert results == {first: text_cache_path(first), second: text_cache_path(second)}
+        assert os.path.dirname(results[first]) == os.path.join(tmp, 'AAPL', '.text_cache')
+
+        # Cached text is used as is
+        with open(results[first], 'w', encoding='utf-8') as f:
+            f.write('from the cache')
+        assert extractor.extract_many([first]) == {first: text_cache_path(first)}
+        with open(results[first], encoding='utf-8') as f:
+            assert f.read() == 'from the cache'
+
+        # Changed content is a new version and extracted again
+        _write_text(second, 'Operator: the call has ended')
+        assert extractor.extract_many([second])[second] != results[second]
+
+def test_unusable_extractions_send_the_original():
+    """Too little text (e.g. a scanned PDF) or a file that cannot be parsed yields None."""
+    with tempfile.TemporaryDirectory() as tmp:
+        extractor = TextExtractor(max_workers=1, min_chars=50)
+        short = write_pdf(os.path.join(tmp, 'scan.pdf'), ['', 'Page 2'])
+        broken = _write_text(os.path.join(tmp, 'broken.pdf'), 'not a pdf')
+
+        assert extractor.extract_many([short]) == {short: None}
+        assert extractor.extract_many([broken]) == {broken: None}
+        assert not os.path.exists(text_cache_path(broken))
+
+        # The minimum can be lowered per call, reusing the cached text
+        assert extractor.extract_many([short], min_chars=1) == {short: text_cache_path(short)}
+
+if __name__ == "__main__":
+    test_extract_formats()
+    test_extract_many_caches_by_content()
+    test_unusable_extractions_send_the_original()
+    print("All text extraction tests passed")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for pre-flight token counting and input budget enforcement.
+Run this with: python test_token_budget.py
+"""
+
+import os
+import tempfile
+from types import SimpleNamespace
+
+from google.genai import types
+
+from token_budget import TokenBudget, TokenBudgetExceeded
+
+class FakeModels:
+    """Counts one token per byte of inline data and per character of text."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def count_tokens(self, model, contents):
+        self.calls += 1
+        tokens = sum(len(part.inline_data.data) if part.inline_data else len(part.text) for part in contents.parts)
+        return SimpleNamespace(total_tokens=tokens)
+
+def _build_parts(resolved_documents):
+    parts = []
+    for _, file_path, _ in resolved_documents:
+        with open(file_path, 'rb') as f:
+            parts.append(types.Part(inline_data=types.Blob(mime_type='application/pdf', data=f.read())))
+    return parts
+
+def _budget(tmp, models, max_input_tokens, policy='drop'):
+    return TokenBudget(SimpleNamespace(models=models), max_input_tokens=max_input_tokens, policy=policy, enabled=True,
+                       counts_path=os.path.join(tmp, 'token_counts.json'))
+
+def _resolved(tmp):
+    documents = []
+    for doc_key, size in [('amzn_earnings_release', 300), ('amzn_call_transcript', 500), ('msft_call_transcript', 400)]:
+        path = os.path.join(tmp, f"{doc_key}.pdf")
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        documents.append((doc_key, path, doc_key.replace('_', ' ')))
+    return documents
+
+def test_counts_are_memoized():
+    """Documents are counted once per content; a prompt far from the budget is estimated locally."""
+    with tempfile.TemporaryDirectory() as tmp:
+        models = FakeModels()
+        budget = _budget(tmp, models, 10000)
+        resolved = _resolved(tmp)
+
+        count = budget.count('model', resolved, 'prompt', _build_parts)
+        assert count['prompt_estimated']
+        assert count['total_tokens'] == 300 + 500 + 400 + count['prompt_tokens']
+        assert models.calls == 3
+
+        budget.count('model', resolved, 'prompt', _build_parts)
+        assert models.calls == 3
+
+        # Counts are kept on disk for later runs and other processes
+        _budget(tmp, models, 10000).count('model', resolved, 'prompt', _build_parts)
+        assert models.calls == 3
+
+def test_prompt_counted_exactly_near_budget():
+    """Near the budget the prompt is counted with the API, once per prompt text."""
+    with tempfile.TemporaryDirectory() as tmp:
+        models = FakeModels()
+        budget = _budget(tmp, models, 1250)
+        resolved = _resolved(tmp)
+
+        count = budget.count('model', resolved, 'prompt', _build_parts)
+        assert not count['prompt_estimated']
+        assert count['prompt_tokens'] == len('prompt')
+        assert models.calls == 4
+
+        budget.count('model', resolved, 'prompt', _build_parts)
+        assert models.calls == 4
+        budget.count('model', resolved, 'other prompt', _build_parts)
+        assert models.calls == 5
+
+def test_drop_lowest_priority_documents():
+    """Transcripts are dropped before releases, the largest first."""
+    with tempfile.TemporaryDirectory() as tmp:
+        budget = _budget(tmp, FakeModels(), 800)
+        kept, count = budget.fit('model', _resolved(tmp), 'prompt', _build_parts)
+
+        assert [doc_key for doc_key, _, _ in kept] == ['amzn_earnings_release', 'msft_call_transcript']
+        assert count['dropped_documents'] == ['amzn call transcript']
+        assert count['total_tokens'] == 300 + 400 + len('prompt')
+
+def test_fail_policy():
+    """The fail policy rejects over-budget requests instead of trimming them."""
+    with tempfile.TemporaryDirectory() as tmp:
+        budget = _budget(tmp, FakeModels(), 800, policy='fail')
+        try:
+            budget.fit('model', _resolved(tmp), 'prompt', _build_parts)
+            assert False, "expected TokenBudgetExceeded"
+        except TokenBudgetExceeded:
+            pass
+
+if __name__ == "__main__":
+    test_counts_are_memoized()
+    test_prompt_counted_exactly_near_budget()
+    test_drop_lowest_priority_documents()
+    test_fail_policy()
+    print("All token budget tests passed")
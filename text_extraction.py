@@ -0,0 +1,139 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+from file_hashing import file_sha256
+
+# Extracted text is cached in this subdirectory of each download directory
+TEXT_CACHE_DIRNAME = '.text_cache'
+
+# Pages of extracted PDF text are separated by form feeds, as pdftotext does
+PAGE_SEPARATOR = '\f'
+
+def extract_text(file_path):
+    """
+    Extract plain text from a document.
+
+    Runs in worker processes, so it must stay a module-level function.
+
+    Args:
+        file_path (str): Path to a PDF, HTML or text document
+
+    Returns:
+        str: Extracted text; PDF pages are separated by PAGE_SEPARATOR
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == '.pdf':
+        from PyPDF2 import PdfReader
+        reader = PdfReader(file_path)
+        return PAGE_SEPARATOR.join((page.extract_text() or '').strip() for page in reader.pages)
+
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+
+    if ext in ('.html', '.htm'):
+        import html2text
+        converter = html2text.HTML2Text()
+        converter.ignore_images = True
+        converter.body_width = 0
+        return converter.handle(content)
+
+    return content
+
+def text_cache_path(file_path):
+    """Return the cache location of the extracted text for a document."""
+    return os.path.join(os.path.dirname(file_path), TEXT_CACHE_DIRNAME, f"{file_sha256(file_path)}.txt")
+
+class TextExtractor:
+    """
+    Extracts document text locally so it can be sent as text instead of PDF pages.
+
+    Extraction is CPU-bound, so cache misses are parsed across a process pool.
+    Results are stored next to the downloads as <download dir>/.text_cache/<sha256>.txt,
+    so each document version is parsed once.
+    """
+
+    def __init__(self, max_workers=None, min_chars=None):
+        self.max_workers = max_workers or config.TEXT_EXTRACTION_WORKERS
+        self.min_chars = min_chars if min_chars is not None else config.TEXT_EXTRACTION_MIN_CHARS
+
+    def extract_many(self, file_paths, min_chars=None):
+        """
+        Extract text for several documents, using the cache where possible.
+
+        Args:
+            file_paths (list): Paths of the documents
+            min_chars (int): Override the minimum amount of text for a usable extraction
+
+        Returns:
+            dict: Maps each file path to the path of its extracted text file, or
+                  None if extraction failed or found too little text (e.g. a
+                  scanned PDF), in which case the original should be sent
+        """
+        min_chars = self.min_chars if min_chars is None else min_chars
+        results = {}
+        pending = []
+        for file_path in dict.fromkeys(file_paths):
+            cache_path = text_cache_path(file_path)
+            if os.path.exists(cache_path):
+                results[file_path] = self._usable(cache_path, min_chars)
+            else:
+                pending.append(file_path)
+
+        if not pending:
+            return results
+
+        if len(pending) == 1:
+            extracted = [_extract_safely(pending[0])]
+        else:
+            try:
+                # Spawn rather than fork: callers may be multi-threaded web workers
+                with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending)),
+                                         mp_context=multiprocessing.get_context('spawn')) as executor:
+                    extracted = list(executor.map(_extract_safely, pending))
+            except (BrokenProcessPool, OSError) as e:
+                logging.warning(f"Text extraction pool failed, extracting in this process: {str(e)}")
+                extracted = [_extract_safely(file_path) for file_path in pending]
+
+        for file_path, text in zip(pending, extracted):
+            if text is None:
+                results[file_path] = None
+                continue
+            cache_path = text_cache_path(file_path)
+            logging.info(f"Extracted {len(text)} characters from {os.path.basename(file_path)}")
+            results[file_path] = self._usable(cache_path, min_chars) if self._write(cache_path, text) else None
+
+        return results
+
+    def _usable(self, cache_path, min_chars):
+        """Return cache_path if it holds enough text to replace the original document."""
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if len(text.replace(PAGE_SEPARATOR, '').strip()) < min_chars:
+            return None
+        return cache_path
+
+    def _write(self, cache_path, text):
+        """Atomically write extracted text to the cache, returning False on failure."""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, cache_path)
+            return True
+        except OSError as e:
+            logging.warning(f"Could not cache extracted text at {cache_path}: {e}")
+            return False
+
+def _extract_safely(file_path):
+    """extract_text that logs and returns None on failure, for use in worker processes."""
+    try:
+        return extract_text(file_path)
+    except Exception as e:
+        logging.warning(f"Could not extract text from {file_path}: {str(e)}")
+        return None
@@ -0,0 +1,225 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from google.genai import types
+
+import config
+from file_hashing import file_sha256
+
+# Conservative characters per token for estimating prompt text locally
+ESTIMATED_CHARS_PER_TOKEN = 3
+
+# Requests estimated within this fraction of the budget get an exact prompt count
+EXACT_COUNT_MARGIN = 0.1
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a request's input does not fit the configured token budget."""
+
+def document_priority(doc_key):
+    """
+    Rank a document for budget trimming; higher ranks are dropped first.
+
+    Earnings releases carry the reported numbers and are kept longest,
+    transcripts go next, anything else goes first.
+    """
+    if 'earnings_release' in doc_key:
+        return 0
+    if 'transcript' in doc_key:
+        return 1
+    return 2
+
+def estimate_cost(input_tokens, output_tokens):
+    """
+    Estimate the USD cost of a request from configured per-million-token prices.
+
+    Args:
+        input_tokens (int): Prompt tokens
+        output_tokens (int): Generated tokens
+
+    Returns:
+        float: Estimated cost in USD
+    """
+    return (input_tokens * config.INPUT_TOKEN_PRICE_PER_MILLION +
+            output_tokens * config.OUTPUT_TOKEN_PRICE_PER_MILLION) / 1_000_000
+
+class TokenBudget:
+    """
+    Pre-flight token counting and input budget enforcement.
+
+    Each document is counted once per model and file content: counts are
+    stored on disk keyed by SHA-256 and shared by every process, so repeated
+    runs over the same downloads make no count_tokens calls. The prompt is
+    estimated locally and only counted exactly (once per prompt text and
+    process) when the request is near the budget.
+    Count calls go through the shared rate limiter. Requests over budget
+    either fail fast or drop their lowest-priority documents until they fit.
+    """
+
+    def __init__(self, client, max_input_tokens=None, policy=None, enabled=None, rate_limiter=None, counts_path=None):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.counts_path = counts_path or config.TOKEN_COUNT_CACHE_PATH
+        self.max_input_tokens = max_input_tokens or config.INPUT_TOKEN_BUDGET
+        self.policy = policy or config.INPUT_TOKEN_BUDGET_POLICY
+        self.enabled = config.TOKEN_COUNTING_ENABLED if enabled is None else enabled
+
+        if self.policy not in ('drop', 'fail'):
+            raise ValueError(f"Unknown token budget policy: {self.policy}")
+
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._document_counts = self._load()
+
+    def _load(self):
+        """Load the stored document counts from disk."""
+        try:
+            with open(self.counts_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read token counts {self.counts_path}: {e}")
+            return {}
+
+    def _store(self, key, tokens):
+        """Add a document count to the file, keeping counts stored by other processes."""
+        counts = self._load()
+        counts[key] = tokens
+        self._document_counts.update(counts)
+        try:
+            os.makedirs(os.path.dirname(self.counts_path) or '.', exist_ok=True)
+            tmp_path = f"{self.counts_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(counts, f, indent=2)
+            os.replace(tmp_path, self.counts_path)
+        except OSError as e:
+            logging.warning(f"Could not save token counts {self.counts_path}: {e}")
+
+    def _count(self, model, parts):
+        def count_tokens():
+            return self.client.models.count_tokens(model=model, contents=types.Content(role='user', parts=parts))
+
+        response = self.rate_limiter.call(count_tokens) if self.rate_limiter else count_tokens()
+        return response.total_tokens or 0
+
+    def _count_prompt(self, model, prompt, document_tokens, exact=False):
+        """
+        Count the prompt's tokens, estimating them locally unless the request is near the budget.
+
+        Returns:
+            tuple: (tokens, True if the count is a local estimate)
+        """
+        memo_key = (model, 'prompt', hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+        with self._lock:
+            tokens = self._counts.get(memo_key)
+        if tokens is not None:
+            return tokens, False
+
+        estimate = -(-len(prompt) // ESTIMATED_CHARS_PER_TOKEN)
+        if not exact and document_tokens + estimate < self.max_input_tokens * (1 - EXACT_COUNT_MARGIN):
+            return estimate, True
+
+        tokens = self._count(model, [types.Part(text=prompt)])
+        with self._lock:
+            self._counts[memo_key] = tokens
+        return tokens, False
+
+    def count(self, model, resolved_documents, prompt, build_parts, exact=False):
+        """
+        Count the input tokens of a request, per document and for the prompt.
+
+        Args:
+            model (str): Gemini model id
+            resolved_documents (list): List of (doc_key, file_path, label) tuples
+            prompt (str): Rendered prompt text
+            build_parts (callable): Called with a list of resolved documents to build their parts
+            exact (bool): Count the prompt with the API even when far from the budget
+
+        Returns:
+            dict: 'documents' (list of dicts with doc_key, path, label and tokens),
+                  'prompt_tokens', 'prompt_estimated' and 'total_tokens'
+        """
+        documents = []
+        for doc_key, file_path, label in resolved_documents:
+            count_key = f"{model}|{label}|{file_sha256(file_path)}"
+            with self._lock:
+                tokens = self._document_counts.get(count_key)
+            if tokens is None:
+                # Another process may have counted the document in the meantime
+                tokens = self._load().get(count_key)
+            if tokens is None:
+                tokens = self._count(model, build_parts([(doc_key, file_path, label)]))
+            with self._lock:
+                if count_key not in self._document_counts:
+                    self._store(count_key, tokens)
+            documents.append({'doc_key': doc_key, 'path': file_path, 'label': label, 'tokens': tokens})
+
+        document_tokens = sum(doc['tokens'] for doc in documents)
+        prompt_tokens, prompt_estimated = self._count_prompt(model, prompt, document_tokens, exact)
+        return {
+            'documents': documents,
+            'prompt_tokens': prompt_tokens,
+            'prompt_estimated': prompt_estimated,
+            'total_tokens': prompt_tokens + document_tokens
+        }
+
+    def fit(self, model, resolved_documents, prompt, build_parts):
+        """
+        Count a request and trim it to the input budget.
+
+        Args:
+            Same as count
+
+        Returns:
+            tuple: (resolved_documents that fit, token count dict as returned by
+                   count for the kept documents plus 'dropped_documents'), or
+                   (resolved_documents, None) if counting is disabled or failed
+
+        Raises:
+            TokenBudgetExceeded: If the request is over budget and the policy is
+                                 'fail', or nothing fits even after dropping documents
+        """
+        if not self.enabled:
+            return resolved_documents, None
+
+        try:
+            token_count = self.count(model, resolved_documents, prompt, build_parts)
+        except Exception as e:
+            logging.warning(f"Could not count input tokens, skipping budget check: {str(e)}")
+            return resolved_documents, None
+
+        token_count['dropped_documents'] = []
+        logging.info(f"Request input is {token_count['total_tokens']} tokens "
+                     f"({len(resolved_documents)} documents, budget {self.max_input_tokens})")
+        if token_count['total_tokens'] <= self.max_input_tokens:
+            return resolved_documents, token_count
+
+        if self.policy == 'fail':
+            raise TokenBudgetExceeded(
+                f"Request input of {token_count['total_tokens']} tokens exceeds the budget of {self.max_input_tokens}"
+            )
+
+        # Drop the lowest-priority documents first, the largest among equals
+        kept = list(token_count['documents'])
+        total = token_count['total_tokens']
+        for doc in sorted(kept, key=lambda d: (document_priority(d['doc_key']), d['tokens']), reverse=True):
+            if total <= self.max_input_tokens or len(kept) == 1:
+                break
+            kept.remove(doc)
+            total -= doc['tokens']
+            token_count['dropped_documents'].append(doc['label'])
+            logging.warning(f"Dropping {doc['label']} ({doc['tokens']} tokens) to fit the input budget")
+
+        if total > self.max_input_tokens:
+            raise TokenBudgetExceeded(
+                f"Request input of {total} tokens exceeds the budget of {self.max_input_tokens} "
+                f"even after dropping {len(token_count['dropped_documents'])} documents"
+            )
+
+        kept_keys = {doc['doc_key'] for doc in kept}
+        token_count['documents'] = kept
+        token_count['total_tokens'] = total
+        return [entry for entry in resolved_documents if entry[0] in kept_keys], token_count